@@ -0,0 +1,61 @@
+from array import array
+from typing import Iterable, Iterator, NamedTuple
+
+# Polygon aggregate keys for each column
+FIELD_KEYS = {"open": "o", "close": "c", "high": "h", "low": "l", "volume": "v"}
+
+
+class Bar(NamedTuple):
+    open: float
+    close: float
+    high: float
+    low: float
+    volume: float
+    timestamp: int
+
+
+class BarColumns:
+    """
+    Columnar storage for OHLCV bars, one typed array per field and epoch-ms int64 timestamps.
+    Pages are appended column by column, so no per bar objects are kept around.
+    """
+
+    def __init__(self):
+        self.open = array("d")
+        self.close = array("d")
+        self.high = array("d")
+        self.low = array("d")
+        self.volume = array("d")
+        self.timestamp = array("q")
+
+    @classmethod
+    def from_results(cls, results: Iterable[dict]) -> "BarColumns":
+        columns = cls()
+        columns.extend_results(results)
+        return columns
+
+    def extend_results(self, results: Iterable[dict]):
+        results = results if isinstance(results, list) else list(results)
+        for name, key in FIELD_KEYS.items():
+            getattr(self, name).extend([float(result[key]) for result in results])
+        self.timestamp.extend([int(result["t"]) for result in results])
+
+    def extend(self, other: "BarColumns"):
+        for name in self.column_names():
+            getattr(self, name).extend(getattr(other, name))
+
+    @staticmethod
+    def column_names() -> tuple[str, ...]:
+        return (*FIELD_KEYS, "timestamp")
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __iter__(self) -> Iterator[Bar]:
+        return map(Bar._make, zip(self.open, self.close, self.high, self.low, self.volume, self.timestamp))
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).itemsize * len(self) for name in self.column_names())
@@ -0,0 +1,66 @@
+"""
+Micro benchmark of the line protocol encoding of OHLCV bars, bulk encoder against one Point per bar.
+Run it from ingestion_lambda: python benchmarks/bench_line_protocol.py --bars 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bars import BarColumns  # noqa: E402
+from line_protocol import encode_bars, encode_bars_with_points  # noqa: E402
+
+
+def make_bars(count: int, seed: int = 0) -> BarColumns:
+    """Minute bars with realistic prices, whole number volumes and the odd whole number price."""
+    rng = random.Random(seed)
+    start = 1_672_531_200_000
+    results = []
+    price = 150.0
+    for i in range(count):
+        price = max(1.0, price + rng.gauss(0, 0.5))
+        results.append(
+            {
+                "o": round(price, 2) if i % 10 else float(int(price)),
+                "c": round(price + rng.gauss(0, 0.2), 4),
+                "h": round(price + abs(rng.gauss(0, 0.3)), 4),
+                "l": round(price - abs(rng.gauss(0, 0.3)), 4),
+                "v": float(rng.randint(100, 5_000_000)),
+                "t": start + i * 60_000,
+            }
+        )
+    return BarColumns.from_results(results)
+
+
+def measure(encode, bars: BarColumns, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode()
+        best = min(best, time.perf_counter() - started)
+    return len(bars) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the bulk line protocol encoder against Point")
+    parser.add_argument("--bars", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ticker", default="AAPL")
+    args = parser.parse_args()
+
+    bars = make_bars(args.bars)
+    reference = [line.encode() for line in encode_bars_with_points(args.ticker, bars)]
+    if encode_bars(args.ticker, bars) != reference:
+        sys.exit("Bulk encoder output differs from the Point encoding")
+
+    point_rate = measure(
+        lambda: [line.encode() for line in encode_bars_with_points(args.ticker, bars)], bars, args.repeat
+    )
+    bulk_rate = measure(lambda: encode_bars(args.ticker, bars), bars, args.repeat)
+    print(f"bars: {len(bars)}, output: {sum(map(len, reference))} bytes, byte identical: yes")
+    print(f"Point per bar: {point_rate:,.0f} bars/s")
+    print(f"encode_bars:   {bulk_rate:,.0f} bars/s ({bulk_rate / point_rate:.1f}x)")
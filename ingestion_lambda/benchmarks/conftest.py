@@ -0,0 +1,186 @@
+"""
+Fixtures of the ingestion benchmark suite, the stubs are shared with the unit tests in ../conftest.py. Run it from
+ingestion_lambda with:
+    python -m pytest benchmarks -q
+Results are printed at the end of the run, --ingestion-benchmark-json saves them and
+--ingestion-benchmark-compare fails every case that got slower than a saved run by more than the tolerance.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import pytest
+
+import lambda_function
+
+RESULTS_KEY = pytest.StashKey[list]()
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    seconds: float
+    pages: int
+    bars: int
+    bytes_written: int
+    wire_bytes: int
+    peak_rss_mb: float
+    rss_growth_mb: float
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds
+
+    @property
+    def bars_per_second(self) -> float:
+        return self.bars / self.seconds
+
+
+def get_rss_mb() -> float:
+    # The second field of statm is the resident set size in pages, linux only like the rest of the deployment
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class RssSampler:
+    """
+    Samples the resident set size from a background thread while a case runs. Unlike ru_maxrss, which is the peak of
+    the whole process lifetime, the peak is then the case's own.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.start_mb = self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self) -> "RssSampler":
+        self.start_mb = self.peak_mb = get_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, get_rss_mb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, get_rss_mb())
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("ingestion benchmarks")
+    group.addoption("--ingestion-benchmark-rounds", type=int, default=3, help="Rounds per case, the best is kept")
+    group.addoption("--ingestion-benchmark-json", help="Saves the results to this file")
+    group.addoption("--ingestion-benchmark-compare", help="Results file of a previous run to compare against")
+    group.addoption(
+        "--ingestion-benchmark-tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction of bars/s a case may lose against the compared run before failing",
+    )
+    group.addoption(
+        "--startup-import-budget-ms",
+        type=float,
+        default=300,
+        help="Longest import time of the ingestion entry point, the influx client excluded",
+    )
+
+
+def pytest_configure(config):
+    config.stash[RESULTS_KEY] = []
+
+
+@pytest.fixture(scope="session", autouse=True)
+def quiet_ingestion_logs():
+    # Per page info logs would be measured along with the pipeline
+    logging.getLogger(lambda_function.__file__).setLevel(logging.WARNING)
+
+
+@pytest.fixture
+def ingestion_benchmark(request, polygon_stub, influx_stub) -> Callable:
+    """
+    Runs the given function for every round against freshly reset stubs and records the fastest round.
+    Pages and bars come from the Polygon stub unless the case passes its own, bytes from the influx stub.
+    """
+    config = request.config
+
+    def run(function: Callable, pages: int | None = None, bars: int | None = None) -> BenchmarkResult:
+        best = None
+        with RssSampler() as rss:
+            for _ in range(config.getoption("--ingestion-benchmark-rounds")):
+                polygon_stub.reset()
+                influx_stub.reset()
+                started = time.perf_counter()
+                function()
+                seconds = time.perf_counter() - started
+                if best is None or seconds < best[0]:
+                    best = (seconds, polygon_stub.stats(), influx_stub.stats())
+
+        seconds, polygon_stats, influx_stats = best
+        result = BenchmarkResult(
+            name=request.node.name,
+            seconds=seconds,
+            pages=polygon_stats["pages"] if pages is None else pages,
+            bars=polygon_stats["bars"] if bars is None else bars,
+            bytes_written=influx_stats["bytes"],
+            wire_bytes=influx_stats["wire_bytes"],
+            peak_rss_mb=rss.peak_mb,
+            rss_growth_mb=rss.peak_mb - rss.start_mb,
+        )
+        config.stash[RESULTS_KEY].append(result)
+        check_regression(config, result)
+        return result
+
+    return run
+
+
+def check_regression(config, result: BenchmarkResult):
+    if not (path := config.getoption("--ingestion-benchmark-compare")):
+        return
+    with open(path) as f:
+        previous = {entry["name"]: entry for entry in json.load(f)}
+    if not (baseline := previous.get(result.name)) or not baseline["bars_per_second"]:
+        return
+    tolerance = config.getoption("--ingestion-benchmark-tolerance")
+    if result.bars_per_second < baseline["bars_per_second"] * (1 - tolerance):
+        pytest.fail(
+            f"{result.name} regressed to {result.bars_per_second:,.0f} bars/s "
+            f"from {baseline['bars_per_second']:,.0f} bars/s"
+        )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[RESULTS_KEY]
+    if not results:
+        return
+    terminalreporter.section("ingestion benchmarks")
+    terminalreporter.write_line(
+        f"{'case':<48}{'seconds':>9}{'pages/s':>10}{'bars/s':>12}{'MB written':>12}{'MB wire':>9}"
+        f"{'peak RSS MB':>13}{'RSS growth MB':>15}"
+    )
+    for result in results:
+        terminalreporter.write_line(
+            f"{result.name:<48}{result.seconds:>9.3f}{result.pages_per_second:>10,.1f}{result.bars_per_second:>12,.0f}"
+            f"{result.bytes_written / 2**20:>12.2f}{result.wire_bytes / 2**20:>9.2f}{result.peak_rss_mb:>13.1f}"
+            f"{result.rss_growth_mb:>15.1f}"
+        )
+
+    if path := config.getoption("--ingestion-benchmark-json"):
+        with open(path, "w") as f:
+            json.dump(
+                [
+                    asdict(result)
+                    | {"pages_per_second": result.pages_per_second, "bars_per_second": result.bars_per_second}
+                    for result in results
+                ],
+                f,
+                indent=2,
+            )
+        terminalreporter.write_line(f"Saved benchmark results to {path}")
@@ -0,0 +1,186 @@
+"""
+Local stand-ins for the Polygon aggregates API and the influx write endpoint, used by the benchmark suite and the
+unit tests. Each one runs in its own process, so serving requests does not compete with the measured code for the GIL
+or show up in its memory. Both expose their counters at GET /__stats and reset them at POST /__reset, which also sets
+the page size to its page_size parameter, or back to the one the stub started with.
+"""
+
+import datetime
+import gzip
+import json
+import multiprocessing
+import re
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DAY_MS = 86_400_000
+TIMESPAN_MS = {"minute": 60_000, "hour": 3_600_000, "day": DAY_MS, "week": 7 * DAY_MS}
+# Polygon returns at most 5000 bars per page unless a larger limit is asked for
+DEFAULT_PAGE_SIZE = 5000
+AGGREGATES_PATH = re.compile(
+    r"/v2/aggs/ticker/(?P<ticker>[^/]+)/range/(?P<multiplier>\d+)/(?P<timespan>\w+)/(?P<from>[\d-]+)/(?P<to>[\d-]+)"
+)
+
+
+def get_day_ms(date: str) -> int:
+    return int(datetime.datetime.fromisoformat(date).replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def make_bar(timestamp: int, step: int) -> dict:
+    """Deterministic bar, prices wander with the timestamp and a few are whole numbers like real data."""
+    i = timestamp // step
+    price = 100 + (i * 7919 % 10_000) / 100
+    return {
+        "v": float(1000 + i * 104_729 % 5_000_000),
+        "vw": round(price + 0.013, 4),
+        "o": price if i % 10 else float(int(price)),
+        "c": round(price + (i % 13 - 6) / 100, 4),
+        "h": round(price + (i % 7) / 50, 4),
+        "l": round(price - (i % 5) / 50, 4),
+        "t": timestamp,
+        "n": 1 + i % 500,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def send_body(self, status: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_admin(self) -> bool:
+        if self.path == "/__stats":
+            with self.server.lock:
+                self.send_body(200, json.dumps(self.server.stats).encode())
+            return True
+        url = urlparse(self.path)
+        if url.path == "/__reset":
+            with self.server.lock:
+                self.server.stats = dict.fromkeys(self.server.stats, 0)
+                self.server.page_size = int(parse_qs(url.query).get("page_size", [self.server.initial_page_size])[0])
+            self.send_body(204)
+            return True
+        return False
+
+    def do_POST(self):
+        if not self.handle_admin():
+            self.send_body(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class PolygonHandler(StubHandler):
+    """Serves synthetic aggregates for any ticker and range, paginated through next_url like Polygon."""
+
+    def do_GET(self):
+        if self.handle_admin():
+            return
+        url = urlparse(self.path)
+        if not (match := AGGREGATES_PATH.match(url.path)):
+            self.send_body(404)
+            return
+
+        query = parse_qs(url.query)
+        step = TIMESPAN_MS[match["timespan"]] * int(match["multiplier"])
+        end = get_day_ms(match["to"]) + DAY_MS
+        start = int(query.get("cursor", [get_day_ms(match["from"])])[0])
+        page_size = int(query.get("limit", [self.server.page_size])[0])
+        page_end = min(end, start + page_size * step)
+        results = [make_bar(timestamp, step) for timestamp in range(start, page_end, step)]
+        body = {
+            "ticker": match["ticker"],
+            "queryCount": len(results),
+            "resultsCount": len(results),
+            "adjusted": True,
+            "results": results,
+            "status": "OK",
+            "request_id": "stub",
+            "count": len(results),
+        }
+        if page_end < end:
+            body["next_url"] = f"http://{self.headers['Host']}{url.path}?cursor={page_end}"
+
+        with self.server.lock:
+            self.server.stats["pages"] += 1
+            self.server.stats["bars"] += len(results)
+        self.send_body(200, json.dumps(body).encode())
+
+
+class InfluxHandler(StubHandler):
+    """Accepts line protocol writes and counts what arrived, gzip encoded bodies included."""
+
+    def do_GET(self):
+        if not self.handle_admin():
+            self.send_body(404)
+
+    def do_POST(self):
+        if self.handle_admin():
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        wire_bytes = len(body)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+            self.server.stats["wire_bytes"] += wire_bytes
+            self.server.stats["bytes"] += len(body)
+            self.server.stats["points"] += body.count(b"\n") + 1 if body else 0
+        self.send_body(204)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler: type[StubHandler], stats: dict, page_size: int = DEFAULT_PAGE_SIZE):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.stats = stats
+        self.page_size = self.initial_page_size = page_size
+        self.lock = threading.Lock()
+
+
+STUBS = {
+    "polygon": (PolygonHandler, {"pages": 0, "bars": 0}),
+    "influx": (InfluxHandler, {"requests": 0, "wire_bytes": 0, "bytes": 0, "points": 0}),
+}
+
+
+def serve(kind: str, ports, page_size: int):
+    handler, stats = STUBS[kind]
+    server = StubServer(handler, dict(stats), page_size=page_size)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+class StubProcess:
+    """Runs a stub server in a child process, usable as a context manager."""
+
+    def __init__(self, kind: str, page_size: int = DEFAULT_PAGE_SIZE):
+        context = multiprocessing.get_context("spawn")
+        self._ports = context.Queue()
+        self._process = context.Process(target=serve, args=(kind, self._ports, page_size), daemon=True)
+        self.url = ""
+
+    def __enter__(self) -> "StubProcess":
+        self._process.start()
+        self.url = f"http://127.0.0.1:{self._ports.get(timeout=30)}"
+        return self
+
+    def __exit__(self, *exc_info):
+        self._process.terminate()
+        self._process.join()
+
+    def stats(self) -> dict:
+        with urllib.request.urlopen(f"{self.url}/__stats") as response:
+            return json.loads(response.read())
+
+    def reset(self, page_size: int | None = None):
+        query = f"?page_size={page_size}" if page_size else ""
+        urllib.request.urlopen(urllib.request.Request(f"{self.url}/__reset{query}", method="POST")).close()
@@ -0,0 +1,63 @@
+import datetime
+import pytest
+
+from lambda_function import AggType, create_influx_client, get_stock_data, lambda_handler, write_data_to_influx
+
+FROM_DATE = datetime.date(2023, 1, 2)
+# Timespan and window length of every case, from a week of minute bars to ten years of daily ones
+WINDOWS = [(AggType.MINUTE, 7), (AggType.MINUTE, 30), (AggType.HOUR, 365), (AggType.DAY, 3650)]
+WINDOW_IDS = [f"{timespan.value}-{days}d" for timespan, days in WINDOWS]
+
+
+def get_to_date(days: int) -> datetime.date:
+    return FROM_DATE + datetime.timedelta(days=days - 1)
+
+
+@pytest.mark.parametrize("timespan,days", WINDOWS, ids=WINDOW_IDS)
+def test_get_stock_data(ingestion_benchmark, timespan, days):
+    result = ingestion_benchmark(lambda: get_stock_data("BNCH", timespan.value, 1, FROM_DATE, get_to_date(days)))
+    assert result.bars > 0
+
+
+@pytest.mark.parametrize("timespan,days", WINDOWS, ids=WINDOW_IDS)
+def test_get_stock_data_cached(ingestion_benchmark, polygon_stub, page_cache, timespan, days):
+    # Closed ranges are served from the cache once fetched, re-runs cost no Polygon requests
+    data = get_stock_data("BNCH", timespan.value, 1, FROM_DATE, get_to_date(days))
+    pages = page_cache.stats.writes
+
+    result = ingestion_benchmark(
+        lambda: get_stock_data("BNCH", timespan.value, 1, FROM_DATE, get_to_date(days)),
+        pages=pages,
+        bars=len(data.results),
+    )
+    assert polygon_stub.stats()["pages"] == 0
+    assert result.bars == len(data.results)
+
+
+@pytest.mark.parametrize("timespan,days", WINDOWS, ids=WINDOW_IDS)
+def test_write_data_to_influx(ingestion_benchmark, influx_stub, timespan, days):
+    data = get_stock_data("BNCH", timespan.value, 1, FROM_DATE, get_to_date(days))
+    client = create_influx_client(influx_stub.url, "benchmark")
+
+    result = ingestion_benchmark(
+        lambda: write_data_to_influx(client, "benchmark", "benchmark", data), pages=0, bars=len(data.results)
+    )
+    assert influx_stub.stats()["points"] == len(data.results)
+    assert result.bytes_written > 0
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("timespan,days", WINDOWS[1:3], ids=WINDOW_IDS[1:3])
+def test_lambda_handler(ingestion_benchmark, influx_stub, timespan, days, concurrency):
+    event = {
+        "ticker": "BNCH",
+        "type": timespan.name,
+        "multiplier": 1,
+        "from_date": FROM_DATE.isoformat(),
+        "to_date": get_to_date(days).isoformat(),
+        "stocks_bucket": "benchmark",
+        "org": "benchmark",
+        "fetch_concurrency": concurrency,
+    }
+    result = ingestion_benchmark(lambda: lambda_handler(event))
+    assert influx_stub.stats()["points"] == result.bars
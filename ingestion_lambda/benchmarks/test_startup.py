@@ -0,0 +1,18 @@
+from startup import ENTRY_POINT_MODULES, HEAVY_MODULES, format_import_profile, get_total_ms, profile_imports
+
+LAZY_PACKAGES = {module.split(".")[0] for module in HEAVY_MODULES}
+
+
+def test_entry_point_does_not_import_heavy_modules():
+    timings = profile_imports(ENTRY_POINT_MODULES)
+    assert not LAZY_PACKAGES & {timing.package for timing in timings}
+
+
+def test_entry_point_import_budget(request):
+    budget_ms = request.config.getoption("--startup-import-budget-ms")
+    # Import times are noisy, the fastest of the rounds is compared to the budget
+    profiles = [
+        profile_imports(ENTRY_POINT_MODULES) for _ in range(request.config.getoption("--ingestion-benchmark-rounds"))
+    ]
+    fastest = min(profiles, key=get_total_ms)
+    assert get_total_ms(fastest) <= budget_ms, format_import_profile(fastest)
@@ -0,0 +1,46 @@
+"""
+Fixtures shared by the unit tests and the benchmark suite of the ingestion module. Run them from ingestion_lambda with:
+    python -m pytest tests -q
+    python -m pytest benchmarks -q
+"""
+
+import os
+import sys
+
+import pytest
+
+INGESTION_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, INGESTION_DIR)
+# The stub servers live with the benchmark suite
+sys.path.insert(0, os.path.join(INGESTION_DIR, "benchmarks"))
+
+# Read at import time by the ingestion modules, the stubs never rate limit
+os.environ.setdefault("POLYGON_REQUESTS_PER_MINUTE", "1000000")
+os.environ.setdefault("POLYGON_API_KEY", "test")
+os.environ.setdefault("INFLUX_TOKEN", "test")
+
+import lambda_function  # noqa: E402
+from page_cache import configure_page_cache  # noqa: E402
+from stubs import StubProcess  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def polygon_stub():
+    """Polygon stub with the real page size, pass a smaller page_size to reset() to test pagination."""
+    with StubProcess("polygon") as stub:
+        previous_url, lambda_function.POLYGON_BASE_URL = lambda_function.POLYGON_BASE_URL, stub.url
+        yield stub
+        lambda_function.POLYGON_BASE_URL = previous_url
+
+
+@pytest.fixture(scope="session")
+def influx_stub():
+    with StubProcess("influx") as stub:
+        os.environ["INFLUX_URL"] = stub.url
+        yield stub
+
+
+@pytest.fixture
+def page_cache(tmp_path):
+    yield configure_page_cache(str(tmp_path / "pages"))
+    configure_page_cache(None)
@@ -0,0 +1,242 @@
+from dataclasses import dataclass
+import asyncio
+import datetime
+import os
+from typing import AsyncIterator, Iterable, Iterator
+
+from lambda_function import (
+    AggType,
+    StockData,
+    create_influx_client,
+    fetch_page,
+    get_aggregates_url,
+    get_cached_page,
+    get_module_logger,
+    stream_data_to_influx,
+)
+from pipeline import DEFAULT_MAX_BUFFERED, prefetch
+from retry_policy import DEFAULT_MAX_RETRIES, ErrorKind, RetryPolicy, RetryStats
+
+logger = get_module_logger(__file__)
+
+# Requests per minute allowed by our Polygon plan
+POLYGON_REQUESTS_PER_MINUTE = float(os.environ.get("POLYGON_REQUESTS_PER_MINUTE", "5"))
+DEFAULT_CONCURRENCY = 4
+DEFAULT_WINDOW_DAYS = 7
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket shared by every request of a fetch engine run.
+    A 429 pauses the whole bucket, since the quota is per API key and not per request.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: float | None = None):
+        if requests_per_minute <= 0:
+            raise ValueError("Requests per minute must be positive")
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1.0, requests_per_minute)
+        self._tokens = self.capacity
+        self._updated_at: float | None = None
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if self._updated_at is not None:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        now = asyncio.get_running_loop().time()
+        self._refill(now)
+        self._tokens = 0
+        self._paused_until = max(self._paused_until, now + seconds)
+
+
+@dataclass(frozen=True)
+class FetchWindow:
+    ticker: str
+    type: str
+    multiplier: int
+    from_date: datetime.date
+    to_date: datetime.date
+
+
+def split_window(window: FetchWindow, days: int) -> list[FetchWindow]:
+    """Splits a window into consecutive sub windows of at most days days, Polygon date ranges are inclusive."""
+    windows = []
+    from_date = window.from_date
+    while from_date <= window.to_date:
+        to_date = min(window.to_date, from_date + datetime.timedelta(days=days - 1))
+        windows.append(FetchWindow(window.ticker, window.type, window.multiplier, from_date, to_date))
+        from_date = to_date + datetime.timedelta(days=1)
+    return windows
+
+
+async def fetch_window_pages(
+    window: FetchWindow,
+    bucket: TokenBucket,
+    retry_policy: RetryPolicy,
+    retry_stats: RetryStats | None = None,
+) -> AsyncIterator[StockData]:
+    next_url: str | None = get_aggregates_url(
+        window.ticker, window.type, window.multiplier, window.from_date, window.to_date
+    )
+    attempt = 0
+    while next_url:
+        # Cached pages do not spend rate limit quota
+        if (request_data := get_cached_page(next_url)) is None:
+            await bucket.acquire()
+        try:
+            if request_data is None:
+                request_data = await asyncio.to_thread(fetch_page, next_url)
+            if not request_data["resultsCount"]:
+                break
+            data = StockData.from_response(request_data)
+        except Exception as e:
+            kind, delay = retry_policy.next_delay(attempt, e, retry_stats)
+            attempt += 1
+            if kind == ErrorKind.RATE_LIMITED:
+                logger.warning(f"Rate limited by Polygon, pausing requests for {delay:.1f} seconds")
+                bucket.pause(delay)
+            else:
+                logger.error(
+                    f"Failed to make request to url {next_url} ({kind.value}), retrying in {delay:.1f} seconds"
+                )
+                logger.error(e)
+                await asyncio.sleep(delay)
+            continue
+
+        attempt = 0
+        next_url = data.next_url
+        yield data
+
+
+async def fetch_windows(
+    windows: Iterable[FetchWindow],
+    requests_per_minute: float = POLYGON_REQUESTS_PER_MINUTE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    max_buffered: int = DEFAULT_MAX_BUFFERED,
+    retry_stats: RetryStats | None = None,
+) -> AsyncIterator[tuple[FetchWindow, StockData]]:
+    """
+    Fetches the pages of many windows concurrently, at most concurrency windows at a time and never faster than
+    requests_per_minute. Pages are yielded as soon as they arrive, in no particular order between windows.
+    """
+    bucket = TokenBucket(requests_per_minute)
+    retry_policy = RetryPolicy(max_retries=max_retries)
+    pending: asyncio.Queue[FetchWindow] = asyncio.Queue()
+    for window in windows:
+        pending.put_nowait(window)
+    results: asyncio.Queue[tuple] = asyncio.Queue(maxsize=max_buffered)
+
+    async def work():
+        try:
+            while not pending.empty():
+                window = pending.get_nowait()
+                async for data in fetch_window_pages(window, bucket, retry_policy, retry_stats):
+                    await results.put(("page", window, data))
+            await results.put(("done",))
+        except Exception as e:
+            await results.put(("error", e))
+
+    workers = [asyncio.create_task(work()) for _ in range(max(1, min(concurrency, pending.qsize())))]
+    running = len(workers)
+    try:
+        while running:
+            item = await results.get()
+            if item[0] == "error":
+                raise item[1]
+            if item[0] == "done":
+                running -= 1
+                continue
+            yield item[1], item[2]
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def iter_windows_pages(windows: Iterable[FetchWindow], **kwargs) -> Iterator[StockData]:
+    """
+    Drives fetch_windows from synchronous code. The event loop only runs while the next page is requested,
+    so wrap it in pipeline.prefetch to keep fetching while the consumer is busy.
+    """
+    loop = asyncio.new_event_loop()
+    pages = fetch_windows(windows, **kwargs)
+    try:
+        while True:
+            try:
+                _, data = loop.run_until_complete(anext(pages))
+            except StopAsyncIteration:
+                break
+            yield data
+    finally:
+        loop.run_until_complete(pages.aclose())
+        loop.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrently ingest many tickers into influx")
+    parser.add_argument("--tickers", dest="tickers", type=str, required=True, help="Comma separated tickers")
+    parser.add_argument("--type", dest="type", type=str, default="HOUR", help="Aggregation type")
+    parser.add_argument("--multiplier", dest="multiplier", type=int, default=1, help="Multiplier for aggregation")
+    parser.add_argument("--from_date", dest="from_date", type=str, required=True, help="From date for data")
+    parser.add_argument("--to_date", dest="to_date", type=str, required=True, help="To date for data")
+    parser.add_argument("--stocks_bucket", dest="stocks_bucket", type=str, help="Bucket name for stocks data")
+    parser.add_argument("--org", dest="org", type=str, help="Organization name for stocks data")
+    parser.add_argument(
+        "--concurrency", dest="concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Windows fetched at once"
+    )
+    parser.add_argument(
+        "--window_days", dest="window_days", type=int, default=DEFAULT_WINDOW_DAYS, help="Days per fetched window"
+    )
+    parser.add_argument(
+        "--requests_per_minute",
+        dest="requests_per_minute",
+        type=float,
+        default=POLYGON_REQUESTS_PER_MINUTE,
+        help="Polygon requests per minute allowed by the plan",
+    )
+    args = parser.parse_args()
+
+    windows = [
+        sub_window
+        for ticker in args.tickers.split(",")
+        for sub_window in split_window(
+            FetchWindow(
+                ticker.strip(),
+                AggType[args.type].value,
+                args.multiplier,
+                datetime.date.fromisoformat(args.from_date),
+                datetime.date.fromisoformat(args.to_date),
+            ),
+            args.window_days,
+        )
+    ]
+    influx_client = create_influx_client(os.environ.get("INFLUX_URL", ""), os.environ.get("INFLUX_TOKEN"))
+    stream_data_to_influx(
+        influx_client,
+        args.stocks_bucket,
+        args.org,
+        prefetch(
+            iter_windows_pages(windows, requests_per_minute=args.requests_per_minute, concurrency=args.concurrency)
+        ),
+    )
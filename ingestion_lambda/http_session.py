@@ -0,0 +1,44 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = int(os.environ.get("INGESTION_HTTP_POOL_SIZE", "10"))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("INGESTION_HTTP_CONNECT_TIMEOUT", "5"))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("INGESTION_HTTP_READ_TIMEOUT", "60"))
+
+_session: "PooledSession | None" = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """Keep-alive session with a bounded connection pool per host and a default timeout on every request."""
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+    ):
+        super().__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        # requests decodes gzip responses transparently, this just makes sure we always ask for it
+        self.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, *args, **kwargs)
+
+
+def get_session() -> PooledSession:
+    """Returns the session shared by every HTTP client of the ingestion module."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = PooledSession()
+    return _session
+
@@ -0,0 +1,203 @@
+from dataclasses import dataclass
+import queue
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from influxdb_client.client.influxdb_client import InfluxDBClient
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_RETRY_INTERVAL = 1.0
+DEFAULT_MAX_RETRY_DELAY = 30.0
+DEFAULT_MAX_PENDING_BATCHES = 2
+RETRYABLE_STATUS_CODES = {429}
+
+
+@dataclass
+class WriteStats:
+    points_written: int = 0
+    bytes_sent: int = 0
+    requests: int = 0
+    retries: int = 0
+
+
+def is_retryable_write_error(error: Exception) -> bool:
+    # Imported on use, the influx client is loaded lazily to keep the cold start short
+    from influxdb_client.rest import ApiException
+
+    if isinstance(error, ApiException):
+        return error.status in RETRYABLE_STATUS_CODES or (error.status or 0) >= 500
+    return False
+
+
+def get_retry_after(error: Exception) -> float | None:
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchedInfluxWriter:
+    """
+    Buffers line protocol records and writes them to influx in batches from a background thread.
+    Use it as a context manager, or call close() to flush the remaining records and get the stats.
+    Records never wait longer than flush_interval, the background thread sends them while no write comes in.
+    """
+
+    def __init__(
+        self,
+        client: "InfluxDBClient",
+        bucket_name: str,
+        org_name: str,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_interval: float = DEFAULT_RETRY_INTERVAL,
+        max_pending_batches: int = DEFAULT_MAX_PENDING_BATCHES,
+    ):
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1")
+        self.bucket_name = bucket_name
+        self.org_name = org_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.stats = WriteStats()
+        from influxdb_client.client.write_api import SYNCHRONOUS
+
+        self._write_api = client.write_api(write_options=SYNCHRONOUS)
+        self._records: list[bytes] = []
+        self._last_flush = time.monotonic()
+        # Guards the records and the last flush time, shared with the background thread's timed flushes
+        self._lock = threading.Lock()
+        self._batches: queue.Queue[tuple[bytes, int] | None] = queue.Queue(maxsize=max_pending_batches)
+        self._error: Exception | None = None
+        self._failed_attempts = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, records: Iterable[bytes | str]):
+        self._raise_if_failed()
+        if self._closed:
+            raise RuntimeError("Cannot write to a closed influx writer")
+        encoded: list[bytes] = []
+        for record in records:
+            encoded.append(record.encode() if isinstance(record, str) else record)
+            if len(encoded) >= self.batch_size:
+                self._append(encoded)
+                encoded = []
+        self._append(encoded)
+        if (batch := self._take_due_records()) is not None:
+            # Only due here while the background thread is still busy with the previous batches
+            self._batches.put(batch)
+
+    def _append(self, records: list[bytes]):
+        batches = []
+        with self._lock:
+            self._records.extend(records)
+            while len(self._records) >= self.batch_size:
+                batches.append(self._records[: self.batch_size])
+                del self._records[: self.batch_size]
+            if batches:
+                self._last_flush = time.monotonic()
+        for batch in batches:
+            # Blocks when max_pending_batches are already waiting, which bounds the memory used by the writer
+            self._batches.put((b"\n".join(batch), len(batch)))
+
+    def flush(self):
+        self._raise_if_failed()
+        if (batch := self._take_records()) is not None:
+            self._batches.put(batch)
+
+    def _take_records(self) -> tuple[bytes, int] | None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._records:
+                return None
+            records, self._records = self._records, []
+        return b"\n".join(records), len(records)
+
+    def _take_due_records(self) -> tuple[bytes, int] | None:
+        with self._lock:
+            due = self._records and time.monotonic() - self._last_flush >= self.flush_interval
+        return self._take_records() if due else None
+
+    def _get_flush_timeout(self) -> float | None:
+        if self.flush_interval <= 0:
+            return None
+        with self._lock:
+            return max(0.0, self.flush_interval - (time.monotonic() - self._last_flush))
+
+    def close(self) -> WriteStats:
+        if not self._closed:
+            try:
+                self.flush()
+            finally:
+                self._closed = True
+                self._batches.put(None)
+                self._thread.join()
+        self._raise_if_failed()
+        return self.stats
+
+    def _raise_if_failed(self):
+        if self._error:
+            attempts = f"{self._failed_attempts} attempt{'s' if self._failed_attempts != 1 else ''}"
+            raise Exception(f"Failed to write batch to influx after {attempts}") from self._error
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._batches.get(timeout=self._get_flush_timeout())
+            except queue.Empty:
+                # No batch came in for flush_interval, send what is buffered instead of waiting for a full batch
+                if (batch := self._take_due_records()) is not None:
+                    self._send(batch)
+                continue
+            if batch is None:
+                break
+            self._send(batch)
+
+    def _send(self, batch: tuple[bytes, int]):
+        if self._error:
+            # Drain the queue so the producer never blocks after a failure
+            return
+        try:
+            self._write_batch(*batch)
+        except Exception as e:
+            self._error = e
+
+    def _write_batch(self, payload: bytes, points: int):
+        retries = 0
+        while True:
+            try:
+                self.stats.requests += 1
+                self._write_api.write(self.bucket_name, self.org_name, record=payload)
+                break
+            except Exception as e:
+                if retries >= self.max_retries or not is_retryable_write_error(e):
+                    self._failed_attempts = retries + 1
+                    raise
+                delay = get_retry_after(e) or min(
+                    DEFAULT_MAX_RETRY_DELAY, self.retry_interval * 2**retries * (1 + random.random())
+                )
+                retries += 1
+                self.stats.retries += 1
+                time.sleep(delay)
+
+        self.stats.points_written += points
+        self.stats.bytes_sent += len(payload)
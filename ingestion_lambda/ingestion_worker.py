@@ -0,0 +1,103 @@
+import os
+import time
+
+from http_session import get_session
+from lambda_function import create_influx_client, get_module_logger, run_ingestion
+
+logger = get_module_logger(__file__)
+
+DEFAULT_IDLE_SLEEP = 5.0
+
+
+def lease_ingestion(lease_url: str) -> dict | None:
+    response = get_session().get(lease_url, params={"limit": 1})
+    response.raise_for_status()
+    return next(iter(response.json()["data"] or []), None)
+
+
+def run_worker(
+    lease_url: str,
+    update_status_url: str,
+    idle_sleep: float = DEFAULT_IDLE_SLEEP,
+    exit_when_idle: bool = False,
+) -> tuple[int, int]:
+    """
+    Leases queued ingestions from the backend and runs them one after the other, reusing the same
+    influx client and HTTP pool for all of them. Returns the number of succeeded and failed ingestions.
+    The next ingestion is only leased once the previous one finished, so its lease never runs out while it waits.
+    """
+    influx_client = create_influx_client(os.environ.get("INFLUX_URL", ""), os.environ.get("INFLUX_TOKEN"))
+    succeeded = failed = 0
+    try:
+        while True:
+            try:
+                ingestion = lease_ingestion(lease_url)
+            except Exception as e:
+                logger.error(f"Failed to lease an ingestion from {lease_url}")
+                logger.error(e)
+                ingestion = None
+
+            if ingestion is None:
+                if exit_when_idle:
+                    break
+                time.sleep(idle_sleep)
+                continue
+
+            try:
+                ingestion_succeeded = run_ingestion(
+                    ingestion, ingestion["id"], update_status_url, influx_client=influx_client
+                )
+            except Exception as e:
+                # The worker outlives any single ingestion, whatever went wrong with it
+                logger.error(f"Ingestion {ingestion.get('id')} crashed the worker loop")
+                logger.error(e)
+                ingestion_succeeded = False
+            if ingestion_succeeded:
+                succeeded += 1
+            else:
+                failed += 1
+    finally:
+        influx_client.close()
+
+    logger.info(f"Worker finished with {succeeded} succeeded and {failed} failed ingestions")
+    return succeeded, failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--lease_url",
+        dest="lease_url",
+        type=str,
+        default=os.environ.get("INGESTION_LEASE_URL"),
+        help="URL to lease queued ingestions from",
+    )
+    parser.add_argument(
+        "--ingestion_status_update_url",
+        dest="ingestion_status_update_url",
+        type=str,
+        default=os.environ.get("INGESTION_STATUS_UPDATE_URL"),
+        help="URL to send status update of the jobs",
+    )
+    parser.add_argument(
+        "--idle_sleep",
+        dest="idle_sleep",
+        type=float,
+        default=DEFAULT_IDLE_SLEEP,
+        help="Seconds to wait before leasing again when the queue is empty",
+    )
+    parser.add_argument(
+        "--exit_when_idle",
+        dest="exit_when_idle",
+        action="store_true",
+        help="Exit once the queue is empty instead of waiting for new ingestions",
+    )
+    args = parser.parse_args()
+    run_worker(
+        args.lease_url,
+        args.ingestion_status_update_url,
+        idle_sleep=args.idle_sleep,
+        exit_when_idle=args.exit_when_idle,
+    )
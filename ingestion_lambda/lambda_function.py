@@ -3,13 +3,25 @@ from dataclasses import dataclass
 import datetime
 import json
 import time
-import requests
 import os
 import logging
 import enum
-from influxdb_client.client.influxdb_client import InfluxDBClient
-from influxdb_client.client.write_api import SYNCHRONOUS
-from influxdb_client.client.write.point import Point
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+from bars import BarColumns
+from http_session import get_session
+from influx_writer import DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL, BatchedInfluxWriter, WriteStats
+from line_protocol import encode_bars
+from page_cache import get_page_cache
+from pipeline import DEFAULT_MAX_BUFFERED, prefetch
+from retry_policy import DEFAULT_MAX_RETRIES, RetryPolicy, RetryStats
+from startup import ENTRY_POINT_MODULES, HEAVY_MODULES, preload_modules, wait_for_preloads
+
+if TYPE_CHECKING:
+    from influxdb_client.client.influxdb_client import InfluxDBClient
+
+
+POLYGON_BASE_URL = os.environ.get("POLYGON_BASE_URL", "https://api.polygon.io")
 
 
 class IngestionStatus(enum.Enum):
@@ -18,9 +30,19 @@ class IngestionStatus(enum.Enum):
     FAILURE = "FAILURE"
 
 
-def send_status_update(url: str, id: int, status: IngestionStatus):
+class IngestionAlreadyFinished(Exception):
+    """The backend rejected a status update because the ingestion already finished, e.g. once its lease expired."""
+
+
+def send_status_update(url: str, id: int, status: IngestionStatus, retry_stats: RetryStats | None = None):
     headers = {"content-type": "application/json"}
-    request = requests.put(url, headers=headers, data=json.dumps({"id": int(id), "ingestion_status": status.value}))
+    data: dict = {"id": int(id), "ingestion_status": status.value}
+    if retry_stats is not None:
+        data["retries"] = retry_stats.retries
+        data["retry_wait_seconds"] = retry_stats.wait_seconds
+    request = get_session().put(url, headers=headers, data=json.dumps(data))
+    if request.status_code == 409:
+        raise IngestionAlreadyFinished(f"Ingestion {id} already finished, {status.value} update rejected")
     request.raise_for_status()
 
 
@@ -29,6 +51,9 @@ def get_module_logger(mod_name):
     To use this, do logger = get_module_logger(__name__)
     """
     logger = logging.getLogger(mod_name)
+    if logger.handlers:
+        # Already set up, e.g. by fetch_engine importing this module again while it runs as a script
+        return logger
     handler = logging.StreamHandler()
     formatter = logging.Formatter("%(asctime)s [%(name)-12s] %(levelname)-8s %(message)s")
     handler.setFormatter(formatter)
@@ -55,87 +80,153 @@ class StockData:
     ticker: str
     queryCount: int
     resultsCount: int
-    results: list[dict]
+    results: BarColumns
     status: str
     request_id: str
     count: int
     adjusted: bool
     next_url: str | None = None
 
+    @classmethod
+    def from_response(cls, data: dict) -> "StockData":
+        return cls(**{**data, "results": BarColumns.from_results(data.get("results") or [])})
 
-def make_request(url: str):
+
+def get_cached_page(url: str) -> dict | None:
+    page_cache = get_page_cache()
+    return page_cache.get(url) if page_cache is not None else None
+
+
+def fetch_page(url: str) -> dict:
+    """Requests a page from Polygon, skipping the page cache lookup, and stores it in the cache."""
     params = {"apiKey": os.environ.get("POLYGON_API_KEY"), "adjusted": "true", "sort": "asc"}
-    r = requests.get(url, params=params)
+    r = get_session().get(url, params=params)
     r.raise_for_status()
     data = r.json()
+    if (page_cache := get_page_cache()) is not None:
+        page_cache.put(url, data)
     return data
 
 
-def get_stock_data(
-    ticker: str, type: str, multiplier: int, from_date: datetime.date, to_date: datetime.date, max_retries: int = 10
-) -> StockData | None:
+def make_request(url: str):
+    cached = get_cached_page(url)
+    return cached if cached is not None else fetch_page(url)
+
+
+def get_aggregates_url(
+    ticker: str, type: str, multiplier: int, from_date: datetime.date, to_date: datetime.date
+) -> str:
+    return f"{POLYGON_BASE_URL}/v2/aggs/ticker/{ticker}/range/{multiplier}/{type}/{from_date}/{to_date}"
+
+
+def iter_stock_data_pages(
+    ticker: str,
+    type: str,
+    multiplier: int,
+    from_date: datetime.date,
+    to_date: datetime.date,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    retry_policy: RetryPolicy | None = None,
+    retry_stats: RetryStats | None = None,
+) -> Iterator[StockData]:
+    """Yields each Polygon page as soon as it arrives, retrying only the page that failed."""
     logger.info(
         f"Started request for {ticker} from {from_date} to {to_date} with type {type} and multiplier {multiplier}"
     )
-    url = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/{multiplier}/{type}/{from_date}/{to_date}"
-    results = None
-    data = None
-    next_url = url
-    retries = 0
+    policy = retry_policy or RetryPolicy(max_retries=max_retries)
+    next_url: str | None = get_aggregates_url(ticker, type, multiplier, from_date, to_date)
+    attempt = 0
 
-    while not results or (next_url := data.next_url if data else None):
-        if retries >= max_retries:
-            raise Exception(f"Failed to make request to url {url} after {retries} retries")
+    while next_url:
         try:
             request_data = make_request(next_url)
             if not request_data["resultsCount"]:
-                results = None
                 break
-            data = StockData(**request_data)
-            if not results:
-                results = data
-            else:
-                results.results.extend(data.results)
-
-            logger.info(f"Received {data.count} results from request url {url}")
+            data = StockData.from_response(request_data)
         except Exception as e:
-            logger.error(f"Failed to make request to url {url}")
+            kind, delay = policy.next_delay(attempt, e, retry_stats)
+            logger.error(f"Failed to make request to url {next_url} ({kind.value}), retrying in {delay:.1f} seconds")
             logger.error(e)
-            time.sleep(10)
-            retries += 1
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        logger.info(f"Received {data.count} results from request url {next_url}")
+        attempt = 0
+        next_url = data.next_url
+        yield data
+
+
+def get_stock_data(
+    ticker: str,
+    type: str,
+    multiplier: int,
+    from_date: datetime.date,
+    to_date: datetime.date,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    retry_stats: RetryStats | None = None,
+) -> StockData | None:
+    results = None
+    pages = iter_stock_data_pages(
+        ticker, type, multiplier, from_date, to_date, max_retries=max_retries, retry_stats=retry_stats
+    )
+    for data in pages:
+        if not results:
+            results = data
+        else:
+            results.results.extend(data.results)
 
     return results
 
 
-def write_data_to_influx(client: InfluxDBClient, bucket_name: str, org_name, data: StockData):
-    write_api = client.write_api(write_options=SYNCHRONOUS)
-    measurement = "stock_data"
-    tags = {"ticker": data.ticker}
-    write_data = []
-    for result in data.results:
-        write_data.append(
-            Point.from_dict(
-                {
-                    "measurement": measurement,
-                    "tags": tags,
-                    "time": datetime.datetime.fromtimestamp(result["t"] / 1000),
-                    "fields": {
-                        "open": float(result["o"]),
-                        "close": float(result["c"]),
-                        "high": float(result["h"]),
-                        "low": float(result["l"]),
-                        "volume": float(result["v"]),
-                        "time": int(result["t"]),
-                    },
-                }
-            )
-        )
+def stock_data_to_line_protocol(data: StockData) -> list[bytes]:
+    return encode_bars(data.ticker, data.results)
+
+
+def stream_data_to_influx(
+    client: "InfluxDBClient",
+    bucket_name: str,
+    org_name,
+    pages: Iterable[StockData],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+) -> WriteStats:
+    with BatchedInfluxWriter(
+        client, bucket_name, org_name, batch_size=batch_size, flush_interval=flush_interval
+    ) as writer:
+        for data in pages:
+            writer.write(stock_data_to_line_protocol(data))
+    logger.info(
+        f"Finished writing {writer.stats.points_written} data points to influxdb "
+        f"({writer.stats.bytes_sent} bytes in {writer.stats.requests} requests, {writer.stats.retries} retries)"
+    )
+    return writer.stats
+
+
+def write_data_to_influx(
+    client: "InfluxDBClient",
+    bucket_name: str,
+    org_name,
+    data: StockData,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+) -> WriteStats:
+    return stream_data_to_influx(
+        client, bucket_name, org_name, [data], batch_size=batch_size, flush_interval=flush_interval
+    )
+
+
+def create_influx_client(url: str, token: str | None) -> "InfluxDBClient":
+    # Imported on first use, or by the preload started with the process
+    wait_for_preloads()
+    from influxdb_client.client.influxdb_client import InfluxDBClient
 
-        write_api.write(bucket_name, org_name, write_data[-1])
-    logger.info(f"Finished writing {len(write_data)} data points to influxdb")
+    return InfluxDBClient(url=url, token=token or "", ssl=False, verify_ssl=False, enable_gzip=True)
 
 
-def lambda_handler(event, context=None):
+def lambda_handler(
+    event, context=None, influx_client: "InfluxDBClient | None" = None, retry_stats: RetryStats | None = None
+) -> dict:
     ticker = event.get("ticker")
     type = AggType[event.get("type")]
     multiplier = event.get("multiplier")
@@ -146,6 +237,11 @@ def lambda_handler(event, context=None):
     stocks_bucket = event.get("stocks_bucket")
     org = event.get("org")
     update_status_url = os.environ.get("INGESTION_STATUS_UPDATE_URL")
+    write_batch_size = int(event.get("write_batch_size") or DEFAULT_BATCH_SIZE)
+    write_flush_interval = float(event.get("write_flush_interval") or DEFAULT_FLUSH_INTERVAL)
+    max_buffered_pages = int(event.get("max_buffered_pages") or DEFAULT_MAX_BUFFERED)
+    fetch_concurrency = int(event.get("fetch_concurrency") or 1)
+    retry_stats = retry_stats if retry_stats is not None else RetryStats()
 
     logger.info(
         f"""Passed parameters: 
@@ -183,10 +279,69 @@ def lambda_handler(event, context=None):
     if errors:
         raise ValueError(f"One or more required params were not passed: {errors}")
 
-    results = get_stock_data(ticker, type.value, multiplier, from_date, to_date)
-    influx_client = InfluxDBClient(url=url, token=token or "", ssl=False, verify_ssl=False)
-    if results:
-        write_data_to_influx(influx_client, stocks_bucket, org, results)
+    if influx_client is None:
+        influx_client = create_influx_client(url, token)
+    if fetch_concurrency > 1:
+        # Imported here since the fetch engine builds on this module
+        from fetch_engine import DEFAULT_WINDOW_DAYS, FetchWindow, iter_windows_pages, split_window
+
+        windows = split_window(
+            FetchWindow(ticker, type.value, multiplier, from_date, to_date),
+            int(event.get("fetch_window_days") or DEFAULT_WINDOW_DAYS),
+        )
+        page_iterator = iter_windows_pages(
+            windows, concurrency=fetch_concurrency, max_buffered=max_buffered_pages, retry_stats=retry_stats
+        )
+    else:
+        page_iterator = iter_stock_data_pages(
+            ticker, type.value, multiplier, from_date, to_date, retry_stats=retry_stats
+        )
+    # Pages are written while the next ones are fetched, so only max_buffered_pages are held in memory
+    pages = prefetch(page_iterator, max_buffered=max_buffered_pages)
+    write_stats = stream_data_to_influx(
+        influx_client,
+        stocks_bucket,
+        org,
+        pages,
+        batch_size=write_batch_size,
+        flush_interval=write_flush_interval,
+    )
+    report = {
+        "points_written": write_stats.points_written,
+        "bytes_sent": write_stats.bytes_sent,
+        "retries": retry_stats.retries,
+        "retry_wait_seconds": retry_stats.wait_seconds,
+        "retry_errors": retry_stats.errors,
+    }
+    logger.info(f"Finished ingestion of {ticker}: {report}")
+    return report
+
+
+def run_ingestion(
+    event: dict, ingestion_id: int, update_status_url: str, influx_client: "InfluxDBClient | None" = None
+) -> bool:
+    """Runs one ingestion and reports its status to the backend, returns whether it succeeded."""
+    retry_stats = RetryStats()
+    try:
+        send_status_update(update_status_url, ingestion_id, status=IngestionStatus.IN_PROGRESS)
+        lambda_handler(event, influx_client=influx_client, retry_stats=retry_stats)
+        send_status_update(update_status_url, ingestion_id, status=IngestionStatus.SUCCESS, retry_stats=retry_stats)
+        return True
+    except IngestionAlreadyFinished as e:
+        logger.warning(e)
+        return False
+    except Exception as e:
+        logger.error(f"Ingestion {ingestion_id} failed after {retry_stats.retries} retries")
+        logger.error(e)
+        try:
+            send_status_update(
+                update_status_url, ingestion_id, status=IngestionStatus.FAILURE, retry_stats=retry_stats
+            )
+        except Exception as e:
+            # Left to the backend cleanup, which fails the ingestion once its lease expires
+            logger.error(f"Failed to report the failure of ingestion {ingestion_id}")
+            logger.error(e)
+        return False
 
 
 if __name__ == "__main__":
@@ -207,7 +362,47 @@ if __name__ == "__main__":
         type=str,
         help="URL to send status update of the job",
     )
+    parser.add_argument(
+        "--write_batch_size", dest="write_batch_size", type=int, help="Number of points per influx write request"
+    )
+    parser.add_argument(
+        "--write_flush_interval",
+        dest="write_flush_interval",
+        type=float,
+        help="Max seconds buffered points wait before being written to influx",
+    )
+    parser.add_argument(
+        "--max_buffered_pages",
+        dest="max_buffered_pages",
+        type=int,
+        help="Max fetched pages waiting to be written to influx",
+    )
+    parser.add_argument(
+        "--fetch_concurrency",
+        dest="fetch_concurrency",
+        type=int,
+        help="Sub windows of the date range fetched concurrently from Polygon",
+    )
+    parser.add_argument(
+        "--fetch_window_days", dest="fetch_window_days", type=int, help="Days per concurrently fetched sub window"
+    )
+    parser.add_argument(
+        "--profile-startup",
+        dest="profile_startup",
+        action="store_true",
+        help="Print the import time of every module loaded by an ingestion and exit",
+    )
     args = parser.parse_args()
+    if args.profile_startup:
+        from startup import format_import_profile, get_total_ms, profile_imports
+
+        entry_point_ms = get_total_ms(profile_imports(ENTRY_POINT_MODULES))
+        print(f"Entry point import time {entry_point_ms:.1f}ms, before the influx client is loaded\n")
+        print(format_import_profile(profile_imports([*ENTRY_POINT_MODULES, *HEAVY_MODULES])))
+        raise SystemExit(0)
+
+    # The influx client loads while the status update and the first pages are in flight
+    preload_modules(HEAVY_MODULES)
     event = {
         "ticker": args.ticker,
         "type": args.type,
@@ -216,12 +411,11 @@ if __name__ == "__main__":
         "to_date": args.to_date,
         "stocks_bucket": args.stocks_bucket,
         "org": args.org,
+        "write_batch_size": args.write_batch_size,
+        "write_flush_interval": args.write_flush_interval,
+        "max_buffered_pages": args.max_buffered_pages,
+        "fetch_concurrency": args.fetch_concurrency,
+        "fetch_window_days": args.fetch_window_days,
     }
 
-    args = parser.parse_args()
-    try:
-        send_status_update(args.ingestion_status_update_url, args.id, status=IngestionStatus.IN_PROGRESS)
-        lambda_handler(event)
-        send_status_update(args.ingestion_status_update_url, args.id, status=IngestionStatus.SUCCESS)
-    except Exception as e:
-        send_status_update(args.ingestion_status_update_url, args.id, status=IngestionStatus.FAILURE)
+    run_ingestion(event, args.id, args.ingestion_status_update_url)
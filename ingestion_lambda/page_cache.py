@@ -0,0 +1,282 @@
+"""
+Local cache of raw Polygon aggregate pages, so re-runs and retries of an ingestion do not spend rate limit quota.
+Pages are stored gzip compressed, one file per page named after the hash of its request in a directory per ticker, and
+the least recently used ones are evicted once the cache grows over its size limit. Pages of open ranges expire after a
+short TTL. Pages of ranges that ended before the settle period only change when Polygon adjusts them for a split or a
+dividend, they expire after a long TTL or once their ticker is invalidated:
+    python page_cache.py --invalidate_ticker AAPL
+"""
+
+from dataclasses import dataclass
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import shutil
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+PAGE_CACHE_DIR = os.environ.get("POLYGON_PAGE_CACHE_DIR")
+PAGE_CACHE_MAX_BYTES = int(float(os.environ.get("POLYGON_PAGE_CACHE_MAX_MB", "1024")) * 2**20)
+OPEN_RANGE_TTL_SECONDS = float(os.environ.get("POLYGON_PAGE_CACHE_OPEN_TTL_SECONDS", "900"))
+CLOSED_RANGE_TTL_SECONDS = float(os.environ.get("POLYGON_PAGE_CACHE_CLOSED_TTL_SECONDS", str(30 * 86400)))
+# Bars of the last days may still be corrected, ranges ending earlier are closed
+SETTLE_DAYS = 1
+# Eviction frees space down to this fraction of the limit, so it does not run again on the next write
+EVICTION_TARGET = 0.9
+COMPRESS_LEVEL = 6
+ENTRY_SUFFIX = ".json.gz"
+# Left over temporary files of writers that died are removed after this long
+STALE_TEMP_SECONDS = 3600
+# Query parameters that do not change the returned page
+IGNORED_PARAMS = {"apiKey"}
+# First pages have dates in their path, next_url pages millisecond timestamps
+RANGE_END = re.compile(r"/range/\d+/\w+/[^/]+/(?P<end>[^/]+)$")
+TICKER = re.compile(r"/ticker/(?P<ticker>[^/]+)/range/")
+# Directory of the pages whose URL has no ticker
+NO_TICKER_DIR = "_"
+
+logger = logging.getLogger(__file__)
+
+_page_cache: "PageCache | None" = None
+_page_cache_configured = False
+_page_cache_lock = threading.Lock()
+
+
+@dataclass
+class PageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+
+def get_page_key(url: str) -> str:
+    """Hash of everything that identifies a page: host, ticker, multiplier, timespan, date range and cursor."""
+    parts = urlsplit(url)
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query) if key not in IGNORED_PARAMS))
+    return hashlib.sha256(f"{parts.netloc}{parts.path}?{query}".encode()).hexdigest()
+
+
+def get_ticker_dir(ticker: str) -> str:
+    directory = quote(ticker, safe="")
+    return directory if directory.strip(".") else NO_TICKER_DIR
+
+
+def get_url_ticker_dir(url: str) -> str:
+    match = TICKER.search(urlsplit(url).path)
+    return get_ticker_dir(unquote(match["ticker"])) if match else NO_TICKER_DIR
+
+
+def get_range_end(url: str) -> datetime.date | None:
+    if not (match := RANGE_END.search(urlsplit(url).path)):
+        return None
+    end = match["end"]
+    try:
+        if end.isdigit():
+            return datetime.datetime.fromtimestamp(int(end) / 1000, tz=datetime.timezone.utc).date()
+        return datetime.date.fromisoformat(end)
+    except (ValueError, OverflowError):
+        return None
+
+
+def is_closed_range(url: str, today: datetime.date | None = None) -> bool:
+    today = today or datetime.datetime.now(tz=datetime.timezone.utc).date()
+    end = get_range_end(url)
+    return end is not None and end < today - datetime.timedelta(days=SETTLE_DAYS)
+
+
+class PageCache:
+    """
+    Size bounded page cache in a directory, safe to share between threads and processes: entries are written to a
+    temporary file and renamed into place, and reading an entry refreshes its modification time for the LRU eviction.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = PAGE_CACHE_MAX_BYTES,
+        open_range_ttl: float = OPEN_RANGE_TTL_SECONDS,
+        closed_range_ttl: float = CLOSED_RANGE_TTL_SECONDS,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.open_range_ttl = open_range_ttl
+        self.closed_range_ttl = closed_range_ttl
+        self.stats = PageCacheStats()
+        self._size: int | None = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, url: str) -> str:
+        # Pages of a ticker share a directory, so invalidating the ticker only removes that directory
+        return os.path.join(self.directory, get_url_ticker_dir(url), get_page_key(url) + ENTRY_SUFFIX)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def get(self, url: str) -> dict | None:
+        path = self._get_path(url)
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            entry = None
+        except (OSError, EOFError, ValueError, zlib.error) as e:
+            logger.warning(f"Dropping unreadable page cache entry {path}: {e}")
+            self._remove(path)
+            entry = None
+
+        if entry is not None and entry["expires_at"] < time.time():
+            self._remove(path)
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats.hits += 1
+        return entry["page"]
+
+    def put(self, url: str, page: dict):
+        ttl = self.closed_range_ttl if is_closed_range(url) else self.open_range_ttl
+        if ttl <= 0:
+            return
+        entry = {"url": url, "expires_at": time.time() + ttl, "page": page}
+        body = gzip.compress(json.dumps(entry).encode(), compresslevel=COMPRESS_LEVEL, mtime=0)
+        path = self._get_path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(temp_path, path)
+        except OSError as e:
+            # The cache only saves requests, a full or read only disk must not fail the ingestion
+            logger.warning(f"Failed to write page cache entry {path}: {e}")
+            return
+
+        self.stats.writes += 1
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += len(body)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        """Modification time, size and path of every entry, removing stale temporary files on the way."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".tmp"):
+                    if stat.st_mtime < now - STALE_TEMP_SECONDS:
+                        self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        """Removes the least recently used entries until the cache is back under EVICTION_TARGET of its limit."""
+        entries = sorted(self._scan())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes * EVICTION_TARGET:
+                break
+            self._remove(path)
+            size -= entry_size
+            evicted += 1
+        with self._lock:
+            self._size = size
+        self.stats.evictions += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} pages from the page cache, {size / 2**20:.1f}MB left")
+        return evicted
+
+    def clear(self) -> int:
+        entries = self._scan()
+        for _, _, path in entries:
+            self._remove(path)
+        with self._lock:
+            self._size = 0
+        return len(entries)
+
+    def invalidate_ticker(self, ticker: str) -> int:
+        """Removes every page of the ticker, e.g. once Polygon adjusted its history for a split or a dividend."""
+        directory = os.path.join(self.directory, get_ticker_dir(ticker))
+        try:
+            removed = sum(name.endswith(ENTRY_SUFFIX) for name in os.listdir(directory))
+        except FileNotFoundError:
+            return 0
+        shutil.rmtree(directory, ignore_errors=True)
+        with self._lock:
+            # Counted again on the next write
+            self._size = None
+        return removed
+
+
+def get_page_cache() -> PageCache | None:
+    """Returns the page cache shared by the fetch paths, or None when POLYGON_PAGE_CACHE_DIR is not set."""
+    global _page_cache, _page_cache_configured
+    if not _page_cache_configured:
+        with _page_cache_lock:
+            if not _page_cache_configured:
+                _page_cache = PageCache(PAGE_CACHE_DIR) if PAGE_CACHE_DIR else None
+                _page_cache_configured = True
+    return _page_cache
+
+
+def configure_page_cache(directory: str | None, **kwargs) -> PageCache | None:
+    """Replaces the shared page cache, None disables it."""
+    global _page_cache, _page_cache_configured
+    with _page_cache_lock:
+        _page_cache = PageCache(directory, **kwargs) if directory else None
+        _page_cache_configured = True
+    return _page_cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Removes pages from the Polygon page cache")
+    parser.add_argument(
+        "--cache_dir", dest="cache_dir", type=str, default=PAGE_CACHE_DIR, help="Page cache directory to manage"
+    )
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--clear", dest="clear", action="store_true", help="Remove every cached page")
+    action.add_argument(
+        "--invalidate_ticker",
+        dest="invalidate_tickers",
+        action="append",
+        help="Remove the cached pages of a ticker, e.g. after a split, can be given several times",
+    )
+    args = parser.parse_args()
+    if not args.cache_dir:
+        parser.error("--cache_dir or POLYGON_PAGE_CACHE_DIR is required")
+
+    page_cache = PageCache(args.cache_dir)
+    if args.clear:
+        print(f"Removed {page_cache.clear()} pages from {args.cache_dir}")
+    for ticker in args.invalidate_tickers or []:
+        print(f"Removed {page_cache.invalidate_ticker(ticker)} pages of {ticker} from {args.cache_dir}")
@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+import enum
+import random
+import threading
+import requests
+
+DEFAULT_MAX_RETRIES = 10
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+# Responses cut short or garbled on the way, retried like the connection errors they come from
+TRUNCATED_RESPONSE_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+    requests.JSONDecodeError,
+)
+
+
+class ErrorKind(enum.Enum):
+    RATE_LIMITED = "RATE_LIMITED"
+    SERVER_ERROR = "SERVER_ERROR"
+    CONNECTION_ERROR = "CONNECTION_ERROR"
+    CLIENT_ERROR = "CLIENT_ERROR"
+    UNKNOWN = "UNKNOWN"
+
+
+# Unknown errors, e.g. a KeyError from a changed Polygon payload, fail the same way on every retry
+RETRYABLE_ERROR_KINDS = {
+    ErrorKind.RATE_LIMITED,
+    ErrorKind.SERVER_ERROR,
+    ErrorKind.CONNECTION_ERROR,
+}
+
+
+class NonRetryableError(Exception):
+    """Raised when a request fails with an error that retrying will not fix, e.g. a 404 or an unexpected payload."""
+
+
+@dataclass
+class RetryStats:
+    """Retry counters of one ingestion, shared between every page fetch of it."""
+
+    retries: int = 0
+    wait_seconds: float = 0.0
+    errors: dict[str, int] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, kind: ErrorKind, delay: float):
+        with self._lock:
+            self.retries += 1
+            self.wait_seconds += delay
+            self.errors[kind.value] = self.errors.get(kind.value, 0) + 1
+
+
+def classify_error(error: Exception) -> ErrorKind:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        if status == 429:
+            return ErrorKind.RATE_LIMITED
+        if status >= 500 or status in RETRYABLE_STATUS_CODES:
+            return ErrorKind.SERVER_ERROR
+        return ErrorKind.CLIENT_ERROR
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, *TRUNCATED_RESPONSE_ERRORS)):
+        return ErrorKind.CONNECTION_ERROR
+    return ErrorKind.UNKNOWN
+
+
+def get_retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return max(0.0, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, capped at max_delay. Retry-After is honored when the server sends it,
+    and client errors other than 408/425/429 fail fast, as do errors that are not about the request at all.
+    """
+
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+
+    def is_retryable(self, kind: ErrorKind) -> bool:
+        return kind in RETRYABLE_ERROR_KINDS
+
+    def get_delay(self, attempt: int, error: Exception) -> float:
+        if (retry_after := get_retry_after(error)) is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def next_delay(self, attempt: int, error: Exception, stats: RetryStats | None = None) -> tuple[ErrorKind, float]:
+        """
+        Returns the error kind and how long to wait before retrying attempt (0 based) of a request that failed
+        with error, raising when the error is not retryable or the retries are exhausted.
+        """
+        kind = classify_error(error)
+        if not self.is_retryable(kind):
+            raise NonRetryableError(f"Request failed with a non retryable error: {error}") from error
+        if attempt >= self.max_retries:
+            raise Exception(f"Request failed after {attempt} retries: {error}") from error
+        delay = self.get_delay(attempt, error)
+        if stats is not None:
+            stats.record(kind, delay)
+        return kind, delay
@@ -0,0 +1,97 @@
+"""
+Cold start helpers. Every ingestion runs in its own short lived process, so the influx client, which makes up most of
+the import time, is only imported when first used or preloaded in the background while the first requests are in
+flight. Import times are profiled in a fresh interpreter started with -X importtime.
+"""
+
+from dataclasses import dataclass
+import importlib
+import os
+import subprocess
+import sys
+import threading
+from typing import Iterable
+
+# Imported lazily by the ingestion modules
+HEAVY_MODULES = ["influxdb_client.client.influxdb_client", "influxdb_client.client.write_api"]
+ENTRY_POINT_MODULES = ["lambda_function"]
+
+_preload_threads: list[threading.Thread] = []
+_preload_lock = threading.Lock()
+
+
+def import_modules(modules: Iterable[str]):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def preload_modules(modules: Iterable[str] = HEAVY_MODULES) -> threading.Thread:
+    """Imports the modules in a background thread, their import then overlaps with the network calls made meanwhile."""
+    thread = threading.Thread(target=import_modules, args=(list(modules),), name="preload-modules", daemon=True)
+    with _preload_lock:
+        _preload_threads.append(thread)
+    thread.start()
+    return thread
+
+
+def wait_for_preloads():
+    """Waits for the running preloads, so a module is never imported by two threads at once."""
+    with _preload_lock:
+        threads, _preload_threads[:] = list(_preload_threads), []
+    for thread in threads:
+        thread.join()
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.module.split(".")[0]
+
+
+def profile_imports(modules: Iterable[str]) -> list[ImportTiming]:
+    """
+    Imports the modules in a fresh interpreter and returns the timing of every module they imported, without the
+    modules loaded by the interpreter startup.
+    """
+    code = "".join(f"import {module}\n" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us), int(cumulative_us), depth))
+        if depth == 0 and timings[-1].module == "site":
+            timings = []
+    return timings
+
+
+def get_total_ms(timings: list[ImportTiming]) -> float:
+    return sum(timing.cumulative_us for timing in timings if timing.depth == 0) / 1000
+
+
+def format_import_profile(timings: list[ImportTiming], top: int = 20) -> str:
+    """Import time per top level package and the slowest modules, by self time."""
+    packages: dict[str, int] = {}
+    for timing in timings:
+        packages[timing.package] = packages.get(timing.package, 0) + timing.self_us
+    lines = [f"Total import time {get_total_ms(timings):.1f}ms", "", f"{'package':<48}{'self ms':>10}"]
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"{package:<48}{self_us / 1000:>10.1f}")
+    lines += ["", f"{'module':<48}{'self ms':>10}{'cumulative ms':>15}"]
+    for timing in sorted(timings, key=lambda timing: -timing.self_us)[:top]:
+        lines.append(f"{timing.module:<48}{timing.self_us / 1000:>10.1f}{timing.cumulative_us / 1000:>15.1f}")
+    return "\n".join(lines)
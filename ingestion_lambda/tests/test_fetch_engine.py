@@ -0,0 +1,77 @@
+import asyncio
+import dataclasses
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lambda_function
+from fetch_engine import FetchWindow, TokenBucket, fetch_windows, split_window
+from lambda_function import get_module_logger
+
+
+def test_get_module_logger_once():
+    logger = get_module_logger(lambda_function.__file__)
+    assert get_module_logger(lambda_function.__file__) is logger
+    assert len(logger.handlers) == 1
+
+    # Run as a script, the module is imported a second time by fetch_engine
+    script = "import runpy; runpy.run_path('lambda_function.py'); import fetch_engine, lambda_function"
+    script += "; print(len(lambda_function.logger.handlers))"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(lambda_function.__file__),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == "1"
+
+
+def test_token_bucket():
+    async def acquire_times(bucket: TokenBucket, count: int) -> list[float]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        times = []
+        for _ in range(count):
+            await bucket.acquire()
+            times.append(loop.time() - started)
+        return times
+
+    # The burst is spent right away, then a token every 0.05 seconds
+    times = asyncio.run(acquire_times(TokenBucket(1200, burst=2), 4))
+    assert times[1] < 0.02
+    assert 0.04 <= times[2] < 0.09
+    assert 0.09 <= times[3] < 0.14
+
+    async def acquire_after_pause() -> list[float]:
+        bucket = TokenBucket(1200, burst=10)
+        bucket.pause(0.1)
+        return await acquire_times(bucket, 1)
+
+    # A rate limited response pauses the bucket and empties it, whatever was left of the burst
+    assert 0.1 <= asyncio.run(acquire_after_pause())[0] < 0.15
+
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_fetch_windows(polygon_stub):
+    window = FetchWindow("TEST", "hour", 1, datetime.date(2023, 1, 2), datetime.date(2023, 1, 11))
+    windows = split_window(window, 5) + split_window(dataclasses.replace(window, ticker="OTHER"), 5)
+    assert [(w.from_date.day, w.to_date.day) for w in windows[:2]] == [(2, 6), (7, 11)]
+
+    async def collect() -> list:
+        return [(window, data) async for window, data in fetch_windows(windows, concurrency=3, max_buffered=2)]
+
+    # Every window has 120 hourly bars, served 100 per page
+    polygon_stub.reset(page_size=100)
+    pages = asyncio.run(collect())
+    assert polygon_stub.stats() == {"pages": 8, "bars": 480}
+    assert len(pages) == 8
+    for fetched in windows:
+        times = [t for window, data in pages if window == fetched for t in data.results.timestamp]
+        start = datetime.datetime.combine(fetched.from_date, datetime.time(), tzinfo=datetime.timezone.utc)
+        assert sorted(times) == [int(start.timestamp() * 1000) + i * 3_600_000 for i in range(120)]
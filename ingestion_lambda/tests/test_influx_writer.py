@@ -0,0 +1,47 @@
+import time
+
+import pytest
+from influxdb_client.rest import ApiException
+
+from influx_writer import BatchedInfluxWriter
+from lambda_function import create_influx_client
+
+RECORDS = [f"stock_data,ticker=TEST close={i} {1672617600000 + i}" for i in range(7)]
+
+
+def test_batched_writes(influx_stub):
+    influx_stub.reset()
+    client = create_influx_client(influx_stub.url, "test")
+    with BatchedInfluxWriter(client, "test", "test", batch_size=3, flush_interval=60) as writer:
+        writer.write(RECORDS)
+        writer.write(record.encode() for record in RECORDS[:1])
+    assert writer.stats.points_written == 8
+    assert influx_stub.stats()["requests"] == 3
+    assert influx_stub.stats()["points"] == 8
+
+
+def test_flush_interval(influx_stub):
+    influx_stub.reset()
+    client = create_influx_client(influx_stub.url, "test")
+    with BatchedInfluxWriter(client, "test", "test", batch_size=100, flush_interval=0.1) as writer:
+        writer.write(RECORDS[:3])
+        # Sent by the background thread without any further write
+        time.sleep(0.3)
+        assert influx_stub.stats()["points"] == 3
+        writer.write(RECORDS[3:])
+    assert influx_stub.stats()["requests"] == 2
+    assert influx_stub.stats()["points"] == 7
+
+
+@pytest.mark.parametrize("status,attempts", [(400, "1 attempt"), (503, "3 attempts")])
+def test_write_failure_attempts(influx_stub, monkeypatch, status, attempts):
+    client = create_influx_client(influx_stub.url, "test")
+    writer = BatchedInfluxWriter(client, "test", "test", batch_size=100, max_retries=2, retry_interval=0.001)
+
+    def write(*args, **kwargs):
+        raise ApiException(status=status)
+
+    monkeypatch.setattr(writer._write_api, "write", write)
+    writer.write(RECORDS)
+    with pytest.raises(Exception, match=f"after {attempts}$"):
+        writer.close()
@@ -0,0 +1,84 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ingestion_worker import run_worker
+from lambda_function import IngestionStatus, run_ingestion
+
+
+class BackendHandler(BaseHTTPRequestHandler):
+    """Leases the queued ingestions one by one and answers every status update with status_code."""
+
+    protocol_version = "HTTP/1.1"
+    server: "BackendServer"
+
+    def send_body(self, status: int, body: bytes = b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            data = [self.server.queue.pop(0)] if self.server.queue else []
+        self.send_body(200, json.dumps({"data": data}).encode())
+
+    def do_PUT(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        with self.server.lock:
+            self.server.updates.append((body["id"], body["ingestion_status"]))
+        self.send_body(self.server.status_code)
+
+    def log_message(self, *args):
+        pass
+
+
+class BackendServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, queue: list[dict], status_code: int):
+        super().__init__(("127.0.0.1", 0), BackendHandler)
+        self.queue = queue
+        self.status_code = status_code
+        self.updates: list[tuple[int, str]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+@pytest.fixture
+def failing_backend():
+    # Ingestions without a date range fail right away, with the backend down their failure can not be reported
+    server = BackendServer([{"id": 1, "ticker": "AAPL"}, {"id": 2, "ticker": "MSFT"}], status_code=500)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_run_ingestion_failure_report_fails(failing_backend):
+    assert not run_ingestion({"ticker": "AAPL"}, 1, f"{failing_backend.url}/status")
+    assert failing_backend.updates == [(1, IngestionStatus.IN_PROGRESS.value), (1, IngestionStatus.FAILURE.value)]
+
+
+def test_run_worker_survives_failing_status_updates(failing_backend, influx_stub, monkeypatch):
+    monkeypatch.setenv("INFLUX_URL", influx_stub.url)
+    assert run_worker(f"{failing_backend.url}/lease", f"{failing_backend.url}/status", exit_when_idle=True) == (0, 2)
+    assert failing_backend.queue == []
+    assert [id for id, status in failing_backend.updates if status == IngestionStatus.FAILURE.value] == [1, 2]
+
+
+def test_run_worker_survives_crashed_ingestion(failing_backend, influx_stub, monkeypatch):
+    def crash(*args, **kwargs):
+        raise RuntimeError("crashed")
+
+    monkeypatch.setenv("INFLUX_URL", influx_stub.url)
+    monkeypatch.setattr("ingestion_worker.run_ingestion", crash)
+    assert run_worker(f"{failing_backend.url}/lease", f"{failing_backend.url}/status", exit_when_idle=True) == (0, 2)
+    assert failing_backend.queue == []
@@ -0,0 +1,64 @@
+import math
+import time
+
+import pytest
+
+from bars import BarColumns
+from bench_line_protocol import make_bars
+from line_protocol import encode_bars, encode_bars_with_points
+
+
+def encode_with_points(ticker: str, bars: BarColumns) -> list[bytes]:
+    return [line.encode() for line in encode_bars_with_points(ticker, bars)]
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    # US eastern time with daylight saving, as a POSIX rule so no tz database is needed
+    monkeypatch.setenv("TZ", "EST+5EDT,M3.2.0,M11.1.0")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def bar(o: float, c: float, h: float, low: float, v: float, t: int) -> dict:
+    return {"o": o, "c": c, "h": h, "l": low, "v": v, "t": t}
+
+
+# Whole number prices and volumes, tiny and huge floats and a daylight saving switch (2023-03-12)
+EDGE_BARS = BarColumns.from_results(
+    [
+        bar(150.0, 150.25, 151.0, 149.0, 1000.0, 1_672_531_200_000),
+        bar(0.0001, 1e-07, 123456789.123, 1e16, 5_000_000.0, 1_678_600_000_000),
+        bar(99.99, 100.0, 100.5, 99.5, 0.0, 1_678_608_000_000),
+    ]
+)
+
+
+@pytest.mark.parametrize("ticker", ["AAPL", "BRK.B", "A B", "A,B", "A=B", "A\\B", "AB\\", ""])
+def test_encode_bars_matches_points(ticker):
+    assert encode_bars(ticker, EDGE_BARS) == encode_with_points(ticker, EDGE_BARS)
+    bars = make_bars(1000)
+    assert encode_bars(ticker, bars) == encode_with_points(ticker, bars)
+
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf])
+def test_encode_bars_non_finite(value):
+    bars = BarColumns.from_results(
+        [bar(150.0, 150.5, 151.0, 149.0, 1000.0, 1_672_531_200_000), bar(150.0, value, 151.0, 149.0, 1000.0, 1)]
+    )
+    lines = encode_bars("AAPL", bars)
+    assert lines == encode_with_points("AAPL", bars)
+    assert b"close=" not in lines[1]
+
+
+def test_encode_bars_local_timezone(local_timezone):
+    assert time.timezone != 0
+    assert encode_bars("BRK.B", EDGE_BARS) == encode_with_points("BRK.B", EDGE_BARS)
+    bars = make_bars(1000)
+    assert encode_bars("BRK.B", bars) == encode_with_points("BRK.B", bars)
+
+
+def test_encode_bars_empty():
+    assert encode_bars("AAPL", BarColumns()) == []
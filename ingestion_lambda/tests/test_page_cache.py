@@ -0,0 +1,111 @@
+import datetime
+import gzip
+import os
+import subprocess
+import sys
+import time
+
+import page_cache as page_cache_module
+from lambda_function import fetch_page, get_aggregates_url
+from page_cache import EVICTION_TARGET, PageCache
+
+CLOSED_FROM = datetime.date(2023, 1, 2)
+CLOSED_TO = datetime.date(2023, 1, 31)
+PAGE = {"status": "OK", "results": [{"t": 1672617600000, "o": 1.0, "c": 1.5}]}
+
+
+def get_closed_url(ticker: str = "AAPL", cursor: int | None = None) -> str:
+    url = f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/1/hour/{CLOSED_FROM}/{CLOSED_TO}"
+    return url if cursor is None else f"{url}?cursor={cursor}"
+
+
+def get_open_url(ticker: str = "AAPL") -> str:
+    today = datetime.datetime.now(tz=datetime.timezone.utc).date()
+    return f"https://api.polygon.io/v2/aggs/ticker/{ticker}/range/1/hour/{CLOSED_FROM}/{today}"
+
+
+def test_page_cache_expiry(tmp_path):
+    cache = PageCache(str(tmp_path), open_range_ttl=0.05, closed_range_ttl=0.5)
+    cache.put(get_open_url(), PAGE)
+    cache.put(get_closed_url(), PAGE)
+    # The API key never changes the page
+    assert cache.get(get_open_url() + "?apiKey=secret") == PAGE
+    assert cache.get(get_closed_url()) == PAGE
+
+    time.sleep(0.1)
+    assert cache.get(get_open_url()) is None
+    assert cache.get(get_closed_url()) == PAGE
+    time.sleep(0.5)
+    assert cache.get(get_closed_url()) is None
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 2
+    assert not list(tmp_path.rglob("*.json.gz"))
+
+    # Open ranges are not cached at all without a TTL
+    PageCache(str(tmp_path), open_range_ttl=0).put(get_open_url(), PAGE)
+    assert not list(tmp_path.rglob("*.json.gz"))
+
+
+def test_page_cache_eviction(tmp_path):
+    cache = PageCache(str(tmp_path))
+    urls = [get_closed_url(cursor=1672617600000 + i) for i in range(6)]
+    for i, url in enumerate(urls[:5]):
+        cache.put(url, PAGE)
+        path = cache._get_path(url)
+        os.utime(path, (1000 + i, 1000 + i))
+    # Reading a page makes it the most recently used
+    assert cache.get(urls[0]) == PAGE
+    entry_size = os.path.getsize(cache._get_path(urls[0]))
+
+    cache.max_bytes = 4 * entry_size
+    cache.put(urls[5], PAGE)
+    kept = [url for url in urls if os.path.exists(cache._get_path(url))]
+    assert kept == [urls[0], urls[4], urls[5]]
+    assert sum(os.path.getsize(cache._get_path(url)) for url in kept) <= cache.max_bytes * EVICTION_TARGET
+    assert cache.stats.evictions == 3
+
+
+def test_page_cache_corrupt_entry(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put(get_closed_url(), PAGE)
+    path = cache._get_path(get_closed_url())
+    with open(path, "wb") as f:
+        f.write(gzip.compress(b"{not json")[:-4])
+
+    assert cache.get(get_closed_url()) is None
+    assert not os.path.exists(path)
+    assert cache.stats.misses == 1
+
+
+def test_page_cache_invalidate_ticker(tmp_path):
+    cache = PageCache(str(tmp_path))
+    for ticker in ("AAPL", "BRK.A", "X:BTCUSD"):
+        cache.put(get_closed_url(ticker), PAGE)
+        cache.put(get_closed_url(ticker, cursor=1672617600000), PAGE)
+
+    assert cache.invalidate_ticker("BRK.A") == 2
+    assert cache.get(get_closed_url("BRK.A")) is None
+    assert cache.get(get_closed_url("AAPL")) == PAGE
+    assert cache.invalidate_ticker("MSFT") == 0
+
+    result = subprocess.run(
+        [sys.executable, page_cache_module.__file__, "--cache_dir", str(tmp_path), "--invalidate_ticker", "X:BTCUSD"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == f"Removed 2 pages of X:BTCUSD from {tmp_path}"
+    assert cache.get(get_closed_url("X:BTCUSD")) is None
+    assert cache.clear() == 2
+
+
+def test_page_cache_write_failure(polygon_stub, page_cache, monkeypatch):
+    def mkstemp(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    # A full disk only costs the cache write, the page is still returned
+    monkeypatch.setattr(page_cache_module.tempfile, "mkstemp", mkstemp)
+    url = get_aggregates_url("TEST", "day", 1, CLOSED_FROM, CLOSED_TO)
+    assert len(fetch_page(url)["results"]) == 30
+    assert page_cache.stats.writes == 0
+    assert page_cache.get(url) is None
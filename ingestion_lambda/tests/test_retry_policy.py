@@ -0,0 +1,86 @@
+import pytest
+import requests
+
+import retry_policy
+from retry_policy import ErrorKind, NonRetryableError, RetryPolicy, RetryStats, classify_error
+
+
+def make_http_error(status: int, retry_after: str | None = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+@pytest.mark.parametrize(
+    "status,kind",
+    [
+        (408, ErrorKind.SERVER_ERROR),
+        (425, ErrorKind.SERVER_ERROR),
+        (429, ErrorKind.RATE_LIMITED),
+        (400, ErrorKind.CLIENT_ERROR),
+        (403, ErrorKind.CLIENT_ERROR),
+        (404, ErrorKind.CLIENT_ERROR),
+        (500, ErrorKind.SERVER_ERROR),
+        (503, ErrorKind.SERVER_ERROR),
+    ],
+)
+def test_classify_http_error(status, kind):
+    assert classify_error(make_http_error(status)) == kind
+
+
+def test_classify_error():
+    assert classify_error(requests.ConnectionError()) == ErrorKind.CONNECTION_ERROR
+    assert classify_error(requests.Timeout()) == ErrorKind.CONNECTION_ERROR
+    assert classify_error(requests.exceptions.ChunkedEncodingError()) == ErrorKind.CONNECTION_ERROR
+    assert classify_error(requests.JSONDecodeError("Expecting value", "", 0)) == ErrorKind.CONNECTION_ERROR
+    assert classify_error(KeyError("results")) == ErrorKind.UNKNOWN
+    assert classify_error(TypeError()) == ErrorKind.UNKNOWN
+
+
+def test_retry_after():
+    policy = RetryPolicy()
+    assert policy.next_delay(0, make_http_error(429, "5")) == (ErrorKind.RATE_LIMITED, 5)
+    assert policy.next_delay(0, make_http_error(503, "0")) == (ErrorKind.SERVER_ERROR, 0)
+    # Capped at max_delay however long the server asks to wait
+    assert policy.next_delay(0, make_http_error(429, "3600")) == (ErrorKind.RATE_LIMITED, 60)
+    assert RetryPolicy(max_delay=10).next_delay(0, make_http_error(429, "30"))[1] == 10
+    # Unparseable values fall back to the backoff
+    assert 0 <= policy.next_delay(0, make_http_error(429, "soon"))[1] <= 1
+
+
+def test_full_jitter(monkeypatch):
+    policy = RetryPolicy(base_delay=0.5, max_delay=8)
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(retry_policy.random, "uniform", uniform)
+    for attempt in range(7):
+        policy.next_delay(attempt, requests.ConnectionError())
+    assert bounds == [(0, 0.5), (0, 1), (0, 2), (0, 4), (0, 8), (0, 8), (0, 8)]
+
+    monkeypatch.undo()
+    delays = [policy.get_delay(3, requests.ConnectionError()) for _ in range(200)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert min(delays) < 1 and max(delays) > 3
+
+
+def test_non_retryable_errors():
+    stats = RetryStats()
+    policy = RetryPolicy(max_retries=2)
+    with pytest.raises(NonRetryableError):
+        policy.next_delay(0, make_http_error(404), stats)
+    with pytest.raises(NonRetryableError):
+        policy.next_delay(0, KeyError("results"), stats)
+    assert stats.retries == 0
+
+    policy.next_delay(0, make_http_error(500, "1"), stats)
+    policy.next_delay(1, make_http_error(429, "2"), stats)
+    with pytest.raises(Exception, match="after 2 retries") as error:
+        policy.next_delay(2, make_http_error(500), stats)
+    assert not isinstance(error.value, NonRetryableError)
+    assert stats == RetryStats(retries=2, wait_seconds=3, errors={"SERVER_ERROR": 1, "RATE_LIMITED": 1})
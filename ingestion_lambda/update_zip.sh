@@ -4,5 +4,5 @@ rm -f $STOCKS_INGESTION_ZIP_NAME
 cd .venv/lib/python3.12/site-packages
 zip ../../../../$STOCKS_INGESTION_ZIP_NAME -r .
 cd ../../../..
-zip -r $STOCKS_INGESTION_ZIP_NAME lambda_function.py
+zip -r $STOCKS_INGESTION_ZIP_NAME *.py
 mv $STOCKS_INGESTION_ZIP_NAME ../packaged_lambda/$STOCKS_INGESTION_ZIP_NAME
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Reports the results of the scheduling load benchmark at the end of the run, see stocks_metadata/test_scheduling_load.py.
+"""
+
+import json
+import os
+
+import pytest
+
+SCHEDULING_LOAD_KEY = pytest.StashKey[list]()
+
+
+def pytest_configure(config):
+    config.stash[SCHEDULING_LOAD_KEY] = []
+
+
+@pytest.fixture
+def scheduling_load_results(request) -> list[dict]:
+    """Results appended here are printed in the terminal summary and saved to SCHEDULING_LOAD_REPORT when set."""
+    return request.config.stash[SCHEDULING_LOAD_KEY]
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash[SCHEDULING_LOAD_KEY]
+    if not results:
+        return
+    terminalreporter.section("scheduling load")
+    terminalreporter.write_line(f"{'endpoint':<36}{'tickers':>8}{'seconds':>9}{'queries':>9}")
+    for result in results:
+        terminalreporter.write_line(
+            f"{result['endpoint']:<36}{result['tickers']:>8}{result['seconds']:>9.3f}{result['queries']:>9}"
+        )
+
+    if path := os.environ.get("SCHEDULING_LOAD_REPORT"):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        terminalreporter.write_line(f"Saved scheduling load results to {path}")
@@ -6,3 +6,8 @@ class Environments(enum.Enum):
     STAGING = "STAGING"
     DEVELOPMENT = "DEVELOPMENT"
     LOCAL = "LOCAL"
+
+
+class IngestionDeployMode(enum.Enum):
+    CONTAINER = "CONTAINER"
+    WORKER = "WORKER"
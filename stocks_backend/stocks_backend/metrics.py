@@ -0,0 +1,135 @@
+import bisect
+import threading
+import time
+from contextlib import ExitStack
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+from stocks_backend.settings import METRICS_EXCLUDED_VIEWS, SLOW_REQUEST_THRESHOLD_MS
+from stocks_backend.utils import get_module_logger
+
+logger = get_module_logger(__file__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Requests that did not resolve to a view are grouped under this label
+UNRESOLVED_VIEW = "unresolved"
+
+
+class Histogram:
+    """Prometheus style cumulative histogram, thread safe."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+class RequestMetrics:
+    """Per view and method histograms of request latency, SQL query count and SQL time."""
+
+    HISTOGRAMS = {
+        "stocks_backend_request_duration_seconds": ("Request latency", LATENCY_BUCKETS),
+        "stocks_backend_request_db_queries": ("SQL queries per request", QUERY_COUNT_BUCKETS),
+        "stocks_backend_request_db_duration_seconds": ("Time spent in SQL per request", LATENCY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._series: dict[tuple[str, str], dict[str, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view: str, method: str, seconds: float, queries: int, db_seconds: float):
+        with self._lock:
+            if (series := self._series.get((view, method))) is None:
+                series = {name: Histogram(buckets) for name, (_, buckets) in self.HISTOGRAMS.items()}
+                self._series[(view, method)] = series
+        for name, value in zip(self.HISTOGRAMS, (seconds, queries, db_seconds)):
+            series[name].observe(value)
+
+    def render(self) -> str:
+        with self._lock:
+            series = dict(self._series)
+        lines = []
+        for name, (description, _) in self.HISTOGRAMS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+            for (view, method), histograms in sorted(series.items()):
+                lines += histograms[name].render(name, f'view="{view}",method="{method}"')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run through it and the time they took."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, SQL query count and SQL time of every request in request_metrics, and logs the requests
+    slower than SLOW_REQUEST_THRESHOLD_MS. Streamed response bodies are produced after it returns, their queries
+    are not counted. Views in METRICS_EXCLUDED_VIEWS are neither recorded nor logged.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        view = request.resolver_match.view_name if request.resolver_match else UNRESOLVED_VIEW
+        if view in METRICS_EXCLUDED_VIEWS:
+            return response
+        request_metrics.observe(view, request.method or "", seconds, counter.queries, counter.seconds)
+        if seconds * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({view}): {seconds * 1000:.0f}ms, "
+                f"{counter.queries} queries taking {counter.seconds * 1000:.0f}ms"
+            )
+        return response
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    return HttpResponse(request_metrics.render(), content_type="text/plain; version=0.0.4")
@@ -17,7 +17,7 @@ from stocks_backend.utils import get_module_logger
 
 logger = get_module_logger(__file__)
 
-from stocks_backend.enums import Environments
+from stocks_backend.enums import Environments, IngestionDeployMode
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "stocks_backend.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -127,12 +128,38 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Ingestion definitions
 MAX_PARALLEL_INGESTIONS = 2
 ENVIRONMENT = Environments.LOCAL
+# CONTAINER starts one ingestion container per job, WORKER leaves the queue to long lived ingestion workers
+INGESTION_DEPLOY_MODE = IngestionDeployMode(
+    os.environ.get("INGESTION_DEPLOY_MODE", IngestionDeployMode.CONTAINER.value)
+)
+MAX_INGESTION_LEASE_SIZE = 50
+# Longest time the wait_for_ingestions long poll keeps a request open. Every poll holds a server worker and a database
+# connection listening for notifications while it waits, so the backend needs a worker per polling orchestrator on top
+# of the ones serving other requests, and this stays well below the worker timeout (30 seconds by default in gunicorn)
+MAX_INGESTION_WAIT_SECONDS = 20
+# Deploying/in progress ingestions without a status update for this long are marked as failed
+STALE_INGESTION_TIMEOUT_MINUTES = 20
+# Claimed ingestions hold a lease renewed on every status update, an expired lease marks the ingestion as failed
+INGESTION_LEASE_MINUTES = STALE_INGESTION_TIMEOUT_MINUTES
+# Finished ingestions older than this are moved to the archive table by the archive_ingestions command
+INGESTION_ARCHIVE_AFTER_DAYS = 30
+INGESTION_ARCHIVE_BATCH_SIZE = 10_000
+# Key of the postgres advisory lock that serializes capacity checks between backends
+INGESTION_CAPACITY_LOCK_KEY = 4_242_001
+
+# Pagination of the list endpoints, format=ndjson streams rows from the database in chunks instead
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+STREAM_CHUNK_SIZE = 2000
 
 LOCAL_DOCKER_NAME_DEFAULT = "ingestion_lambda:latest"
 LOCAL_INGESTION_BUCKET_DEFAULT = "stocks"
 LOCAL_ORG_DEFAULT = "MyOrg"
 
 LOCAL_ORG_SETTING_KEY = "LOCAL_ORG"
+# AppSettings are cached per process for this long, or in the given Django cache to share them between workers
+APP_SETTINGS_CACHE_TTL_SECONDS = 60
+APP_SETTINGS_CACHE_ALIAS = os.environ.get("APP_SETTINGS_CACHE_ALIAS") or None
 LOCAL_INGESTION_BUCKET_SETTING_KEY = "LOCAL_INGESTION_BUCKET"
 LOCAL_DOCKER_SETTINGS_KEY = "LOCAL_DOCKER_NAME"
 
@@ -141,4 +168,34 @@ LOCAL_INFLUX_CONTAINER_NAME = "marketdataml-influxdb2-1"
 INFLUX_URL = f"http://{LOCAL_INFLUX_CONTAINER_NAME}:8086"
 INGESTION_STATUS_UPDATE_URL = f"http://stocks-backend:8000/stocks_metadata/update_ingestion_status"
 LOCAL_DOCKER_NETWORK_NAME = "marketdataml_default"
+# Volume mounted in every ingestion container to cache the Polygon pages between runs, shared with the worker
+INGESTION_PAGE_CACHE_VOLUME = "marketdataml_polygon-page-cache"
+INGESTION_PAGE_CACHE_DIR = "/var/cache/polygon"
 POLYGON_API_KEY = os.environ.get("POLYGON_API_KEY")
+INFLUX_QUERY_TIMEOUT_MS = 10_000
+# Bars read by the bar reader are cached here until a new ingestion of their ticker finishes, empty disables the cache
+BAR_READER_CACHE_DIR = os.environ.get("BAR_READER_CACHE_DIR", os.path.join(Path.home(), ".cache", "stocks_ml", "bars"))
+BAR_READER_CONCURRENCY = int(os.environ.get("BAR_READER_CONCURRENCY", "8"))
+# Default output of the export_training_dataset command
+TRAINING_DATASET_DIR = os.environ.get(
+    "TRAINING_DATASET_DIR", os.path.join(Path.home(), ".local", "share", "stocks_ml", "training_dataset")
+)
+# Replaced generations of the training dataset stay readable this long, for jobs that opened it before an export
+TRAINING_DATASET_RETENTION_HOURS = float(os.environ.get("TRAINING_DATASET_RETENTION_HOURS", "24"))
+
+# Plans ingestion windows from the bars already stored in influx instead of the ingestion history only
+INGESTION_GAP_PLANNER_ENABLED = os.environ.get("INGESTION_GAP_PLANNER_ENABLED", "False") == "True"
+# Bars further apart than this are considered a gap, long enough to skip weekends and market holidays
+INGESTION_GAP_MIN_DAYS = 4
+# Gaps are only looked for this many days before the last successful ingestion of a ticker, bounding every scan
+INGESTION_GAP_LOOKBACK_DAYS = int(os.environ.get("INGESTION_GAP_LOOKBACK_DAYS", "30"))
+
+# Requests slower than this are logged with their SQL query count and time, all are recorded at /metrics
+SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+# Long polls are slow by design, they would fill the top latency bucket and the slow request log
+METRICS_EXCLUDED_VIEWS = {"wait_for_ingestions"}
+
+# Ingestion containers are started through the Docker Engine API on this socket, by this many launcher threads
+DOCKER_SOCKET_PATH = os.environ.get("DOCKER_SOCKET_PATH", "/var/run/docker.sock")
+DOCKER_API_TIMEOUT_SECONDS = 30
+CONTAINER_LAUNCHER_WORKERS = 4
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from stocks_backend import metrics
+
 urlpatterns = [
     path("stocks_metadata/", include("stocks_metadata.urls")),
     path("admin/", admin.site.urls),
-]
\ No newline at end of file
+    path("metrics", metrics.metrics, name="metrics"),
+]
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class StocksMetadataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stocks_metadata'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from stocks_metadata.models import AppSettings
+        from stocks_metadata.settings_cache import invalidate_app_settings
+
+        post_save.connect(invalidate_app_settings, sender=AppSettings, dispatch_uid="invalidate_app_settings_save")
+        post_delete.connect(invalidate_app_settings, sender=AppSettings, dispatch_uid="invalidate_app_settings_delete")
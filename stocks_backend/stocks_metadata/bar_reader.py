@@ -0,0 +1,251 @@
+"""
+Read path of the bars stored in influx, into columnar NumPy arrays or pandas DataFrames. Influx pivots the fields into
+one row per bar, tickers are queried concurrently, and results are cached on disk until a new ingestion of their
+ticker finishes.
+"""
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator
+import numpy as np
+from django.db.models import Max
+from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.domain.dialect import Dialect
+
+from stocks_backend.settings import (
+    BAR_READER_CACHE_DIR,
+    BAR_READER_CONCURRENCY,
+    INFLUX_QUERY_TIMEOUT_MS,
+    INFLUX_TOKEN,
+    INFLUX_URL,
+    LOCAL_INGESTION_BUCKET_DEFAULT,
+    LOCAL_INGESTION_BUCKET_SETTING_KEY,
+    LOCAL_ORG_DEFAULT,
+    LOCAL_ORG_SETTING_KEY,
+)
+from stocks_backend.utils import get_module_logger
+from stocks_metadata.ingestion_planner import STOCK_DATA_MEASUREMENT, Window
+from stocks_metadata.models import StockIngestion, StockIngestionArchive
+from stocks_metadata.settings_cache import app_settings_cache
+
+logger = get_module_logger(__file__)
+
+# Fields written by the ingestion, time holds the Polygon bar timestamp in milliseconds
+PRICE_FIELDS = ("open", "high", "low", "close", "volume")
+TIME_FIELD = "time"
+# Bumped whenever the cached layout changes, so old entries are never read
+CACHE_VERSION = 1
+
+
+@dataclass
+class Bars:
+    """Bars of a ticker as one array per field, ordered by time."""
+
+    ticker: str
+    time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @classmethod
+    def empty(cls, ticker: str) -> "Bars":
+        return cls(ticker, np.array([], dtype="datetime64[ms]"), *(np.array([]) for _ in PRICE_FIELDS))
+
+    def to_dataframe(self):
+        """DataFrame indexed by time, pandas is only needed by this method."""
+        import pandas as pd
+
+        return pd.DataFrame(
+            {field: getattr(self, field) for field in PRICE_FIELDS}, index=pd.DatetimeIndex(self.time, name="time")
+        )
+
+
+def build_bars_query(ticker: str, bucket: str, start: datetime.datetime, stop: datetime.datetime) -> str:
+    fields = " or ".join(f'r._field == "{field}"' for field in (TIME_FIELD, *PRICE_FIELDS))
+    return f"""
+from(bucket: {json.dumps(bucket)})
+    |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+    |> filter(fn: (r) => r._measurement == "{STOCK_DATA_MEASUREMENT}" and r.ticker == {json.dumps(ticker)})
+    |> filter(fn: (r) => {fields})
+    |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+    |> group()
+    |> keep(columns: {json.dumps([TIME_FIELD, *PRICE_FIELDS])})
+    |> sort(columns: ["{TIME_FIELD}"])
+"""
+
+
+def parse_bars_csv(ticker: str, text: str) -> Bars:
+    """Parses the CSV of build_bars_query, without annotations, in a single pass over each column."""
+    header, _, body = text.replace("\r\n", "\n").lstrip().partition("\n")
+    if not body.strip():
+        return Bars.empty(ticker)
+    columns = header.strip().split(",")
+    names = (TIME_FIELD, *PRICE_FIELDS)
+    usecols = [columns.index(name) for name in names]
+    try:
+        values = np.loadtxt(io.StringIO(body), delimiter=",", usecols=usecols, ndmin=2)
+    except ValueError:
+        # Bars with a field missing, influx leaves the cell empty
+        values = np.genfromtxt(io.StringIO(body), delimiter=",", usecols=usecols, ndmin=2, filling_values=np.nan)
+    return Bars(ticker, values[:, 0].astype("int64").astype("datetime64[ms]"), *(values[:, i] for i in range(1, 6)))
+
+
+def get_ingestion_watermarks(tickers: list[str]) -> dict[str, str]:
+    """Finish time of the last ingestion of every ticker, cached bars of a ticker are stale once it changes."""
+    watermarks: dict[str, datetime.datetime] = {}
+    for model in (StockIngestion, StockIngestionArchive):
+        finished = (
+            model.objects.filter(ticker_id__in=tickers, ingestion_finished_at__isnull=False)
+            .values("ticker_id")
+            .annotate(last_finished_at=Max("ingestion_finished_at"))
+            .values_list("ticker_id", "last_finished_at")
+        )
+        for ticker, finished_at in finished:
+            watermarks[ticker] = max(finished_at, watermarks.get(ticker, finished_at))
+    return {ticker: finished_at.isoformat() for ticker, finished_at in watermarks.items()}
+
+
+class BarCache:
+    """Bars stored as .npz files, one per query, along with the ingestion watermark they were read at."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _get_path(self, ticker: str, bucket: str, start: datetime.datetime, stop: datetime.datetime) -> str:
+        key = json.dumps([CACHE_VERSION, ticker, bucket, start.isoformat(), stop.isoformat()])
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".npz")
+
+    def get(self, ticker, bucket, start, stop, watermark: str) -> Bars | None:
+        try:
+            with np.load(self._get_path(ticker, bucket, start, stop), allow_pickle=False) as entry:
+                if str(entry["watermark"]) != watermark:
+                    return None
+                return Bars(ticker, entry[TIME_FIELD], *(entry[field] for field in PRICE_FIELDS))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable bar cache entry of {ticker}: {e}")
+            return None
+
+    def put(self, bars: Bars, bucket, start, stop, watermark: str):
+        path = self._get_path(bars.ticker, bucket, start, stop)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    watermark=np.array(watermark),
+                    **{TIME_FIELD: bars.time},
+                    **{field: getattr(bars, field) for field in PRICE_FIELDS},
+                )
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write bar cache entry of {bars.ticker}: {e}")
+
+
+class BarReader:
+    """Reads the bars of many tickers from a bucket, the cache directory is optional."""
+
+    def __init__(
+        self,
+        bucket: str,
+        org: str,
+        cache_dir: str | None = BAR_READER_CACHE_DIR,
+        concurrency: int = BAR_READER_CONCURRENCY,
+    ):
+        self.bucket = bucket
+        self.org = org
+        self.cache = BarCache(cache_dir) if cache_dir else None
+        self.concurrency = concurrency
+
+    @classmethod
+    def from_settings(cls, **kwargs) -> "BarReader":
+        """Reader of the bucket and org the ingestions write to."""
+        return cls(
+            app_settings_cache.get(LOCAL_INGESTION_BUCKET_SETTING_KEY) or LOCAL_INGESTION_BUCKET_DEFAULT,
+            app_settings_cache.get(LOCAL_ORG_SETTING_KEY) or LOCAL_ORG_DEFAULT,
+            **kwargs,
+        )
+
+    def query_bars(
+        self, client: InfluxDBClient, ticker: str, start: datetime.datetime, stop: datetime.datetime
+    ) -> Bars:
+        response = client.query_api().query_raw(
+            build_bars_query(ticker, self.bucket, start, stop),
+            org=self.org,
+            dialect=Dialect(header=True, annotations=[], delimiter=","),
+        )
+        return parse_bars_csv(ticker, response.data.decode())
+
+    def read(self, tickers: list[str], start: datetime.datetime, stop: datetime.datetime) -> dict[str, Bars]:
+        """Bars of every ticker between start and stop, stop excluded. Tickers without bars get empty arrays."""
+        watermarks = get_ingestion_watermarks(tickers) if self.cache else {}
+        results: dict[str, Bars] = {}
+        missing = []
+        for ticker in dict.fromkeys(tickers):
+            cached = (
+                self.cache.get(ticker, self.bucket, start, stop, watermarks.get(ticker, "")) if self.cache else None
+            )
+            if cached is not None:
+                results[ticker] = cached
+            else:
+                missing.append(ticker)
+        logger.info(f"Reading bars of {len(missing)} tickers from influx, {len(results)} from the cache")
+        if missing:
+            self.fetch_bars(missing, start, stop, watermarks, results)
+        return {ticker: results[ticker] for ticker in dict.fromkeys(tickers)}
+
+    def fetch_bars(
+        self,
+        tickers: list[str],
+        start: datetime.datetime,
+        stop: datetime.datetime,
+        watermarks: dict[str, str],
+        results: dict[str, Bars],
+    ):
+        """Queries influx for the bars of every ticker and caches them."""
+        for bars in self.iter_bars({ticker: (start, stop) for ticker in tickers}):
+            results[bars.ticker] = bars
+            if self.cache:
+                self.cache.put(bars, self.bucket, start, stop, watermarks.get(bars.ticker, ""))
+
+    def iter_bars(self, windows: dict[str, Window]) -> Iterator[Bars]:
+        """
+        Queries influx for the window of every ticker, concurrency tickers at a time, and yields the bars in order,
+        without the cache. At most twice concurrency results are held in memory at once.
+        """
+        with InfluxDBClient(
+            url=INFLUX_URL,
+            token=INFLUX_TOKEN or "",
+            timeout=INFLUX_QUERY_TIMEOUT_MS,
+            enable_gzip=True,
+            connection_pool_maxsize=self.concurrency,
+        ) as client:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bar-reader") as executor:
+                pending: deque[Future[Bars]] = deque()
+                for ticker, (start, stop) in windows.items():
+                    pending.append(executor.submit(self.query_bars, client, ticker, start, stop))
+                    if len(pending) >= 2 * self.concurrency:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+
+    def read_dataframe(self, tickers: list[str], start: datetime.datetime, stop: datetime.datetime):
+        """Bars of every ticker in one DataFrame indexed by ticker and time."""
+        import pandas as pd
+
+        frames = {ticker: bars.to_dataframe() for ticker, bars in self.read(tickers, start, stop).items()}
+        return pd.concat(frames, names=["ticker", "time"])
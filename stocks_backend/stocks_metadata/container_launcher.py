@@ -0,0 +1,172 @@
+"""
+Starts ingestion containers through the Docker Engine API on the mounted unix socket. Launches run on a small thread
+pool once the claiming transaction commits, so the request that claimed the ingestions never waits on docker.
+"""
+
+import datetime
+import http.client
+import json
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.db import close_old_connections, transaction
+
+from stocks_backend.settings import CONTAINER_LAUNCHER_WORKERS, DOCKER_API_TIMEOUT_SECONDS, DOCKER_SOCKET_PATH
+from stocks_backend.utils import get_module_logger
+from stocks_metadata.models import IngestionStatus, StockIngestion
+from stocks_metadata.queue_events import QueueEvent, notify_ingestion_queue
+
+logger = get_module_logger(__file__)
+
+INGESTION_ID_LABEL = "stocks_ml.ingestion_id"
+
+
+class DockerEngineError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker engine returned {status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DockerEngineClient:
+    """Minimal Docker Engine API client keeping one keep-alive connection per thread."""
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET_PATH, timeout: float = DOCKER_API_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get_connection(self) -> UnixHTTPConnection:
+        if (conn := getattr(self._local, "connection", None)) is None:
+            conn = self._local.connection = UnixHTTPConnection(self.socket_path, self.timeout)
+        return conn
+
+    def request(self, method: str, path: str, body: dict | None = None) -> dict | None:
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            conn = self._get_connection()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except Exception as e:
+                # A timed out or failed request leaves the connection unusable, the next one gets a new connection
+                conn.close()
+                self._local.connection = None
+                # The engine closed the idle keep-alive connection, reconnect once
+                reconnect = isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError))
+                if attempt or not reconnect:
+                    raise
+
+        if response.status >= 400:
+            try:
+                message = json.loads(data).get("message", "")
+            except ValueError:
+                message = data.decode(errors="replace")
+            raise DockerEngineError(response.status, message)
+        return json.loads(data) if data else None
+
+    def run_container(self, config: dict) -> str:
+        """Creates and starts a container, returning its id."""
+        container_id = self.request("POST", "/containers/create", config)["Id"]
+        try:
+            self.request("POST", f"/containers/{container_id}/start")
+        except Exception:
+            # AutoRemove only applies to containers that ran, a container that never started would be left behind
+            self.remove_container(container_id)
+            raise
+        return container_id
+
+    def remove_container(self, container_id: str):
+        """Force removes a container, best effort, a failure is only logged."""
+        try:
+            self.request("DELETE", f"/containers/{container_id}?force=1")
+        except Exception as e:
+            logger.error(f"Failed to remove container {container_id}")
+            logger.error(e)
+
+
+def build_container_config(
+    image: str, network: str, environment: dict, ingestion_id: int, volumes: dict[str, str] | None = None
+) -> dict:
+    """Container config of an ingestion, volumes maps the named volumes to mount to their path in the container."""
+    return {
+        "Image": image,
+        "Env": [f"{key}={value}" for key, value in environment.items()],
+        "Labels": {INGESTION_ID_LABEL: str(ingestion_id)},
+        "HostConfig": {
+            "AutoRemove": True,
+            "NetworkMode": network,
+            "Binds": [f"{volume}:{path}" for volume, path in (volumes or {}).items()],
+        },
+    }
+
+
+class ContainerLauncher:
+    """Launches ingestion containers off the request path and records their container ids."""
+
+    def __init__(self, client: DockerEngineClient | None = None, workers: int = CONTAINER_LAUNCHER_WORKERS):
+        self.client = client or DockerEngineClient()
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="container-launcher")
+            return self._executor
+
+    def submit_on_commit(self, ingestion_id: int, config: dict):
+        """Queues the launch for when the current transaction commits, the claim is then visible to the container."""
+        submitted_at = time.perf_counter()
+        transaction.on_commit(lambda: self.submit(ingestion_id, config, submitted_at))
+
+    def submit(self, ingestion_id: int, config: dict, submitted_at: float | None = None) -> Future:
+        return self._get_executor().submit(self._run, ingestion_id, config, submitted_at or time.perf_counter())
+
+    def _run(self, ingestion_id: int, config: dict, submitted_at: float):
+        try:
+            self.launch(ingestion_id, config, submitted_at)
+        finally:
+            close_old_connections()
+
+    def launch(self, ingestion_id: int, config: dict, submitted_at: float | None = None) -> str | None:
+        try:
+            container_id = self.client.run_container(config)
+        except (DockerEngineError, OSError, http.client.HTTPException) as e:
+            logger.error(f"Failed to launch the container of ingestion {ingestion_id}: {e}")
+            mark_launch_failed(ingestion_id)
+            return None
+
+        StockIngestion.objects.filter(id=ingestion_id).update(container_id=container_id)
+        elapsed = f" in {(time.perf_counter() - submitted_at) * 1000:.0f}ms" if submitted_at else ""
+        logger.info(f"Launched container {container_id[:12]} for ingestion {ingestion_id}{elapsed}")
+        return container_id
+
+
+@transaction.atomic()
+def mark_launch_failed(ingestion_id: int):
+    failed = StockIngestion.objects.filter(id=ingestion_id, ingestion_status=IngestionStatus.DEPLOYING).update(
+        ingestion_status=IngestionStatus.FAILURE,
+        ingestion_finished_at=datetime.datetime.now(tz=datetime.timezone.utc),
+        lease_expires_at=None,
+    )
+    if failed:
+        notify_ingestion_queue(QueueEvent.FINISHED)
+
+
+container_launcher = ContainerLauncher()
@@ -0,0 +1,153 @@
+"""
+Exports the bars of the tickers into a training dataset, see training_dataset for its layout. Each export only reads
+from influx the windows of the successful ingestions that finished since the previous one, and merges them into the
+columns already exported.
+"""
+
+import datetime
+import os
+import shutil
+from dataclasses import dataclass
+
+from stocks_backend.settings import TRAINING_DATASET_RETENTION_HOURS
+from stocks_backend.utils import get_module_logger
+from stocks_metadata.bar_reader import PRICE_FIELDS, BarReader, Bars
+from stocks_metadata.models import IngestionStatus, StockIngestion, StockIngestionArchive, Tickers
+from stocks_metadata.training_dataset import (
+    TIME_COLUMN,
+    Columns,
+    load_columns,
+    read_manifest,
+    slice_columns,
+    write_generation,
+    write_manifest,
+)
+
+logger = get_module_logger(__file__)
+
+# The manifest is saved every this many exported tickers, an interrupted export resumes from there
+MANIFEST_FLUSH_EVERY = 100
+
+
+@dataclass
+class ExportWindow:
+    start: datetime.datetime
+    stop: datetime.datetime
+    finished_at: datetime.datetime
+
+    def extend(self, start: datetime.datetime, stop: datetime.datetime, finished_at: datetime.datetime):
+        self.start = min(self.start, start)
+        self.stop = max(self.stop, stop)
+        self.finished_at = max(self.finished_at, finished_at)
+
+
+def get_day_start(value: datetime.datetime) -> datetime.datetime:
+    return datetime.datetime.combine(value.date(), datetime.time(), tzinfo=datetime.timezone.utc)
+
+
+def get_export_windows(
+    tickers: list[str], exported_finished_at: dict[str, datetime.datetime]
+) -> dict[str, ExportWindow]:
+    """
+    Window covered by the successful ingestions of every ticker that finished after its last export, live and
+    archived. Ingestions fetch whole days, so windows are widened to whole days.
+    """
+    # Tickers never exported need their whole history, otherwise only what finished after the oldest export
+    all_exported = exported_finished_at and len(exported_finished_at) == len(set(tickers))
+    since = min(exported_finished_at.values()) if all_exported else None
+    successes = [
+        StockIngestion.objects.filter(ingestion_status=IngestionStatus.SUCCESS).values_list(
+            "ticker_id", "metadata__start_ingestion_time", "end_ingestion_time", "ingestion_finished_at"
+        ),
+        StockIngestionArchive.objects.filter(ingestion_status=IngestionStatus.SUCCESS).values_list(
+            "ticker_id", "start_ingestion_time", "end_ingestion_time", "ingestion_finished_at"
+        ),
+    ]
+    windows: dict[str, ExportWindow] = {}
+    for queryset in successes:
+        queryset = queryset.filter(ticker_id__in=tickers, ingestion_finished_at__isnull=False)
+        if since is not None:
+            queryset = queryset.filter(ingestion_finished_at__gt=since)
+        for ticker, start, end, finished_at in queryset.iterator(chunk_size=10_000):
+            if (exported := exported_finished_at.get(ticker)) and finished_at <= exported:
+                continue
+            start, stop = get_day_start(start), get_day_start(end) + datetime.timedelta(days=1)
+            if ticker in windows:
+                windows[ticker].extend(start, stop, finished_at)
+            else:
+                windows[ticker] = ExportWindow(start, stop, finished_at)
+    return windows
+
+
+def get_bars_columns(bars: Bars) -> Columns:
+    return {TIME_COLUMN: bars.time, **{field: getattr(bars, field) for field in PRICE_FIELDS}}
+
+
+def remove_retired_generations(path: str, manifest: dict, retention: datetime.timedelta) -> int:
+    """Removes the replaced generations retired longer than retention ago, returns how many were removed."""
+    cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - retention
+    kept = []
+    for retired in manifest["retired"]:
+        if datetime.datetime.fromisoformat(retired["retired_at"]) <= cutoff:
+            shutil.rmtree(os.path.join(path, retired["path"]), ignore_errors=True)
+        else:
+            kept.append(retired)
+    removed = len(manifest["retired"]) - len(kept)
+    manifest["retired"] = kept
+    return removed
+
+
+def export_training_dataset(
+    path: str,
+    tickers: list[str] | None = None,
+    full: bool = False,
+    reader: BarReader | None = None,
+    retention: datetime.timedelta = datetime.timedelta(hours=TRAINING_DATASET_RETENTION_HOURS),
+) -> int:
+    """
+    Exports the bars of the tickers, every ticker by default, to the dataset at path. full re-exports everything
+    instead of the windows ingested since the previous export. Generations replaced more than retention ago are
+    removed. Returns the number of tickers exported.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path)
+    manifest.setdefault("retired", [])
+    symbols = list(dict.fromkeys(tickers or Tickers.objects.order_by("symbol").values_list("symbol", flat=True)))
+    selected = set(symbols)
+    exported_finished_at = (
+        {}
+        if full
+        else {
+            ticker: datetime.datetime.fromisoformat(entry["exported_finished_at"])
+            for ticker, entry in manifest["tickers"].items()
+            if ticker in selected
+        }
+    )
+    windows = get_export_windows(symbols, exported_finished_at)
+    logger.info(f"Exporting {len(windows)} of {len(symbols)} tickers to {path}")
+
+    reader = reader or BarReader.from_settings(cache_dir=None)
+    exported = 0
+    for bars in reader.iter_bars({ticker: (window.start, window.stop) for ticker, window in windows.items()}):
+        window = windows[bars.ticker]
+        previous = manifest["tickers"].get(bars.ticker)
+        parts = [get_bars_columns(bars)]
+        if previous and not full:
+            # Rows of the window are replaced, the ones around it kept
+            before, after = slice_columns(load_columns(path, previous), window.start, window.stop)
+            parts = [before, *parts, after]
+
+        entry = write_generation(path, bars.ticker, previous["generation"] + 1 if previous else 1, parts)
+        manifest["tickers"][bars.ticker] = entry | {"exported_finished_at": window.finished_at.isoformat()}
+        if previous:
+            retired_at = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+            manifest["retired"].append({"path": previous["path"], "retired_at": retired_at})
+        exported += 1
+        if exported % MANIFEST_FLUSH_EVERY == 0:
+            write_manifest(path, manifest)
+            logger.info(f"Exported {exported} of {len(windows)} tickers")
+
+    if removed := remove_retired_generations(path, manifest, retention):
+        logger.info(f"Removed {removed} retired generations")
+    write_manifest(path, manifest)
+    return exported
@@ -0,0 +1,81 @@
+import datetime
+from django.db import connection, transaction
+
+from stocks_backend.utils import get_module_logger
+from stocks_metadata.models import IngestionMetadata, IngestionStatus, StockIngestion, StockIngestionArchive
+
+logger = get_module_logger(__file__)
+
+ARCHIVED_COLUMNS = [
+    "id",
+    "ticker_id",
+    "ingestion_status",
+    "ingestion_started_at",
+    "ingestion_finished_at",
+    "ingestion_deployed_at",
+    "created_at",
+    "fetch_retries",
+    "fetch_retry_wait_seconds",
+    "end_ingestion_time",
+]
+METADATA_COLUMNS = ["start_ingestion_time", "delta_category", "delta_multiplier"]
+
+
+def build_archive_batch_query() -> str:
+    """
+    Moves one batch of finished ingestions to the archive in a single statement: deletes them from StockIngestion,
+    inserts them with their metadata into the archive, then deletes the metadata. The last successful ingestion of
+    every ticker is kept, since planning the next ingestions starts from it.
+    """
+    ingestion = StockIngestion._meta.db_table
+    metadata = IngestionMetadata._meta.db_table
+    archive = StockIngestionArchive._meta.db_table
+    columns = ARCHIVED_COLUMNS + METADATA_COLUMNS
+    return f"""
+WITH moved AS (
+    DELETE FROM {ingestion}
+    WHERE id IN (
+        SELECT id FROM {ingestion}
+        WHERE ingestion_status IN (%(success)s, %(failure)s)
+            AND created_at < %(cutoff)s
+            AND id NOT IN (
+                SELECT DISTINCT ON (ticker_id) id FROM {ingestion}
+                WHERE ingestion_status = %(success)s
+                ORDER BY ticker_id, end_ingestion_time DESC
+            )
+        ORDER BY id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *
+), archived AS (
+    INSERT INTO {archive} ({", ".join(columns)}, archived_at)
+    SELECT {", ".join(f"moved.{column}" for column in ARCHIVED_COLUMNS)},
+        {", ".join(f"m.{column}" for column in METADATA_COLUMNS)}, %(now)s
+    FROM moved JOIN {metadata} m ON m.id = moved.metadata_id
+)
+DELETE FROM {metadata} WHERE id IN (SELECT metadata_id FROM moved)
+"""
+
+
+def archive_finished_ingestions(cutoff: datetime.datetime, batch_size: int) -> int:
+    """Archives every finished ingestion created before cutoff, one short transaction per batch."""
+    query = build_archive_batch_query()
+    archived = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                query,
+                {
+                    "success": IngestionStatus.SUCCESS,
+                    "failure": IngestionStatus.FAILURE,
+                    "cutoff": cutoff,
+                    "batch_size": batch_size,
+                    "now": datetime.datetime.now(tz=datetime.timezone.utc),
+                },
+            )
+            moved = cursor.rowcount
+        archived += moved
+        logger.info(f"Archived a batch of {moved} finished ingestions")
+        if moved < batch_size:
+            return archived
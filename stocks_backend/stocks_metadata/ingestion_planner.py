@@ -0,0 +1,163 @@
+import datetime
+import json
+from dataclasses import dataclass, field
+from influxdb_client.client.influxdb_client import InfluxDBClient
+
+from stocks_backend.settings import (
+    INFLUX_QUERY_TIMEOUT_MS,
+    INFLUX_TOKEN,
+    INFLUX_URL,
+    INGESTION_GAP_LOOKBACK_DAYS,
+    INGESTION_GAP_MIN_DAYS,
+)
+from stocks_backend.utils import get_module_logger
+
+logger = get_module_logger(__file__)
+
+DEFAULT_INGESTION_START = datetime.datetime(2023, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc)
+MAX_INGESTION_WINDOW = datetime.timedelta(days=30)
+MIN_INGESTION_WINDOW = datetime.timedelta(days=1)
+# Bounds how many gap windows a single ticker can put on the queue at once
+MAX_WINDOWS_PER_TICKER = 10
+STOCK_DATA_MEASUREMENT = "stock_data"
+# Tickers per coverage query, matched with equalities that influx pushes down to storage
+COVERAGE_QUERY_CHUNK_SIZE = 100
+
+Window = tuple[datetime.datetime, datetime.datetime]
+
+
+@dataclass
+class StoredCoverage:
+    """What influx already holds for a ticker: the last stored bar and the gaps between stored bars."""
+
+    last: datetime.datetime
+    gaps: list[Window] = field(default_factory=list)
+
+
+def get_scan_start(last_end_time: datetime.datetime | None) -> datetime.datetime:
+    """
+    Where to look for stored bars of a ticker. Only the lookback before its last successful ingestion is scanned,
+    older gaps were found when the ingestions that followed them were planned.
+    """
+    if last_end_time is None:
+        return DEFAULT_INGESTION_START
+    return max(DEFAULT_INGESTION_START, last_end_time - datetime.timedelta(days=INGESTION_GAP_LOOKBACK_DAYS))
+
+
+def build_coverage_query(
+    symbols: list[str], bucket: str, start: datetime.datetime, stop: datetime.datetime, min_gap: datetime.timedelta
+) -> str:
+    ticker_filter = " or ".join(f"r.ticker == {json.dumps(symbol)}" for symbol in symbols)
+    return f"""
+data = from(bucket: {json.dumps(bucket)})
+    |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+    |> filter(fn: (r) => r._measurement == "{STOCK_DATA_MEASUREMENT}" and r._field == "close")
+    |> filter(fn: (r) => {ticker_filter})
+    |> group(columns: ["ticker"])
+    |> keep(columns: ["ticker", "_time", "_value"])
+
+data |> last() |> yield(name: "last")
+data
+    |> elapsed(unit: 1s)
+    |> filter(fn: (r) => r.elapsed > {int(min_gap.total_seconds())})
+    |> yield(name: "gaps")
+"""
+
+
+def get_coverage_chunks(scan_starts: dict[str, datetime.datetime]) -> list[tuple[list[str], datetime.datetime]]:
+    """Splits the tickers into query chunks of similar scan starts, each scanned from the earliest start in it."""
+    symbols = sorted(scan_starts, key=lambda symbol: (scan_starts[symbol], symbol))
+    chunks = []
+    for i in range(0, len(symbols), COVERAGE_QUERY_CHUNK_SIZE):
+        chunk = symbols[i : i + COVERAGE_QUERY_CHUNK_SIZE]
+        chunks.append((chunk, scan_starts[chunk[0]]))
+    return chunks
+
+
+def get_stored_coverage(
+    scan_starts: dict[str, datetime.datetime], bucket: str, org: str, stop: datetime.datetime
+) -> dict[str, StoredCoverage]:
+    """
+    Asks influx for the last stored bar and the gaps of every symbol since its scan start, one query per chunk of
+    COVERAGE_QUERY_CHUNK_SIZE symbols.
+    """
+    last_times: dict[str, datetime.datetime] = {}
+    gaps: dict[str, list[Window]] = {}
+    min_gap = datetime.timedelta(days=INGESTION_GAP_MIN_DAYS)
+    with InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN or "", timeout=INFLUX_QUERY_TIMEOUT_MS) as client:
+        query_api = client.query_api()
+        for symbols, start in get_coverage_chunks(scan_starts):
+            for table in query_api.query(build_coverage_query(symbols, bucket, start, stop, min_gap), org=org):
+                for record in table.records:
+                    symbol = record.values["ticker"]
+                    if record.values["result"] == "last":
+                        last_times[symbol] = record.get_time()
+                    else:
+                        gap_end = record.get_time()
+                        gaps.setdefault(symbol, []).append(
+                            (gap_end - datetime.timedelta(seconds=record.values["elapsed"]), gap_end)
+                        )
+
+    return {symbol: StoredCoverage(last=last, gaps=gaps.get(symbol, [])) for symbol, last in last_times.items()}
+
+
+def get_stored_coverage_or_empty(
+    last_end_times: dict[str, datetime.datetime | None], bucket: str, org: str, stop: datetime.datetime
+) -> dict[str, StoredCoverage]:
+    """
+    Stored coverage of every symbol, scanned from the lookback before its last successful ingestion end. Returns
+    nothing when influx is unavailable.
+    """
+    if not last_end_times:
+        return {}
+    scan_starts = {symbol: get_scan_start(last_end_time) for symbol, last_end_time in last_end_times.items()}
+    try:
+        return get_stored_coverage(scan_starts, bucket, org, stop)
+    except Exception as e:
+        logger.error("Failed to get stored coverage from influx, planning from ingestion history only")
+        logger.error(e)
+        return {}
+
+
+def split_window(start: datetime.datetime, end: datetime.datetime) -> list[Window]:
+    windows = []
+    while start < end:
+        windows.append((start, min(end, start + MAX_INGESTION_WINDOW)))
+        start = windows[-1][1]
+    return windows
+
+
+def merge_windows(windows: list[Window]) -> list[Window]:
+    """Sorts the windows and merges the ones that overlap or touch, e.g. the chunks of a split window."""
+    merged: list[Window] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def plan_ingestion_windows(
+    start: datetime.datetime,
+    now: datetime.datetime,
+    coverage: StoredCoverage | None = None,
+    success_windows: list[Window] | None = None,
+) -> list[Window]:
+    """
+    Returns the windows that still need to be ingested for a ticker, oldest first.
+    start is where the ticker's ingestion history ends. When influx holds data past it, e.g. partial writes of a
+    failed run, ingestion resumes from the last stored bar instead. Gaps between stored bars are ingested again
+    unless successful ingestions already covered them, in which case Polygon simply had no bars there. The forward
+    window always gets a slot, so a long gap never stops new data from being ingested.
+    """
+    gap_windows: list[Window] = []
+    if coverage:
+        covered = merge_windows(success_windows or [])
+        for gap_start, gap_end in coverage.gaps:
+            if not any(s <= gap_start and gap_end <= e for s, e in covered):
+                gap_windows.extend(split_window(gap_start, gap_end))
+        start = max(start, coverage.last)
+
+    forward = [(start, min(now, start + MAX_INGESTION_WINDOW))] if now - start >= MIN_INGESTION_WINDOW else []
+    return gap_windows[: MAX_WINDOWS_PER_TICKER - len(forward)] + forward
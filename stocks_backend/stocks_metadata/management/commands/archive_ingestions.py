@@ -0,0 +1,18 @@
+import datetime
+from django.core.management.base import BaseCommand
+
+from stocks_backend.settings import INGESTION_ARCHIVE_AFTER_DAYS, INGESTION_ARCHIVE_BATCH_SIZE
+from stocks_metadata.ingestion_archive import archive_finished_ingestions
+
+
+class Command(BaseCommand):
+    help = "Moves finished ingestions older than --older-than-days from StockIngestion to the archive table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=INGESTION_ARCHIVE_AFTER_DAYS)
+        parser.add_argument("--batch-size", type=int, default=INGESTION_ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=options["older_than_days"])
+        archived = archive_finished_ingestions(cutoff, options["batch_size"])
+        self.stdout.write(f"Archived {archived} finished ingestions created before {cutoff.isoformat()}")
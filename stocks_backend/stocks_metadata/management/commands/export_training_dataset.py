@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from stocks_backend.settings import TRAINING_DATASET_DIR
+from stocks_metadata.dataset_export import export_training_dataset
+
+
+class Command(BaseCommand):
+    help = "Exports the bars ingested since the previous export into the memory mapped training dataset at --output"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=TRAINING_DATASET_DIR)
+        parser.add_argument("--tickers", help="Comma separated tickers to export, every ticker by default")
+        parser.add_argument("--full", action="store_true", help="Re-export every bar instead of the new ingestions")
+
+    def handle(self, *args, **options):
+        tickers = [ticker.strip() for ticker in options["tickers"].split(",")] if options["tickers"] else None
+        exported = export_training_dataset(options["output"], tickers, options["full"])
+        self.stdout.write(f"Exported {exported} tickers to {options['output']}")
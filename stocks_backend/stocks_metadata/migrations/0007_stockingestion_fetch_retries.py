@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks_metadata", "0006_stockingestion_ingestion_deployed_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockingestion",
+            name="fetch_retries",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="stockingestion",
+            name="fetch_retry_wait_seconds",
+            field=models.FloatField(default=0),
+        ),
+    ]
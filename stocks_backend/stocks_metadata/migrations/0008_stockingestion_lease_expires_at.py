@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks_metadata", "0007_stockingestion_fetch_retries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockingestion",
+            name="lease_expires_at",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
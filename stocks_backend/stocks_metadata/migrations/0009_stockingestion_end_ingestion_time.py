@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_end_ingestion_time(apps, _):
+    StockIngestion = apps.get_model("stocks_metadata", "StockIngestion")
+    IngestionMetadata = apps.get_model("stocks_metadata", "IngestionMetadata")
+    StockIngestion.objects.update(
+        end_ingestion_time=Subquery(
+            IngestionMetadata.objects.filter(id=OuterRef("metadata_id")).values("end_ingestion_time")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks_metadata", "0008_stockingestion_lease_expires_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockingestion",
+            name="end_ingestion_time",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(populate_end_ingestion_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="stockingestion",
+            name="end_ingestion_time",
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:13
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Builds the indexes without locking writes on a large ingestion history
+    atomic = False
+
+    dependencies = [
+        ("stocks_metadata", "0009_stockingestion_end_ingestion_time"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="stockingestion",
+            index=models.Index(
+                condition=models.Q(("ingestion_status", "ON_QUEUE")),
+                fields=["end_ingestion_time"],
+                name="ingestion_queue_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="stockingestion",
+            index=models.Index(
+                condition=models.Q(("ingestion_status__in", ["DEPLOYING", "IN_PROGRESS"])),
+                fields=["ingestion_status"],
+                name="ingestion_active_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="stockingestion",
+            index=models.Index(
+                fields=["ticker", "ingestion_status", "-end_ingestion_time"], name="ingestion_ticker_end_idx"
+            ),
+        ),
+    ]
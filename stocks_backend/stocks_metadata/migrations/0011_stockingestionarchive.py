@@ -0,0 +1,64 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks_metadata", "0010_stockingestion_queue_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockIngestionArchive",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                (
+                    "ingestion_status",
+                    models.TextField(
+                        choices=[
+                            ("ON_QUEUE", "On Queue"),
+                            ("SUCCESS", "Success"),
+                            ("FAILURE", "Failure"),
+                            ("IN_PROGRESS", "In Progress"),
+                            ("DEPLOYING", "Deploying"),
+                        ]
+                    ),
+                ),
+                ("ingestion_started_at", models.DateTimeField(null=True)),
+                ("ingestion_finished_at", models.DateTimeField(null=True)),
+                ("ingestion_deployed_at", models.DateTimeField(null=True)),
+                ("created_at", models.DateTimeField()),
+                ("start_ingestion_time", models.DateTimeField()),
+                ("end_ingestion_time", models.DateTimeField()),
+                (
+                    "delta_category",
+                    models.TextField(
+                        choices=[("SECOND", "Second"), ("MINUTE", "Minute"), ("HOUR", "Hour"), ("DAY", "Day")]
+                    ),
+                ),
+                ("delta_multiplier", models.SmallIntegerField()),
+                ("fetch_retries", models.IntegerField(default=0)),
+                ("fetch_retry_wait_seconds", models.FloatField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "ticker",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="stocks_metadata.tickers",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["ticker", "ingestion_status", "-end_ingestion_time"], name="archive_ticker_end_idx"
+                    ),
+                    models.Index(fields=["created_at"], name="archive_created_at_idx"),
+                ],
+            },
+        ),
+    ]
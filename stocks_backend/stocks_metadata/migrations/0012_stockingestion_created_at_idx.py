@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:15
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("stocks_metadata", "0011_stockingestionarchive"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="stockingestion",
+            index=models.Index(fields=["created_at", "id"], name="ingestion_created_at_idx"),
+        ),
+    ]
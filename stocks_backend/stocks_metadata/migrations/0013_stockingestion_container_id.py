@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stocks_metadata", "0012_stockingestion_created_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="stockingestion",
+            name="container_id",
+            field=models.CharField(max_length=64, null=True),
+        ),
+    ]
@@ -59,8 +59,65 @@ class StockIngestion(models.Model):
     ingestion_status = models.TextField(choices=IngestionStatus.choices)
     ingestion_finished_at = models.DateTimeField(null=True)
     ingestion_deployed_at = models.DateTimeField(null=True)
+    lease_expires_at = models.DateTimeField(null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     metadata = models.ForeignKey(IngestionMetadata, on_delete=models.CASCADE)
+    fetch_retries = models.IntegerField(default=0)
+    fetch_retry_wait_seconds = models.FloatField(default=0)
+    # Id of the docker container running the ingestion, set once the launcher started it
+    container_id = models.CharField(max_length=64, null=True)
+    # Copy of metadata.end_ingestion_time, so the queue can be ordered without a join
+    end_ingestion_time = models.DateTimeField()
+
+    class Meta(TypedModelMeta):
+        """Indexes matching the orchestrator queries, partial ones stay small as the ingestion history grows"""
+
+        indexes = [
+            models.Index(
+                fields=["end_ingestion_time"],
+                name="ingestion_queue_idx",
+                condition=models.Q(ingestion_status=IngestionStatus.ON_QUEUE),
+            ),
+            models.Index(
+                fields=["ingestion_status"],
+                name="ingestion_active_idx",
+                condition=models.Q(ingestion_status__in=[IngestionStatus.DEPLOYING, IngestionStatus.IN_PROGRESS]),
+            ),
+            models.Index(fields=["ticker", "ingestion_status", "-end_ingestion_time"], name="ingestion_ticker_end_idx"),
+            models.Index(fields=["created_at", "id"], name="ingestion_created_at_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.end_ingestion_time is None and self.metadata_id is not None:
+            self.end_ingestion_time = self.metadata.end_ingestion_time
+        super().save(*args, **kwargs)
+
+
+class StockIngestionArchive(models.Model):
+    """Finished ingestions moved out of StockIngestion, with their metadata flattened in, to keep the queue small."""
+
+    id = models.IntegerField(primary_key=True)
+    ticker = models.ForeignKey(Tickers, on_delete=models.DO_NOTHING, db_constraint=False)
+    ingestion_status = models.TextField(choices=IngestionStatus.choices)
+    ingestion_started_at = models.DateTimeField(null=True)
+    ingestion_finished_at = models.DateTimeField(null=True)
+    ingestion_deployed_at = models.DateTimeField(null=True)
+    created_at = models.DateTimeField()
+    start_ingestion_time = models.DateTimeField()
+    end_ingestion_time = models.DateTimeField()
+    delta_category = models.TextField(choices=IngestionTimespan.choices)
+    delta_multiplier = models.SmallIntegerField()
+    fetch_retries = models.IntegerField(default=0)
+    fetch_retry_wait_seconds = models.FloatField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta(TypedModelMeta):
+        """History reads are per ticker or over time"""
+
+        indexes = [
+            models.Index(fields=["ticker", "ingestion_status", "-end_ingestion_time"], name="archive_ticker_end_idx"),
+            models.Index(fields=["created_at"], name="archive_created_at_idx"),
+        ]
 
 
 # Create your models here.
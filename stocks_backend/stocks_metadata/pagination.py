@@ -0,0 +1,72 @@
+import base64
+import datetime
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+
+from stocks_backend.settings import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_CHUNK_SIZE
+
+# Every paginated model is ordered on these, id breaks ties between rows created at the same time
+PAGE_ORDERING = ("created_at", "id")
+
+
+class InvalidPageRequest(ValueError):
+    """Raised when the limit or cursor query params can not be parsed."""
+
+
+def encode_cursor(row: dict) -> str:
+    payload = json.dumps([row["created_at"].isoformat(), row["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError) as e:
+        raise InvalidPageRequest(f"Invalid cursor {cursor}") from e
+
+
+def after_cursor(queryset: QuerySet, cursor: str | None) -> QuerySet:
+    """Keyset filter, the rows strictly after cursor in PAGE_ORDERING, which an index on created_at can seek to."""
+    queryset = queryset.order_by(*PAGE_ORDERING)
+    if not cursor:
+        return queryset
+    created_at, id = decode_cursor(cursor)
+    return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=id))
+
+
+def get_page_limit(request: HttpRequest) -> int:
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        raise InvalidPageRequest("limit must be an integer") from e
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def get_values_fields(fields: tuple[str, ...]) -> tuple[str, ...]:
+    # No fields means every field of the model, which already includes the ordering ones
+    return fields and fields + tuple(key for key in PAGE_ORDERING if key not in fields)
+
+
+def paginated_response(request: HttpRequest, queryset: QuerySet, *fields: str) -> StreamingHttpResponse | JsonResponse:
+    """
+    Returns one page of queryset as {"data", "next_cursor"}, passing next_cursor back as cursor gets the next page.
+    With format=ndjson the whole result is streamed instead, one JSON row per line, reading chunk by chunk from a
+    server side cursor so memory stays flat whatever the result size.
+    """
+    try:
+        queryset = after_cursor(queryset, request.GET.get("cursor"))
+        if request.GET.get("format") == "ndjson":
+            rows = queryset.values(*fields).iterator(chunk_size=STREAM_CHUNK_SIZE)
+            return StreamingHttpResponse(
+                (json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows), content_type="application/x-ndjson"
+            )
+        limit = get_page_limit(request)
+    except InvalidPageRequest as e:
+        return JsonResponse({"data": None, "reason": str(e)}, status=400)
+
+    rows = list(queryset.values(*get_values_fields(fields))[: limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return JsonResponse({"data": rows[:limit], "next_cursor": next_cursor}, status=200)
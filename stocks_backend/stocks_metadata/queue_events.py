@@ -0,0 +1,51 @@
+from contextlib import contextmanager
+from django.db import connection
+
+from stocks_backend.utils import get_module_logger
+
+logger = get_module_logger(__file__)
+
+INGESTION_QUEUE_CHANNEL = "ingestion_queue"
+
+
+class QueueEvent:
+    """Payloads sent on the ingestion queue channel"""
+
+    ENQUEUED = "ENQUEUED"
+    FINISHED = "FINISHED"
+
+
+def notify_ingestion_queue(event: str):
+    """
+    Wakes up whoever waits on the ingestion queue. Postgres only delivers the notification when the current
+    transaction commits, so listeners never see work that was rolled back.
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [INGESTION_QUEUE_CHANNEL, event])
+
+
+@contextmanager
+def listen_ingestion_queue():
+    """Subscribes the current connection to the ingestion queue channel for the duration of the block."""
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {INGESTION_QUEUE_CHANNEL}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"UNLISTEN {INGESTION_QUEUE_CHANNEL}")
+
+
+def wait_for_ingestion_queue(timeout: float) -> bool:
+    """Blocks until an event is notified on the ingestion queue or timeout seconds went by, inside listen."""
+    if connection.vendor != "postgresql":
+        return False
+    for notify in connection.connection.notifies(timeout=timeout, stop_after=1):
+        logger.info(f"Received {notify.payload} event on the ingestion queue")
+        return True
+    return False
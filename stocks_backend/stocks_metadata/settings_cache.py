@@ -0,0 +1,59 @@
+import threading
+import time
+from django.core.cache import caches
+from django.db import transaction
+
+from stocks_backend.settings import APP_SETTINGS_CACHE_ALIAS, APP_SETTINGS_CACHE_TTL_SECONDS
+from stocks_metadata.models import AppSettings
+
+APP_SETTINGS_CACHE_KEY = "stocks_metadata:app_settings"
+
+
+class AppSettingsCache:
+    """
+    Every AppSettings row, loaded with a single query and kept for ttl seconds. With cache_alias set, the snapshot
+    lives in that Django cache instead of the process, so every worker sees an invalidation at once.
+    """
+
+    def __init__(self, ttl: float = APP_SETTINGS_CACHE_TTL_SECONDS, cache_alias: str | None = APP_SETTINGS_CACHE_ALIAS):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._values: dict[str, str] | None = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> dict[str, str]:
+        return dict(AppSettings.objects.values_list("key", "value"))
+
+    def get_all(self) -> dict[str, str]:
+        if self.cache_alias:
+            cache = caches[self.cache_alias]
+            if (values := cache.get(APP_SETTINGS_CACHE_KEY)) is None:
+                values = self.load()
+                cache.set(APP_SETTINGS_CACHE_KEY, values, timeout=self.ttl)
+            return values
+
+        with self._lock:
+            if self._values is None or time.monotonic() >= self._expires_at:
+                self._values = self.load()
+                self._expires_at = time.monotonic() + self.ttl
+            return self._values
+
+    def get(self, key: str) -> str | None:
+        return self.get_all().get(key)
+
+    def invalidate(self):
+        if self.cache_alias:
+            caches[self.cache_alias].delete(APP_SETTINGS_CACHE_KEY)
+        with self._lock:
+            self._values = None
+
+
+app_settings_cache = AppSettingsCache()
+
+
+def invalidate_app_settings(**kwargs):
+    """Signal receiver of AppSettings saves and deletes."""
+    app_settings_cache.invalidate()
+    # Invalidates again once committed, in case a concurrent read cached the old value in the meantime
+    transaction.on_commit(app_settings_cache.invalidate)
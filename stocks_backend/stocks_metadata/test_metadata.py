@@ -1,15 +1,50 @@
 import datetime
+import io
 import json
+import os
+import numpy as np
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.db.models import Q
 import pytest
 
-from stocks_metadata.views import enqueue_new_ingestion, update_end_ingestion_time
+from stocks_backend.metrics import request_metrics
+from stocks_backend.settings import (
+    INGESTION_GAP_LOOKBACK_DAYS,
+    LOCAL_INGESTION_BUCKET_SETTING_KEY,
+    LOCAL_ORG_SETTING_KEY,
+)
+from stocks_metadata import views
+from stocks_metadata.bar_reader import BarReader, Bars, parse_bars_csv
+from stocks_metadata.container_launcher import ContainerLauncher, DockerEngineClient, INGESTION_ID_LABEL
+from stocks_metadata.dataset_export import export_training_dataset
+from stocks_metadata.ingestion_planner import (
+    COVERAGE_QUERY_CHUNK_SIZE,
+    DEFAULT_INGESTION_START,
+    MAX_WINDOWS_PER_TICKER,
+    StoredCoverage,
+    build_coverage_query,
+    get_coverage_chunks,
+    get_scan_start,
+    plan_ingestion_windows,
+    split_window,
+)
+from stocks_metadata.settings_cache import app_settings_cache
+from stocks_metadata.training_dataset import TrainingDataset
+from stocks_metadata.views import claim_ingestions, enqueue_new_ingestion, update_end_ingestion_time
 from stocks_metadata.models import (
+    AppSettings,
     IngestionMetadata,
     IngestionStatus,
     IngestionTimespan,
     StockIngestion,
+    StockIngestionArchive,
     Tickers,
 )
 
@@ -17,6 +52,12 @@ dummy_old_date = datetime.datetime(2023, 1, 1, 0, 0, 0, tzinfo=datetime.timezone
 dummy_recent_date = datetime.datetime(2024, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc)
 
 
+@pytest.fixture(autouse=True)
+def clear_settings_cache():
+    # Rolled back test data never sends the signals that would invalidate the cache
+    app_settings_cache.invalidate()
+
+
 def create_dummy_ticker():
     return Tickers.objects.create(symbol="DMMY", name="Apple Inc.", exchange="N", type="tech")
 
@@ -121,7 +162,14 @@ def test_update_ingestion_time(client):
         ]
     assert len(response.json()["data"]) == 4
 
-    update_end_ingestion_time()
+    with CaptureQueriesContext(connection) as queries:
+        update_end_ingestion_time()
+    assert [query["sql"].split()[0] for query in queries.captured_queries if "SAVEPOINT" not in query["sql"]] == [
+        "UPDATE",
+        "UPDATE",
+    ]
+    queued = StockIngestion.objects.get(ingestion_status=IngestionStatus.ON_QUEUE)
+    assert queued.end_ingestion_time == queued.metadata.end_ingestion_time != dummy_old_date
 
     response = client.get(reverse("list_ingestion_data"))
     for entry in response.json()["data"]:
@@ -267,6 +315,15 @@ def test_update_status_failure(client):
     assert st_ingestion.ingestion_status == ingestion_status
     assert st_ingestion.ingestion_finished_at
 
+    # A finished ingestion never goes back to running
+    response = client.put(
+        reverse("update_ingestion_status"),
+        data=json.dumps({"ingestion_status": IngestionStatus.IN_PROGRESS.value, "id": st_ingestion.id}),
+    )
+    assert response.status_code == 409
+    st_ingestion.refresh_from_db()
+    assert st_ingestion.ingestion_status == ingestion_status
+
 
 @pytest.mark.django_db
 def test_cleanup(client):
@@ -302,3 +359,629 @@ def test_cleanup(client):
     client.get(reverse("cleanup_ingestion_pending_status"))
     st_ingestion.refresh_from_db()
     assert st_ingestion.ingestion_status == IngestionStatus.FAILURE
+    assert st_ingestion.ingestion_finished_at
+
+
+@pytest.mark.django_db
+def test_cleanup_deploying(client, django_assert_max_num_queries):
+    ticker = create_dummy_ticker()
+    deployed_at = {
+        "recent": datetime.datetime.now(tz=datetime.timezone.utc),
+        "stale": datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(hours=1),
+        "never": None,
+    }
+    ingestions = {
+        name: StockIngestion.objects.create(
+            ticker=ticker,
+            ingestion_status=IngestionStatus.DEPLOYING,
+            ingestion_deployed_at=deployed,
+            metadata=IngestionMetadata.objects.create(
+                start_ingestion_time=dummy_old_date,
+                end_ingestion_time=dummy_old_date + datetime.timedelta(days=3),
+                delta_category=IngestionTimespan.HOUR,
+                delta_multiplier=1,
+            ),
+        )
+        for name, deployed in deployed_at.items()
+    }
+
+    with django_assert_max_num_queries(4):
+        response = client.get(reverse("cleanup_ingestion_pending_status"))
+    assert response.content == b"Cleaned up 2 stale ingestion"
+    for ingestion in ingestions.values():
+        ingestion.refresh_from_db()
+    assert ingestions["recent"].ingestion_status == IngestionStatus.DEPLOYING
+    assert ingestions["stale"].ingestion_status == IngestionStatus.FAILURE
+    assert ingestions["never"].ingestion_status == IngestionStatus.FAILURE
+
+
+@pytest.mark.django_db
+def test_lease_ingestions(client):
+    ticker = create_dummy_ticker()
+    for days in [3, 1, 2]:
+        StockIngestion.objects.create(
+            ticker=ticker,
+            ingestion_status=IngestionStatus.ON_QUEUE,
+            metadata=IngestionMetadata.objects.create(
+                start_ingestion_time=dummy_old_date,
+                end_ingestion_time=dummy_old_date + datetime.timedelta(days=days),
+                delta_category=IngestionTimespan.HOUR,
+                delta_multiplier=1,
+            ),
+        )
+
+    response = client.get(reverse("lease_ingestions"), {"limit": 2})
+    data = response.json()["data"]
+    assert response.status_code == 200
+    assert [entry["to_date"] for entry in data] == ["2023-01-02", "2023-01-03"]
+    assert data[0]["ticker"] == ticker.symbol
+    assert data[0]["type"] == IngestionTimespan.HOUR
+    leased = StockIngestion.objects.filter(id__in=[entry["id"] for entry in data])
+    assert all(ingestion.ingestion_status == IngestionStatus.DEPLOYING for ingestion in leased)
+    assert all(ingestion.ingestion_deployed_at for ingestion in leased)
+
+    response = client.get(reverse("lease_ingestions"), {"limit": 2})
+    assert len(response.json()["data"]) == 1
+
+
+@pytest.mark.django_db
+def test_update_status_with_retries(client):
+    ticker = create_dummy_ticker()
+    st_ingestion = StockIngestion.objects.create(
+        ticker=ticker,
+        ingestion_status=IngestionStatus.IN_PROGRESS,
+        metadata=IngestionMetadata.objects.create(
+            start_ingestion_time=dummy_old_date,
+            end_ingestion_time=dummy_old_date + datetime.timedelta(days=3),
+            delta_category=IngestionTimespan.HOUR,
+            delta_multiplier=1,
+        ),
+    )
+    client.put(
+        reverse("update_ingestion_status"),
+        data=json.dumps(
+            {
+                "ingestion_status": IngestionStatus.SUCCESS.value,
+                "id": st_ingestion.id,
+                "retries": 3,
+                "retry_wait_seconds": 12.5,
+            }
+        ),
+    )
+    st_ingestion.refresh_from_db()
+    assert st_ingestion.ingestion_status == IngestionStatus.SUCCESS
+    assert st_ingestion.fetch_retries == 3
+    assert st_ingestion.fetch_retry_wait_seconds == 12.5
+
+
+def test_plan_ingestion_windows():
+    now = dummy_recent_date
+    assert plan_ingestion_windows(now - datetime.timedelta(hours=6), now) == []
+    assert plan_ingestion_windows(dummy_old_date, now) == [
+        (dummy_old_date, dummy_old_date + datetime.timedelta(days=30))
+    ]
+
+    # Partial writes from a failed run move the start to the last stored bar
+    last_stored = now - datetime.timedelta(days=5)
+    assert plan_ingestion_windows(dummy_old_date, now, StoredCoverage(last=last_stored)) == [(last_stored, now)]
+
+    gap = (now - datetime.timedelta(days=20), now - datetime.timedelta(days=10))
+    coverage = StoredCoverage(last=last_stored, gaps=[gap])
+    assert plan_ingestion_windows(dummy_old_date, now, coverage) == [gap, (last_stored, now)]
+    # A gap inside a successful window means Polygon had no bars there
+    success_windows = [(gap[0] - datetime.timedelta(days=1), gap[1] + datetime.timedelta(days=1))]
+    assert plan_ingestion_windows(dummy_old_date, now, coverage, success_windows) == [(last_stored, now)]
+
+    # Gaps longer than a window are ingested in chunks, covered together by their successful ingestions
+    long_gap = (now - datetime.timedelta(days=100), now - datetime.timedelta(days=40))
+    coverage = StoredCoverage(last=last_stored, gaps=[long_gap])
+    success_windows = split_window(*long_gap)[::-1]
+    assert len(success_windows) == 2
+    assert plan_ingestion_windows(dummy_old_date, now, coverage, success_windows) == [(last_stored, now)]
+    assert plan_ingestion_windows(dummy_old_date, now, coverage, success_windows[:1]) == [
+        *split_window(*long_gap),
+        (last_stored, now),
+    ]
+
+    # The forward window keeps its slot when a gap alone needs more windows than a ticker may have queued
+    coverage = StoredCoverage(last=last_stored, gaps=[(now - datetime.timedelta(days=400), last_stored)])
+    windows = plan_ingestion_windows(dummy_old_date, now, coverage)
+    assert len(windows) == MAX_WINDOWS_PER_TICKER
+    assert windows[-1] == (last_stored, now)
+
+
+def test_coverage_query_bounds():
+    now = dummy_recent_date
+    last_end = now - datetime.timedelta(days=2)
+    assert get_scan_start(None) == DEFAULT_INGESTION_START
+    assert get_scan_start(dummy_old_date) == DEFAULT_INGESTION_START
+    assert get_scan_start(last_end) == last_end - datetime.timedelta(days=INGESTION_GAP_LOOKBACK_DAYS)
+
+    # Tickers never ingested are scanned together, the others from the lookback before their last success only
+    scan_starts = {f"T{i}": get_scan_start(last_end) for i in range(COVERAGE_QUERY_CHUNK_SIZE + 1)}
+    scan_starts["NEW"] = get_scan_start(None)
+    chunks = get_coverage_chunks(scan_starts)
+    assert [len(symbols) for symbols, _ in chunks] == [COVERAGE_QUERY_CHUNK_SIZE, 2]
+    assert chunks[0][0][0] == "NEW" and chunks[0][1] == DEFAULT_INGESTION_START
+    assert chunks[1][1] == get_scan_start(last_end)
+
+    query = build_coverage_query(["BRK.B", "AAPL"], "bucket", chunks[1][1], now, datetime.timedelta(days=4))
+    assert f"range(start: {chunks[1][1].isoformat()}" in query
+    assert 'r.ticker == "BRK.B" or r.ticker == "AAPL"' in query
+    assert "contains(" not in query
+
+
+@pytest.mark.django_db
+def test_enqueue_new_ingestion_with_stored_coverage(client, monkeypatch):
+    ticker = create_dummy_ticker()
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    last_stored = now - datetime.timedelta(days=3)
+    gap = (now - datetime.timedelta(days=20), now - datetime.timedelta(days=10))
+    monkeypatch.setattr(
+        views,
+        "get_ticker_coverage",
+        lambda last_end_times, stop: {ticker.symbol: StoredCoverage(last=last_stored, gaps=[gap])},
+    )
+    enqueue_new_ingestion(ticker, now)
+
+    windows = list(
+        StockIngestion.objects.filter(ticker=ticker)
+        .order_by("metadata__start_ingestion_time")
+        .values_list("metadata__start_ingestion_time", "metadata__end_ingestion_time")
+    )
+    assert windows == [gap, (last_stored, now)]
+
+
+@pytest.mark.django_db
+def test_register_new_ingestions_constant_queries(client, django_assert_max_num_queries):
+    Tickers.objects.bulk_create([Tickers(symbol=f"T{i}", name=f"Ticker {i}") for i in range(300)])
+    ticker = Tickers.objects.get(symbol="T0")
+    StockIngestion.objects.create(
+        ticker=ticker,
+        ingestion_status=IngestionStatus.SUCCESS,
+        metadata=IngestionMetadata.objects.create(
+            start_ingestion_time=dummy_old_date,
+            end_ingestion_time=dummy_recent_date,
+            delta_category=IngestionTimespan.HOUR,
+            delta_multiplier=1,
+        ),
+    )
+
+    with django_assert_max_num_queries(6):
+        response = client.get(reverse("register_new_ingestions"))
+    assert response.status_code == 200
+
+    queued = StockIngestion.objects.filter(ingestion_status=IngestionStatus.ON_QUEUE)
+    assert queued.count() == Tickers.objects.count()
+    assert queued.get(ticker=ticker).metadata.start_ingestion_time == dummy_recent_date
+    assert queued.get(ticker__symbol="T1").metadata.start_ingestion_time == dummy_old_date
+
+    # Every ticker has a queued ingestion now, so nothing new is registered
+    client.get(reverse("register_new_ingestions"))
+    assert queued.count() == Tickers.objects.count()
+
+
+@pytest.mark.django_db
+def test_wait_for_ingestions(client):
+    response = client.get(reverse("wait_for_ingestions"), {"timeout": 0})
+    assert response.status_code == 200
+    assert response.json()["data"] is False
+
+    StockIngestion.objects.create(
+        ticker=create_dummy_ticker(),
+        ingestion_status=IngestionStatus.ON_QUEUE,
+        metadata=IngestionMetadata.objects.create(
+            start_ingestion_time=dummy_old_date,
+            end_ingestion_time=dummy_old_date + datetime.timedelta(days=3),
+            delta_category=IngestionTimespan.HOUR,
+            delta_multiplier=1,
+        ),
+    )
+    response = client.get(reverse("wait_for_ingestions"), {"timeout": 0})
+    assert response.json()["data"] is True
+
+
+def create_queued_ingestions(ticker, days_list):
+    for days in days_list:
+        StockIngestion.objects.create(
+            ticker=ticker,
+            ingestion_status=IngestionStatus.ON_QUEUE,
+            metadata=IngestionMetadata.objects.create(
+                start_ingestion_time=dummy_old_date,
+                end_ingestion_time=dummy_old_date + datetime.timedelta(days=days),
+                delta_category=IngestionTimespan.HOUR,
+                delta_multiplier=1,
+            ),
+        )
+
+
+@pytest.mark.django_db
+def test_claim_ingestions_lease(client):
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2, 3])
+    StockIngestion.objects.filter(metadata__end_ingestion_time=dummy_old_date + datetime.timedelta(days=3)).update(
+        ingestion_status=IngestionStatus.IN_PROGRESS
+    )
+
+    with transaction.atomic():
+        claimed = claim_ingestions(5, max_in_progress=2)
+    assert [ingestion.metadata.end_ingestion_time.day for ingestion in claimed] == [2]
+    assert claimed[0].lease_expires_at > datetime.datetime.now(tz=datetime.timezone.utc)
+    with transaction.atomic():
+        assert claim_ingestions(5, max_in_progress=2) == []
+
+    # An expired lease fails the ingestion even though it was deployed recently
+    StockIngestion.objects.filter(id=claimed[0].id).update(lease_expires_at=dummy_old_date)
+    client.get(reverse("cleanup_ingestion_pending_status"))
+    claimed[0].refresh_from_db()
+    assert claimed[0].ingestion_status == IngestionStatus.FAILURE
+    assert claimed[0].lease_expires_at is None
+
+
+@pytest.mark.django_db(transaction=True, serialized_rollback=True)
+def test_claim_ingestions_skips_locked_rows():
+    create_queued_ingestions(create_dummy_ticker(), [1, 2])
+    claimed_by_other = []
+    locked, release = threading.Event(), threading.Event()
+
+    def claim_and_hold():
+        try:
+            with transaction.atomic():
+                claimed_by_other.extend(claim_ingestions(1))
+                locked.set()
+                release.wait(timeout=10)
+        finally:
+            connection.close()
+
+    other = threading.Thread(target=claim_and_hold)
+    other.start()
+    try:
+        assert locked.wait(timeout=10)
+        with transaction.atomic():
+            claimed = claim_ingestions(2)
+    finally:
+        release.set()
+        other.join()
+
+    assert len(claimed) == 1
+    assert claimed[0].id != claimed_by_other[0].id
+
+
+@pytest.mark.django_db
+def test_ingestion_queue_uses_indexes():
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2, 3])
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE stocks_metadata_stockingestion")
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+    queue_plan = (
+        StockIngestion.objects.filter(ingestion_status=IngestionStatus.ON_QUEUE).order_by("end_ingestion_time")[:5]
+    ).explain()
+    assert "ingestion_queue_idx" in queue_plan
+    assert "Sort" not in queue_plan
+
+    last_success_plan = (
+        StockIngestion.objects.filter(ticker=ticker, ingestion_status=IngestionStatus.SUCCESS).order_by(
+            "-end_ingestion_time"
+        )[:1]
+    ).explain()
+    assert "ingestion_ticker_end_idx" in last_success_plan
+
+
+@pytest.mark.django_db
+def test_archive_ingestions(client):
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2, 3, 4, 5])
+    ingestions = list(StockIngestion.objects.order_by("end_ingestion_time"))
+    statuses = [IngestionStatus.SUCCESS, IngestionStatus.FAILURE, IngestionStatus.SUCCESS, IngestionStatus.FAILURE]
+    for ingestion, status in zip(ingestions, statuses):
+        ingestion.ingestion_status = status
+        ingestion.save()
+    # Kept: the last success of the ticker, a recent failure and the queued ingestion
+    StockIngestion.objects.exclude(id=ingestions[3].id).update(created_at=dummy_old_date)
+
+    call_command("archive_ingestions", older_than_days=30, batch_size=1)
+
+    assert set(StockIngestion.objects.values_list("id", flat=True)) == {ingestion.id for ingestion in ingestions[2:]}
+    archived = StockIngestionArchive.objects.order_by("end_ingestion_time")
+    assert [entry.id for entry in archived] == [ingestions[0].id, ingestions[1].id]
+    assert archived[0].start_ingestion_time == dummy_old_date
+    assert archived[1].ingestion_status == IngestionStatus.FAILURE
+    assert not IngestionMetadata.objects.filter(id__in=[ingestions[0].metadata_id, ingestions[1].metadata_id]).exists()
+
+    response = client.get(reverse("list_ingestion_data"), {"archived": "true"})
+    assert len(response.json()["data"]) == 2
+    # Archived and live ingestions are listed with the same keys
+    live = client.get(reverse("list_ingestion_data")).json()["data"]
+    assert set(response.json()["data"][0]) == set(live[0])
+    assert response.json()["data"][0]["metadata__start_ingestion_time"] == dummy_old_date.isoformat().replace(
+        "+00:00", "Z"
+    )
+
+
+@pytest.mark.django_db
+def test_list_ingestion_data_pages(client):
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2, 3, 4, 5])
+    StockIngestion.objects.filter(end_ingestion_time=dummy_old_date + datetime.timedelta(days=5)).update(
+        ingestion_status=IngestionStatus.FAILURE
+    )
+
+    pages, cursor = [], None
+    while True:
+        params = {"symbol": ticker.symbol, "limit": 2} | ({"cursor": cursor} if cursor else {})
+        response = client.get(reverse("list_ingestion_data"), params).json()
+        pages.append(response["data"])
+        if not (cursor := response["next_cursor"]):
+            break
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert len({entry["id"] for page in pages for entry in page}) == 5
+
+    response = client.get(reverse("list_ingestion_data"), {"status_to_return": "FAILURE,SUCCESS"})
+    assert [entry["ingestion_status"] for entry in response.json()["data"]] == [IngestionStatus.FAILURE]
+
+    response = client.get(reverse("list_ingestion_data"), {"symbol": ticker.symbol, "format": "ndjson"})
+    assert response["Content-Type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+    assert [row["metadata__end_ingestion_time"][:10] for row in rows] == [f"2023-01-0{day}" for day in [2, 3, 4, 5, 6]]
+
+    assert client.get(reverse("list_ingestion_data"), {"cursor": "nope"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_settings_cache(django_assert_num_queries):
+    AppSettings.objects.create(key=LOCAL_ORG_SETTING_KEY, value="org")
+    with django_assert_num_queries(1):
+        assert views.get_settings_value(LOCAL_ORG_SETTING_KEY) == "org"
+        assert views.get_settings_value(LOCAL_INGESTION_BUCKET_SETTING_KEY) is None
+        assert views.get_settings_value(LOCAL_ORG_SETTING_KEY) == "org"
+
+    AppSettings.objects.filter(key=LOCAL_ORG_SETTING_KEY).first().delete()
+    assert views.get_settings_value(LOCAL_ORG_SETTING_KEY) is None
+    AppSettings.objects.create(key=LOCAL_ORG_SETTING_KEY, value="other org")
+    assert views.get_settings_value(LOCAL_ORG_SETTING_KEY) == "other org"
+
+
+@pytest.mark.django_db
+def test_request_metrics(client):
+    request_metrics.reset()
+    create_dummy_ticker()
+    client.get(reverse("tickers"))
+    client.get(reverse("tickers"))
+    client.get(reverse("wait_for_ingestions"), {"timeout": 0})
+
+    metrics = dict(line.rsplit(" ", 1) for line in client.get(reverse("metrics")).content.decode().splitlines())
+    # Long polls are left out
+    assert not any('view="wait_for_ingestions"' in name for name in metrics)
+    labels = 'view="tickers",method="GET"'
+    assert metrics[f'stocks_backend_request_db_queries_bucket{{{labels},le="+Inf"}}'] == "2"
+    assert float(metrics[f"stocks_backend_request_db_queries_sum{{{labels}}}"]) >= 2
+    assert metrics[f"stocks_backend_request_duration_seconds_count{{{labels}}}"] == "2"
+    assert float(metrics[f"stocks_backend_request_db_duration_seconds_sum{{{labels}}}"]) > 0
+
+
+@pytest.fixture
+def docker_engine(tmp_path):
+    """Fake Docker Engine API on a unix socket, recording the requests it gets. Delays queued in stalls hold the next
+    responses back. Containers of unstartable:latest are created but fail to start."""
+    received = []
+    stalls = []
+
+    class DockerEngineHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            received.append((self.path, json.loads(body) if body else None))
+            if stalls:
+                time.sleep(stalls.pop(0))
+            if self.path == "/containers/unstartable/start":
+                status, response = 500, b'{"message": "invalid mount config"}'
+            elif self.path != "/containers/create":
+                status, response = 204, b""
+            elif json.loads(body)["Image"] == "missing:latest":
+                status, response = 404, b'{"message": "No such image: missing:latest"}'
+            elif json.loads(body)["Image"] == "unstartable:latest":
+                status, response = 201, b'{"Id": "unstartable"}'
+            else:
+                status, response = 201, json.dumps({"Id": "c0ffee" * 10 + "beef"}).encode()
+            self.send_body(status, response)
+
+        def do_DELETE(self):
+            received.append((self.path, None))
+            self.send_body(204)
+
+        def send_body(self, status: int, response: bytes = b""):
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, *args):
+            pass
+
+    socket_path = str(tmp_path / "docker.sock")
+    server = socketserver.ThreadingUnixStreamServer(socket_path, DockerEngineHandler)
+    # Connections left open by a failing test must not block the teardown
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield socket_path, received, stalls
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.django_db
+def test_container_launcher(client, docker_engine, django_capture_on_commit_callbacks):
+    socket_path, received, _ = docker_engine
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2])
+    started, failed = StockIngestion.objects.order_by("end_ingestion_time")
+
+    # Nothing is launched by the request itself, only once the claim commits
+    with django_capture_on_commit_callbacks() as callbacks:
+        response = client.get(reverse("start_next_ingestion"), {"limit": 2})
+    assert response.json()["started"] == 2
+    assert len(callbacks) == 2
+    assert received == []
+
+    launcher = ContainerLauncher(DockerEngineClient(socket_path))
+    config = {"Image": "ingestion_lambda:latest", "Labels": {INGESTION_ID_LABEL: str(started.id)}}
+    container_id = launcher.launch(started.id, config)
+    assert [path for path, _ in received] == ["/containers/create", f"/containers/{container_id}/start"]
+    started.refresh_from_db()
+    assert started.container_id == container_id
+    assert started.ingestion_status == IngestionStatus.DEPLOYING
+
+    assert launcher.launch(failed.id, {"Image": "missing:latest"}) is None
+    failed.refresh_from_db()
+    assert failed.ingestion_status == IngestionStatus.FAILURE
+    assert failed.container_id is None
+    assert failed.lease_expires_at is None
+
+
+@pytest.mark.django_db
+def test_container_launcher_start_failure(docker_engine):
+    socket_path, received, _ = docker_engine
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1])
+    StockIngestion.objects.update(ingestion_status=IngestionStatus.DEPLOYING)
+    ingestion = StockIngestion.objects.get()
+
+    # The created container never ran, so AutoRemove will not clean it up
+    launcher = ContainerLauncher(DockerEngineClient(socket_path))
+    assert launcher.launch(ingestion.id, {"Image": "unstartable:latest"}) is None
+    assert [path for path, _ in received] == [
+        "/containers/create",
+        "/containers/unstartable/start",
+        "/containers/unstartable?force=1",
+    ]
+    ingestion.refresh_from_db()
+    assert ingestion.ingestion_status == IngestionStatus.FAILURE
+    assert ingestion.container_id is None
+
+
+@pytest.mark.django_db
+def test_container_launcher_timeout(docker_engine):
+    socket_path, received, stalls = docker_engine
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1, 2])
+    StockIngestion.objects.update(ingestion_status=IngestionStatus.DEPLOYING)
+    timed_out, started = StockIngestion.objects.order_by("end_ingestion_time")
+    launcher = ContainerLauncher(DockerEngineClient(socket_path, timeout=0.2))
+
+    stalls.append(0.5)
+    assert launcher.launch(timed_out.id, {"Image": "ingestion_lambda:latest"}) is None
+    timed_out.refresh_from_db()
+    assert timed_out.ingestion_status == IngestionStatus.FAILURE
+
+    # The timed out connection is dropped, the same thread launches the next container on a new one
+    container_id = launcher.launch(started.id, {"Image": "ingestion_lambda:latest"})
+    assert received[-1][0] == f"/containers/{container_id}/start"
+    started.refresh_from_db()
+    assert started.container_id == container_id
+
+
+def test_parse_bars_csv():
+    csv = (
+        ",result,table,close,high,low,open,time,volume\r\n"
+        ",_result,0,1.5,2,1,1.25,1672531200000,100\r\n"
+        ",_result,0,1.75,2.5,1.5,1.5,1672534800000,250.5\r\n\r\n"
+    )
+    bars = parse_bars_csv("DMMY", csv)
+    assert bars.time.tolist() == [datetime.datetime(2023, 1, 1, 0), datetime.datetime(2023, 1, 1, 1)]
+    assert bars.open.tolist() == [1.25, 1.5]
+    assert bars.close.tolist() == [1.5, 1.75]
+    assert bars.volume.tolist() == [100, 250.5]
+    assert len(parse_bars_csv("DMMY", "\r\n")) == 0
+
+
+@pytest.mark.django_db
+def test_bar_reader_cache(tmp_path, monkeypatch):
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [1])
+    StockIngestion.objects.update(ingestion_status=IngestionStatus.SUCCESS, ingestion_finished_at=dummy_old_date)
+    queried = []
+
+    def query_bars(self, client, symbol, start, stop):
+        queried.append(symbol)
+        time = np.array([int(start.timestamp() * 1000)], dtype="datetime64[ms]")
+        return Bars(symbol, time, *(np.array([len(queried)]) for _ in range(5)))
+
+    monkeypatch.setattr(BarReader, "query_bars", query_bars)
+    reader = BarReader("stocks", "org", cache_dir=str(tmp_path))
+
+    def read():
+        return reader.read([ticker.symbol, "NONE"], dummy_old_date, dummy_recent_date)
+
+    assert read()[ticker.symbol].close.tolist() == [1]
+    bars = read()
+    assert queried == [ticker.symbol, "NONE"]
+    assert list(bars) == [ticker.symbol, "NONE"]
+    assert bars[ticker.symbol].time.tolist() == [dummy_old_date.replace(tzinfo=None)]
+
+    # A newly finished ingestion of the ticker invalidates its cached bars only
+    StockIngestion.objects.update(ingestion_finished_at=dummy_recent_date)
+    assert read()[ticker.symbol].close.tolist() == [3]
+    assert queried == [ticker.symbol, "NONE", ticker.symbol]
+
+
+@pytest.mark.django_db
+def test_export_training_dataset(tmp_path, monkeypatch):
+    ticker = create_dummy_ticker()
+    create_queued_ingestions(ticker, [2])
+    StockIngestion.objects.update(ingestion_status=IngestionStatus.SUCCESS, ingestion_finished_at=dummy_old_date)
+    queried = []
+
+    def query_bars(self, client, symbol, start, stop):
+        # One bar a day, the close tells which query returned it
+        queried.append((symbol, start.date(), stop.date()))
+        time = np.arange(int(start.timestamp() * 1000), int(stop.timestamp() * 1000), 86_400_000)
+        return Bars(symbol, time.astype("datetime64[ms]"), *(np.full(len(time), float(len(queried))) for _ in range(5)))
+
+    monkeypatch.setattr(BarReader, "query_bars", query_bars)
+    path = str(tmp_path)
+    day = datetime.timedelta(days=1)
+
+    assert export_training_dataset(path) == 1
+    assert queried == [(ticker.symbol, dummy_old_date.date(), (dummy_old_date + 3 * day).date())]
+    dataset = TrainingDataset(path)
+    assert dataset.tickers == [ticker.symbol]
+    assert dataset[ticker.symbol]["close"].tolist() == [1, 1, 1]
+    first_generation = os.path.join(path, dataset.manifest["tickers"][ticker.symbol]["path"])
+    opened = TrainingDataset(path)
+
+    # Only the window of the ingestion that finished since is read, and replaces the exported rows it overlaps
+    StockIngestion.objects.create(
+        ticker=ticker,
+        ingestion_status=IngestionStatus.SUCCESS,
+        ingestion_finished_at=dummy_recent_date,
+        metadata=IngestionMetadata.objects.create(
+            start_ingestion_time=dummy_old_date + 2 * day,
+            end_ingestion_time=dummy_old_date + 4 * day,
+            delta_category=IngestionTimespan.HOUR,
+            delta_multiplier=1,
+        ),
+    )
+    assert export_training_dataset(path) == 1
+    assert queried[1:] == [(ticker.symbol, (dummy_old_date + 2 * day).date(), (dummy_old_date + 5 * day).date())]
+    dataset = TrainingDataset(path)
+    columns = dataset[ticker.symbol]
+    assert isinstance(columns["close"], np.memmap)
+    assert columns["close"].tolist() == [1, 1, 2, 2, 2]
+    assert columns["time"].tolist() == [(dummy_old_date + i * day).replace(tzinfo=None) for i in range(5)]
+    assert dataset.manifest["tickers"][ticker.symbol]["rows"] == 5
+    assert dataset.between(ticker.symbol, dummy_old_date + day, dummy_old_date + 3 * day)["close"].tolist() == [1, 2]
+    # A dataset opened before the export still reads the generation it was opened at
+    assert opened[ticker.symbol]["close"].tolist() == [1, 1, 1]
+
+    out = io.StringIO()
+    call_command("export_training_dataset", output=path, stdout=out)
+    assert out.getvalue().strip() == f"Exported 0 tickers to {path}"
+    assert len(queried) == 2
+    assert os.path.exists(first_generation)
+
+    # Replaced generations are removed once their retention ends
+    assert export_training_dataset(path, retention=datetime.timedelta(0)) == 0
+    assert not os.path.exists(first_generation)
+    assert TrainingDataset(path).manifest["retired"] == []
@@ -0,0 +1,117 @@
+"""
+Load benchmark of the orchestrator facing views. Seeds a ticker universe and its ingestion history at every scale,
+then measures the latency and query count of each scheduling endpoint, failing when the query count grows with the
+number of tickers. Runs small by default, set e.g.
+    SCHEDULING_LOAD_TICKERS=10000,100000 SCHEDULING_LOAD_HISTORY=30
+for a 100k ticker universe with 3M historical ingestions. The results are printed at the end of the run, set
+SCHEDULING_LOAD_REPORT to also save them as JSON.
+"""
+
+import datetime
+import os
+import time
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import pytest
+
+from stocks_metadata import views
+from stocks_metadata.models import IngestionMetadata, IngestionStatus, StockIngestion, Tickers
+from stocks_metadata.settings_cache import app_settings_cache
+
+TICKER_COUNTS = [int(count) for count in os.environ.get("SCHEDULING_LOAD_TICKERS", "100,1000").split(",")]
+HISTORY_PER_TICKER = int(os.environ.get("SCHEDULING_LOAD_HISTORY", "3"))
+HISTORY_START = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+# Every STALE_EVERY ticker has a last ingestion stuck in progress, for the cleanup to fail
+STALE_EVERY = 10
+# Called in this order, so each one has work to do: cleanup frees slots, register fills the queue
+ENDPOINTS = [
+    ("cleanup_ingestion_pending_status", {}),
+    ("register_new_ingestions", {}),
+    ("start_next_ingestion", {"limit": 5}),
+    ("lease_ingestions", {"limit": 50}),
+]
+
+
+def seed_scheduling_data(ticker_count: int, history: int):
+    """Replaces every ticker and ingestion with ticker_count tickers and history ingestions each, set based."""
+    tickers = Tickers._meta.db_table
+    ingestion = StockIngestion._meta.db_table
+    metadata = IngestionMetadata._meta.db_table
+    params = {
+        "tickers": ticker_count,
+        "history": history,
+        "start": HISTORY_START,
+        "stale_every": STALE_EVERY,
+        "success": IngestionStatus.SUCCESS,
+        "in_progress": IngestionStatus.IN_PROGRESS,
+    }
+    windows = """
+        FROM generate_series(1, %(tickers)s) i, generate_series(0, %(history)s - 1) w,
+            LATERAL (SELECT (i - 1) * %(history)s + w + 1 AS n) ids
+    """
+    with connection.cursor() as cursor:
+        # Checks the foreign keys of the previous scale now, TRUNCATE refuses to run with checks still pending
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"TRUNCATE {tickers}, {ingestion}, {metadata} CASCADE")
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        cursor.execute(
+            f"""INSERT INTO {tickers} (symbol, name, exchange, type)
+            SELECT 'L' || i, 'Load ' || i, 'N', 'load' FROM generate_series(1, %(tickers)s) i""",
+            params,
+        )
+        cursor.execute(
+            f"""INSERT INTO {metadata} (id, start_ingestion_time, end_ingestion_time, delta_category, delta_multiplier)
+            SELECT n, %(start)s + w * interval '30 days', %(start)s + (w + 1) * interval '30 days', 'HOUR', 1
+            {windows}""",
+            params,
+        )
+        cursor.execute(
+            f"""INSERT INTO {ingestion} (
+                id, ticker_id, ingestion_status, ingestion_deployed_at, ingestion_started_at, ingestion_finished_at,
+                created_at, metadata_id, end_ingestion_time, fetch_retries, fetch_retry_wait_seconds
+            )
+            SELECT n, 'L' || i, status, created_at, created_at,
+                CASE WHEN status = %(success)s THEN created_at END,
+                created_at, n, %(start)s + (w + 1) * interval '30 days', 0, 0
+            {windows},
+                LATERAL (SELECT CASE WHEN w = %(history)s - 1 AND i %% %(stale_every)s = 0
+                    THEN %(in_progress)s ELSE %(success)s END AS status) statuses,
+                LATERAL (SELECT %(start)s + (w + 1) * interval '30 days' AS created_at) times""",
+            params,
+        )
+        for table in [ingestion, metadata]:
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))")
+        cursor.execute(f"ANALYZE {tickers}, {ingestion}, {metadata}")
+
+
+@pytest.mark.django_db
+def test_scheduling_query_count_does_not_grow_with_tickers(client, monkeypatch, scheduling_load_results):
+    # Influx and docker are not part of what is measured
+    monkeypatch.setattr(views, "get_ticker_coverage", lambda last_end_times, stop: {})
+    monkeypatch.setattr(views, "deploy_ingestion", lambda ingestion: None)
+
+    results = scheduling_load_results
+    for ticker_count in TICKER_COUNTS:
+        seed_scheduling_data(ticker_count, HISTORY_PER_TICKER)
+        for endpoint, params in ENDPOINTS:
+            # Every call pays for loading the settings, as the first one after a restart does
+            app_settings_cache.invalidate()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(reverse(endpoint), params)
+                seconds = time.perf_counter() - started
+            assert response.status_code == 200
+            results.append({"endpoint": endpoint, "tickers": ticker_count, "seconds": seconds, "queries": len(queries)})
+
+        assert StockIngestion.objects.filter(ingestion_status=IngestionStatus.FAILURE).count() == (
+            ticker_count // STALE_EVERY
+        )
+        assert StockIngestion.objects.filter(
+            ingestion_status__in=[IngestionStatus.ON_QUEUE, IngestionStatus.DEPLOYING],
+            created_at__gt=HISTORY_START + datetime.timedelta(days=30 * HISTORY_PER_TICKER),
+        ).count() == (ticker_count)
+
+    for endpoint, _ in ENDPOINTS:
+        query_counts = [result["queries"] for result in results if result["endpoint"] == endpoint]
+        assert max(query_counts) <= query_counts[0], f"{endpoint} query count grows with tickers: {query_counts}"
@@ -0,0 +1,120 @@
+"""
+On disk layout of the training dataset, readable without Django. Every ticker has one .npy file per column, ordered by
+the time column that serves as its index, so training jobs memory map the columns and only page in what they touch:
+
+    manifest.json
+    tickers/<ticker>/<generation>/{time,open,high,low,close,volume}.npy
+
+Updating a ticker writes its columns to a new generation directory before switching the manifest to it. The replaced
+generation is listed as retired in the manifest and only removed by a later export once its retention ends, so a job
+that opened the dataset before the update can still map the columns it has not touched yet.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+DATASET_VERSION = 1
+TIME_COLUMN = "time"
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+COLUMN_DTYPES = {TIME_COLUMN: "datetime64[ms]", **{column: "float64" for column in PRICE_COLUMNS}}
+
+Columns = dict[str, np.ndarray]
+
+
+def to_datetime64(value: datetime.datetime) -> np.datetime64:
+    return np.datetime64(int(value.timestamp() * 1000), "ms")
+
+
+def empty_manifest() -> dict:
+    return {"version": DATASET_VERSION, "columns": COLUMN_DTYPES, "tickers": {}, "retired": []}
+
+
+def read_manifest(path: str) -> dict:
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return empty_manifest()
+    if manifest.get("version") != DATASET_VERSION:
+        raise ValueError(f"Dataset {path} has version {manifest.get('version')}, expected {DATASET_VERSION}")
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict):
+    manifest["updated_at"] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+    fd, temp_path = tempfile.mkstemp(dir=path, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, os.path.join(path, MANIFEST_NAME))
+
+
+def load_columns(path: str, entry: dict) -> Columns:
+    directory = os.path.join(path, entry["path"])
+    return {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r") for column in COLUMN_DTYPES}
+
+
+def slice_columns(columns: Columns, start: datetime.datetime, stop: datetime.datetime) -> tuple[Columns, Columns]:
+    """Splits columns into the rows before start and the rows from stop on, both still memory mapped."""
+    first, last = np.searchsorted(columns[TIME_COLUMN], [to_datetime64(start), to_datetime64(stop)])
+    return {column: values[:first] for column, values in columns.items()}, {
+        column: values[last:] for column, values in columns.items()
+    }
+
+
+def write_generation(path: str, ticker: str, generation: int, parts: list[Columns]) -> dict:
+    """
+    Writes the parts one after the other as a new generation of the ticker's columns, copying them straight into
+    the memory mapped files so only one part is read at a time. Returns the manifest entry of the generation.
+    """
+    relative_dir = os.path.join("tickers", quote(ticker, safe=""), str(generation))
+    directory = os.path.join(path, relative_dir)
+    if os.path.exists(directory):
+        # Left over by an export that stopped before updating the manifest
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    rows = sum(len(part[TIME_COLUMN]) for part in parts)
+    for column, dtype in COLUMN_DTYPES.items():
+        values = np.lib.format.open_memmap(os.path.join(directory, f"{column}.npy"), "w+", dtype=dtype, shape=(rows,))
+        offset = 0
+        for part in parts:
+            values[offset : offset + len(part[column])] = part[column]
+            offset += len(part[column])
+        values.flush()
+        del values
+
+    times = [part[TIME_COLUMN] for part in parts if len(part[TIME_COLUMN])]
+    return {
+        "path": relative_dir,
+        "generation": generation,
+        "rows": rows,
+        "first": str(times[0][0]) if times else None,
+        "last": str(times[-1][-1]) if times else None,
+    }
+
+
+class TrainingDataset:
+    """Exported dataset opened read only, every column is memory mapped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = read_manifest(path)
+
+    @property
+    def tickers(self) -> list[str]:
+        return list(self.manifest["tickers"])
+
+    def __getitem__(self, ticker: str) -> Columns:
+        return load_columns(self.path, self.manifest["tickers"][ticker])
+
+    def between(self, ticker: str, start: datetime.datetime, stop: datetime.datetime) -> Columns:
+        """Columns of the ticker's bars between start and stop, stop excluded."""
+        columns = self[ticker]
+        first, last = np.searchsorted(columns[TIME_COLUMN], [to_datetime64(start), to_datetime64(stop)])
+        return {column: values[first:last] for column, values in columns.items()}
@@ -8,6 +8,8 @@ urlpatterns = [
     path("register_new_ingestions", views.register_new_ingestions, name="register_new_ingestions"),
     path("start_next_ingestion", views.start_next_ingestion, name="start_next_ingestion"),
     path("tickers_relations/?P<str:ticker1>/?P<str:ticker2>", views.tickers_relations, name="tickers_relations"),
+    path("wait_for_ingestions", views.wait_for_ingestions, name="wait_for_ingestions"),
+    path("lease_ingestions", views.lease_ingestions, name="lease_ingestions"),
     path("update_ingestion_status", views.update_ingestion_status, name="update_ingestion_status"),
     path(
         "cleanup_ingestion_pending_status",
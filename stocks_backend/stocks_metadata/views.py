@@ -1,5 +1,4 @@
 import json
-import subprocess
 import datetime
 from django.http import (
     HttpRequest,
@@ -8,17 +7,24 @@ from django.http import (
     HttpResponseServerError,
     JsonResponse,
 )
-from django.db import transaction
-from django.db.models import Q, QuerySet
+from django.db import connection, transaction
+from django.db.models import F, Max, Q, QuerySet, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.core import serializers
 
-from stocks_backend.enums import Environments
+from stocks_backend.enums import Environments, IngestionDeployMode
 from stocks_backend.settings import (
     ENVIRONMENT,
     INFLUX_TOKEN,
     INFLUX_URL,
+    INGESTION_CAPACITY_LOCK_KEY,
+    INGESTION_DEPLOY_MODE,
+    INGESTION_GAP_PLANNER_ENABLED,
+    INGESTION_LEASE_MINUTES,
+    INGESTION_PAGE_CACHE_DIR,
+    INGESTION_PAGE_CACHE_VOLUME,
     INGESTION_STATUS_UPDATE_URL,
     LOCAL_DOCKER_NAME_DEFAULT,
     LOCAL_DOCKER_NETWORK_NAME,
@@ -27,17 +33,36 @@ from stocks_backend.settings import (
     LOCAL_INGESTION_BUCKET_SETTING_KEY,
     LOCAL_ORG_DEFAULT,
     LOCAL_ORG_SETTING_KEY,
+    MAX_INGESTION_LEASE_SIZE,
+    MAX_INGESTION_WAIT_SECONDS,
     MAX_PARALLEL_INGESTIONS,
     POLYGON_API_KEY,
+    STALE_INGESTION_TIMEOUT_MINUTES,
 )
 from stocks_backend.utils import get_module_logger
+from stocks_metadata.container_launcher import build_container_config, container_launcher
+from stocks_metadata.ingestion_planner import (
+    DEFAULT_INGESTION_START,
+    StoredCoverage,
+    Window,
+    get_stored_coverage_or_empty,
+    plan_ingestion_windows,
+)
+from stocks_metadata.pagination import paginated_response
+from stocks_metadata.settings_cache import app_settings_cache
+from stocks_metadata.queue_events import (
+    QueueEvent,
+    listen_ingestion_queue,
+    notify_ingestion_queue,
+    wait_for_ingestion_queue,
+)
 from stocks_metadata.models import (
-    AppSettings,
     IngestionMetadata,
     IngestionStatus,
     IngestionTimespan,
     StockIdx,
     StockIngestion,
+    StockIngestionArchive,
     Tickers,
 )
 
@@ -66,8 +91,7 @@ def tickers_relations(request: HttpRequest, ticker1: str, ticker2: str) -> HttpR
 @transaction.atomic()
 def tickers(request: HttpRequest) -> HttpResponse:
     if request.method == "GET":
-        data = StockIdx.objects.filter(deleted=False).values()
-        return JsonResponse({"data": list(data.values())}, status=200)
+        return paginated_response(request, StockIdx.objects.filter(deleted=False))
 
     elif request.method == "POST":
         name = request.POST.get("name")
@@ -97,26 +121,33 @@ def tickers(request: HttpRequest) -> HttpResponse:
 
 
 @require_GET
-@transaction.atomic()
-def list_ingestion_data(request) -> JsonResponse:
+def list_ingestion_data(request) -> HttpResponse:
     query = Q()
     if symbol := request.GET.get("symbol"):
-        query &= Q(symbol=symbol)
+        query &= Q(ticker_id=symbol)
     if status := request.GET.get("status_to_return"):
-        query &= Q(ingestion_status__in=status)
-    data = StockIngestion.objects.filter(query).order_by("created_at")
-    return JsonResponse(
-        {
-            "data": list(
-                data.values(
-                    "ticker__symbol",
-                    "metadata__end_ingestion_time",
-                    "ingestion_status",
-                    "metadata__start_ingestion_time",
-                )
-            )
-        },
-        status=200,
+        query &= Q(ingestion_status__in=status.split(","))
+    # Finished ingestions moved out by archive_ingestions are only read when asked for, under the same keys
+    if request.GET.get("archived", "").lower() == "true":
+        return paginated_response(
+            request,
+            StockIngestionArchive.objects.filter(query).annotate(
+                metadata__end_ingestion_time=F("end_ingestion_time"),
+                metadata__start_ingestion_time=F("start_ingestion_time"),
+            ),
+            "ticker__symbol",
+            "metadata__end_ingestion_time",
+            "ingestion_status",
+            "metadata__start_ingestion_time",
+        )
+
+    return paginated_response(
+        request,
+        StockIngestion.objects.filter(query),
+        "ticker__symbol",
+        "metadata__end_ingestion_time",
+        "ingestion_status",
+        "metadata__start_ingestion_time",
     )
 
 
@@ -132,56 +163,124 @@ def get_idle_ingestion_tickers() -> QuerySet[Tickers]:
 
 @transaction.atomic()
 def update_end_ingestion_time() -> QuerySet[Tickers]:
-    # Gets all symbols that are at least one day from last ingestion
-    tickers_in_process = StockIngestion.objects.filter(Q(ingestion_status=IngestionStatus.ON_QUEUE)).distinct()
+    # Moves the end of every queued ingestion up to now, in two UPDATEs whatever the number of queued ingestions
+    tickers_in_process = StockIngestion.objects.filter(Q(ingestion_status=IngestionStatus.ON_QUEUE))
     now_time = datetime.datetime.now(datetime.timezone.utc)
-    for s in tickers_in_process:
-        if s.metadata.end_ingestion_time < now_time:
-            s.metadata.end_ingestion_time = now_time
-            s.metadata.save()
+    IngestionMetadata.objects.filter(
+        id__in=tickers_in_process.filter(metadata__end_ingestion_time__lt=now_time).values("metadata_id")
+    ).update(end_ingestion_time=now_time)
+    tickers_in_process.filter(end_ingestion_time__lt=now_time).update(end_ingestion_time=now_time)
 
     return Tickers.objects.filter(Q(symbol__in=tickers_in_process.values("ticker__symbol")))
 
 
+def get_ticker_coverage(
+    last_end_times: dict[str, datetime.datetime | None], stop: datetime.datetime
+) -> dict[str, StoredCoverage]:
+    if not INGESTION_GAP_PLANNER_ENABLED:
+        return {}
+    return get_stored_coverage_or_empty(
+        last_end_times,
+        get_settings_value(LOCAL_INGESTION_BUCKET_SETTING_KEY) or LOCAL_INGESTION_BUCKET_DEFAULT,
+        get_settings_value(LOCAL_ORG_SETTING_KEY) or LOCAL_ORG_DEFAULT,
+        stop,
+    )
+
+
+def create_planned_ingestions(planned_windows: dict[str, list[Window]]) -> int:
+    """Creates the metadata and the queued ingestions of every planned window with two bulk inserts."""
+    symbols = [symbol for symbol, windows in planned_windows.items() for _ in windows]
+    metadata = IngestionMetadata.objects.bulk_create(
+        [
+            IngestionMetadata(
+                start_ingestion_time=start_time,
+                end_ingestion_time=end_time,
+                delta_category=IngestionTimespan.HOUR,
+                delta_multiplier=1,
+            )
+            for windows in planned_windows.values()
+            for start_time, end_time in windows
+        ]
+    )
+    StockIngestion.objects.bulk_create(
+        [
+            StockIngestion(
+                ticker_id=symbol,
+                ingestion_status=IngestionStatus.ON_QUEUE,
+                metadata=ingestion_metadata,
+                end_ingestion_time=ingestion_metadata.end_ingestion_time,
+            )
+            for symbol, ingestion_metadata in zip(symbols, metadata)
+        ]
+    )
+    if metadata:
+        notify_ingestion_queue(QueueEvent.ENQUEUED)
+    return len(metadata)
+
+
+def plan_ticker_ingestions(
+    last_end_times: dict[str, datetime.datetime | None], now: datetime.datetime
+) -> dict[str, list[Window]]:
+    """Plans the windows of many tickers with a constant number of queries, whatever the number of tickers."""
+    coverage = get_ticker_coverage(last_end_times, now)
+    symbols_with_gaps = [symbol for symbol, ticker_coverage in coverage.items() if ticker_coverage.gaps]
+    success_windows: dict[str, list[Window]] = {}
+    if symbols_with_gaps:
+        for symbol, start_time, end_time in StockIngestion.objects.filter(
+            ticker_id__in=symbols_with_gaps, ingestion_status=IngestionStatus.SUCCESS
+        ).values_list("ticker_id", "metadata__start_ingestion_time", "metadata__end_ingestion_time"):
+            success_windows.setdefault(symbol, []).append((start_time, end_time))
+        for symbol, start_time, end_time in StockIngestionArchive.objects.filter(
+            ticker_id__in=symbols_with_gaps, ingestion_status=IngestionStatus.SUCCESS
+        ).values_list("ticker_id", "start_ingestion_time", "end_ingestion_time"):
+            success_windows.setdefault(symbol, []).append((start_time, end_time))
+
+    return {
+        symbol: plan_ingestion_windows(
+            last_end_time or DEFAULT_INGESTION_START, now, coverage.get(symbol), success_windows.get(symbol)
+        )
+        for symbol, last_end_time in last_end_times.items()
+    }
+
+
 @transaction.atomic()
-def enqueue_new_ingestion(
-    ticker: Tickers, end_ingestion_time: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc)
-):
+def enqueue_new_ingestion(ticker: Tickers, end_ingestion_time: datetime.datetime | None = None):
+    end_ingestion_time = end_ingestion_time or datetime.datetime.now(tz=datetime.timezone.utc)
     last_success = (
         StockIngestion.objects.filter(Q(ticker=ticker))
         .filter(Q(ingestion_status=IngestionStatus.SUCCESS))
-        .order_by("-metadata__end_ingestion_time")
+        .order_by("-end_ingestion_time")
         .first()
     )
-    last_end_time = datetime.datetime(2023, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc)
-    if last_success:
-        last_end_time = last_success.metadata.end_ingestion_time
+    last_end_time = last_success.metadata.end_ingestion_time if last_success else None
+    windows = plan_ticker_ingestions({ticker.symbol: last_end_time}, end_ingestion_time)[ticker.symbol]
 
-    if (end_ingestion_time - last_end_time).days < 1:
+    if not windows:
         logger.info(f"Skipping symbol {ticker.symbol} because last_end_time is less than a day away")
+        return
 
-    StockIngestion.objects.create(
-        ticker=ticker,
-        ingestion_status=IngestionStatus.ON_QUEUE,
-        metadata=IngestionMetadata.objects.create(
-            start_ingestion_time=last_end_time,
-            end_ingestion_time=min(end_ingestion_time, last_end_time + datetime.timedelta(days=30)),
-            delta_category=IngestionTimespan.HOUR,
-            delta_multiplier=1,
-        ),
-    )
-    logger.info(f"Equeued new ingestion for symbol {ticker.symbol} with end_time or {last_end_time}")
+    create_planned_ingestions({ticker.symbol: windows})
+    logger.info(f"Equeued {len(windows)} new ingestions for symbol {ticker.symbol} starting at {windows[0][0]}")
 
 
 @transaction.atomic()
 def register_new_ingestions(request: HttpRequest | None) -> HttpResponse:
-    # Gets all symbols that have never been ingested before
-    idle_symbols = get_idle_ingestion_tickers()
-
-    for idle_symbol in idle_symbols:
-        enqueue_new_ingestion(idle_symbol)
+    # Gets the end of the last successful ingestion of every idle ticker in a single query
+    last_end_times = dict(
+        get_idle_ingestion_tickers()
+        .annotate(
+            last_success_end=Max(
+                "stockingestion__end_ingestion_time",
+                filter=Q(stockingestion__ingestion_status=IngestionStatus.SUCCESS),
+            )
+        )
+        .values_list("symbol", "last_success_end")
+    )
+    planned_windows = plan_ticker_ingestions(last_end_times, datetime.datetime.now(tz=datetime.timezone.utc))
+    enqueued = create_planned_ingestions(planned_windows)
 
-    return HttpResponse(f"Enqueued new ingestions for {len(idle_symbols)}", status=200)
+    logger.info(f"Enqueued {enqueued} new ingestions for {len(last_end_times)} idle tickers")
+    return HttpResponse(f"Enqueued new ingestions for {len(last_end_times)}", status=200)
 
 
 def get_ingestion_in_progress() -> QuerySet[StockIngestion]:
@@ -191,93 +290,163 @@ def get_ingestion_in_progress() -> QuerySet[StockIngestion]:
 
 
 def get_settings_value(key: str) -> str | None:
-    if value := AppSettings.objects.filter(key=key).first():
-        return value.value
-    else:
-        return None
+    return app_settings_cache.get(key)
+
+
+def get_ingestion_parameters(ingestion: StockIngestion) -> dict:
+    return {
+        "id": ingestion.id,
+        "ticker": ingestion.ticker.symbol,
+        "from_date": ingestion.metadata.start_ingestion_time.date().isoformat(),
+        "to_date": ingestion.metadata.end_ingestion_time.date().isoformat(),
+        "type": ingestion.metadata.delta_category,
+        "multiplier": ingestion.metadata.delta_multiplier,
+        "stocks_bucket": get_settings_value(LOCAL_INGESTION_BUCKET_SETTING_KEY) or LOCAL_INGESTION_BUCKET_DEFAULT,
+        "org": get_settings_value(LOCAL_ORG_SETTING_KEY) or LOCAL_ORG_DEFAULT,
+    }
 
 
 def deploy_ingestion(ingestion: StockIngestion):
     if ENVIRONMENT == Environments.LOCAL:
         logger.info("Starting local container for ingestion")
-
-        command = [
-            "docker",
-            "run",
-            "-d",
-            "--rm",
-            "-e",
-            f"TICKER={ingestion.ticker.symbol}",
-            "-e",
-            f"FROM_DATE={ingestion.metadata.start_ingestion_time.date().isoformat()}",
-            "-e",
-            f"TO_DATE={ingestion.metadata.end_ingestion_time.date().isoformat()}",
-            "-e",
-            f"TYPE={ingestion.metadata.delta_category}",
-            "-e",
-            f"INGESTION_ID={ingestion.id}",
-            "-e",
-            f"MULTIPLIER={ingestion.metadata.delta_multiplier}",
-            "-e",
-            f"BUCKET={get_settings_value(LOCAL_INGESTION_BUCKET_SETTING_KEY) or LOCAL_INGESTION_BUCKET_DEFAULT}",
-            "-e",
-            f"ORG={get_settings_value(LOCAL_ORG_SETTING_KEY) or LOCAL_ORG_DEFAULT}",
-            "-e",
-            f"INFLUX_TOKEN={INFLUX_TOKEN}",
-            "-e",
-            f"INFLUX_URL={INFLUX_URL}",
-            "-e",
-            f"POLYGON_API_KEY={POLYGON_API_KEY}",
-            "-e",
-            f"INGESTION_STATUS_UPDATE_URL={INGESTION_STATUS_UPDATE_URL}",
-            "-e",
-            f"ID={ingestion.id}",
-            "--network",
-            LOCAL_DOCKER_NETWORK_NAME,
+        parameters = get_ingestion_parameters(ingestion)
+        environment = {
+            "TICKER": parameters["ticker"],
+            "FROM_DATE": parameters["from_date"],
+            "TO_DATE": parameters["to_date"],
+            "TYPE": parameters["type"],
+            "INGESTION_ID": ingestion.id,
+            "MULTIPLIER": parameters["multiplier"],
+            "BUCKET": parameters["stocks_bucket"],
+            "ORG": parameters["org"],
+            "INFLUX_TOKEN": INFLUX_TOKEN,
+            "INFLUX_URL": INFLUX_URL,
+            "POLYGON_API_KEY": POLYGON_API_KEY,
+            "INGESTION_STATUS_UPDATE_URL": INGESTION_STATUS_UPDATE_URL,
+            "ID": ingestion.id,
+            "POLYGON_PAGE_CACHE_DIR": INGESTION_PAGE_CACHE_DIR,
+        }
+        config = build_container_config(
             get_settings_value(LOCAL_DOCKER_SETTINGS_KEY) or LOCAL_DOCKER_NAME_DEFAULT,
-        ]
-
-        subprocess.run(command)
-        logger.info("Started docker sub run")
+            LOCAL_DOCKER_NETWORK_NAME,
+            environment,
+            ingestion.id,
+            volumes={INGESTION_PAGE_CACHE_VOLUME: INGESTION_PAGE_CACHE_DIR},
+        )
+        # Launched by the container launcher threads once the claim commits
+        container_launcher.submit_on_commit(ingestion.id, config)
 
     else:
         raise NotImplementedError("Only local environment is supported for now")
 
 
+def lock_ingestion_capacity():
+    """Serializes capacity checks until the current transaction ends, so concurrent claims can not overshoot."""
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [INGESTION_CAPACITY_LOCK_KEY])
+
+
+def claim_ingestions(limit: int, max_in_progress: int | None = None) -> list[StockIngestion]:
+    """
+    Claims up to limit of the oldest queued ingestions, marking them as deploying with a lease, and must run inside
+    a transaction. Rows locked by a concurrent claim are skipped instead of waited on, so several orchestrators and
+    workers can claim side by side without getting the same ingestion. With max_in_progress, the claim never lets
+    more than that many ingestions run at once.
+    """
+    if max_in_progress is not None:
+        lock_ingestion_capacity()
+        limit = min(limit, max_in_progress - get_ingestion_in_progress().count())
+    if limit <= 0:
+        return []
+
+    claimed = list(
+        StockIngestion.objects.filter(ingestion_status=IngestionStatus.ON_QUEUE)
+        .select_related("ticker", "metadata")
+        .select_for_update(skip_locked=True, of=("self",))
+        .order_by("end_ingestion_time")[:limit]
+    )
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    lease_expires_at = now + datetime.timedelta(minutes=INGESTION_LEASE_MINUTES)
+    StockIngestion.objects.filter(id__in=[ingestion.id for ingestion in claimed]).update(
+        ingestion_status=IngestionStatus.DEPLOYING, ingestion_deployed_at=now, lease_expires_at=lease_expires_at
+    )
+    for ingestion in claimed:
+        ingestion.ingestion_status = IngestionStatus.DEPLOYING
+        ingestion.ingestion_deployed_at = now
+        ingestion.lease_expires_at = lease_expires_at
+    return claimed
+
+
 @require_GET
+@transaction.atomic()
 def start_next_ingestion(request: HttpRequest):
-    # Gets the oldest ingestion in the queue
-    if get_ingestion_in_progress().count() >= MAX_PARALLEL_INGESTIONS:
-        logger.info("Not starting ingestion because max parallel ingestion are already running")
-        return JsonResponse({"data": None, "reason": "Max parallel ingestions running"}, status=200)
+    if INGESTION_DEPLOY_MODE == IngestionDeployMode.WORKER:
+        return JsonResponse(
+            {"data": None, "reason": "Ingestions are leased by ingestion workers", "started": 0}, status=200
+        )
 
-    next_ingestion = (
-        StockIngestion.objects.filter(ingestion_status=IngestionStatus.ON_QUEUE)
-        .order_by("metadata__end_ingestion_time")
-        .first()
-    )
-    if next_ingestion:
+    try:
+        limit = int(request.GET.get("limit", 1))
+    except ValueError:
+        return JsonResponse({"data": None, "reason": "limit must be an integer", "started": 0}, status=400)
+
+    # Starts the oldest ingestions in the queue, as many as the free ingestion slots allow
+    next_ingestions = claim_ingestions(limit, max_in_progress=MAX_PARALLEL_INGESTIONS)
+    if not next_ingestions:
+        logger.info("No ingestion started, either the queue is empty or max parallel ingestions are running")
+        return JsonResponse({"data": None, "reason": "No ingestion available to start", "started": 0}, status=200)
+
+    for next_ingestion in next_ingestions:
         logger.info(
             f"Starting ingestion for {next_ingestion.ticker.symbol} with start time {next_ingestion.metadata.start_ingestion_time} and end time {next_ingestion.metadata.end_ingestion_time}"
         )
-        next_ingestion.ingestion_status = IngestionStatus.DEPLOYING
-        next_ingestion.save()
         deploy_ingestion(next_ingestion)
 
-        return JsonResponse(
-            {
-                "data": serializers.serialize(
-                    "json",
-                    [
-                        next_ingestion,
-                    ],
-                )
-            },
-            status=200,
-        )
+    return JsonResponse(
+        {"data": serializers.serialize("json", next_ingestions), "started": len(next_ingestions)}, status=200
+    )
 
-    else:
-        return JsonResponse({"data": None, "reason": "No ingestions in queue"}, status=200)
+
+def has_startable_ingestions() -> bool:
+    # Workers lease ingestions on their own, there is never anything for the orchestrator to start
+    if INGESTION_DEPLOY_MODE == IngestionDeployMode.WORKER:
+        return False
+    return (
+        StockIngestion.objects.filter(ingestion_status=IngestionStatus.ON_QUEUE).exists()
+        and get_ingestion_in_progress().count() < MAX_PARALLEL_INGESTIONS
+    )
+
+
+@require_GET
+def wait_for_ingestions(request: HttpRequest) -> JsonResponse:
+    """
+    Long poll for the orchestrator. Returns right away when queued ingestions can be started, otherwise waits
+    for an enqueue or a finished ingestion to be notified, for at most timeout seconds.
+    """
+    try:
+        timeout = min(float(request.GET.get("timeout", MAX_INGESTION_WAIT_SECONDS)), MAX_INGESTION_WAIT_SECONDS)
+    except ValueError:
+        return JsonResponse({"data": None, "reason": "timeout must be a number"}, status=400)
+
+    with listen_ingestion_queue():
+        ready = has_startable_ingestions() or wait_for_ingestion_queue(max(timeout, 0))
+    return JsonResponse({"data": ready}, status=200)
+
+
+@require_GET
+@transaction.atomic()
+def lease_ingestions(request: HttpRequest) -> JsonResponse:
+    """Hands the oldest queued ingestions to a long lived ingestion worker, marking them as deploying."""
+    try:
+        limit = min(int(request.GET.get("limit", 1)), MAX_INGESTION_LEASE_SIZE)
+    except ValueError:
+        return JsonResponse({"data": None, "reason": "limit must be an integer"}, status=400)
+
+    leased = claim_ingestions(limit)
+    logger.info(f"Leased {len(leased)} ingestions to worker")
+    return JsonResponse({"data": [get_ingestion_parameters(ingestion) for ingestion in leased]}, status=200)
 
 
 @csrf_exempt
@@ -286,12 +455,27 @@ def update_ingestion_status(request: HttpRequest):
     data = json.loads(request.body)
     id = data.get("id")
     status = IngestionStatus(data.get("ingestion_status"))
-    stock_ingestion = StockIngestion.objects.get(id=id)
+    stock_ingestion = StockIngestion.objects.select_for_update().get(id=id)
+    if stock_ingestion.ingestion_status in (IngestionStatus.SUCCESS, IngestionStatus.FAILURE):
+        # Most likely failed by the cleanup once its lease expired, a late update must not bring it back
+        logger.warning(f"Rejected {status} update of ingestion {id}, already {stock_ingestion.ingestion_status}")
+        return HttpResponse(f"Ingestion {id} already finished", status=409)
     stock_ingestion.ingestion_status = status
     if status == IngestionStatus.FAILURE or status == IngestionStatus.SUCCESS:
         stock_ingestion.ingestion_finished_at = datetime.datetime.now(tz=datetime.timezone.utc)
+        stock_ingestion.lease_expires_at = None
+        # Frees an ingestion slot, the orchestrator can start the next one right away
+        notify_ingestion_queue(QueueEvent.FINISHED)
+    else:
+        # Every status update of a running ingestion renews its lease
+        stock_ingestion.lease_expires_at = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
+            minutes=INGESTION_LEASE_MINUTES
+        )
     if status == IngestionStatus.IN_PROGRESS:
         stock_ingestion.ingestion_started_at = datetime.datetime.now(tz=datetime.timezone.utc)
+    if "retries" in data:
+        stock_ingestion.fetch_retries = int(data["retries"])
+        stock_ingestion.fetch_retry_wait_seconds = float(data.get("retry_wait_seconds") or 0)
     stock_ingestion.save()
 
     logger.info(f"Update ingestion status for id {stock_ingestion.id}")
@@ -301,17 +485,27 @@ def update_ingestion_status(request: HttpRequest):
 @require_GET
 @transaction.atomic()
 def cleanup_ingestion_pending_status(request: HttpRequest) -> HttpResponse:
-    pending_ingestion = StockIngestion.objects.filter(
-        Q(ingestion_status=IngestionStatus.DEPLOYING) | Q(ingestion_status=IngestionStatus.IN_PROGRESS)
-    )
-    cleanup_count = 0
-    for ingestion in pending_ingestion:
-        last_update = max(
-            ingestion.ingestion_deployed_at or dummy_old_date, ingestion.ingestion_started_at or dummy_old_date
+    # Marks every deploying/in progress ingestion whose lease expired as failed, in a single UPDATE. Ingestions
+    # claimed before leases existed fall back to the time of their last status update.
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    cleanup_count = (
+        get_ingestion_in_progress()
+        .alias(
+            last_update=Greatest(
+                Coalesce("ingestion_deployed_at", Value(dummy_old_date)),
+                Coalesce("ingestion_started_at", Value(dummy_old_date)),
+            )
+        )
+        .filter(
+            Q(lease_expires_at__lt=now)
+            | Q(
+                lease_expires_at__isnull=True,
+                last_update__lt=now - datetime.timedelta(minutes=STALE_INGESTION_TIMEOUT_MINUTES),
+            )
         )
-        if datetime.datetime.now(tz=datetime.timezone.utc) - last_update > datetime.timedelta(minutes=20):
-            ingestion.ingestion_status = IngestionStatus.FAILURE
-            ingestion.save()
-            cleanup_count += 1
+        .update(ingestion_status=IngestionStatus.FAILURE, ingestion_finished_at=now, lease_expires_at=None)
+    )
+    if cleanup_count:
+        notify_ingestion_queue(QueueEvent.FINISHED)
 
     return HttpResponse(f"Cleaned up {cleanup_count} stale ingestion", status=200)
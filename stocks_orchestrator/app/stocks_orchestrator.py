@@ -1,6 +1,5 @@
 import time
 import logging
-from urllib import response
 import requests
 import os
 
@@ -20,9 +19,18 @@ def get_module_logger(mod_name):
 
 logger = get_module_logger(__file__)
 
+# How many ingestions a single start_next_ingestion call may start
+INGESTION_BATCH_SIZE = int(os.environ.get("INGESTION_BATCH_SIZE", "5"))
+# Long poll timeout of wait_for_ingestions, the backend caps it at 20 seconds
+WAIT_TIMEOUT_SECONDS = float(os.environ.get("WAIT_TIMEOUT_SECONDS", "20"))
+MIN_SLEEP_SECONDS = 2
+MAX_SLEEP_SECONDS = 30
+
+session = requests.Session()
+
 
 def register_new_ingestions():
-    response = requests.get(os.environ.get("REGISTER_NEW_INGESTIONS_URL", ""))
+    response = session.get(os.environ.get("REGISTER_NEW_INGESTIONS_URL", ""))
     try:
         response.raise_for_status()
     except Exception as e:
@@ -30,29 +38,51 @@ def register_new_ingestions():
 
 
 def cleanup_stale_ingestion():
-    response = requests.get(os.environ.get("CLEANUP_INGESTION_PENDING_STATUS", ""))
+    response = session.get(os.environ.get("CLEANUP_INGESTION_PENDING_STATUS", ""))
     try:
         response.raise_for_status()
     except Exception as e:
         logger.error(e)
 
 
-def start_next_ingestion():
-    response = requests.get(os.environ.get("NEXT_INGESTION_URL", ""))
+def start_next_ingestion() -> int:
+    """Starts as many queued ingestions as the backend has free slots for, in one call."""
+    response = session.get(os.environ.get("NEXT_INGESTION_URL", ""), params={"limit": INGESTION_BATCH_SIZE})
     try:
         response.raise_for_status()
     except Exception as e:
         logger.error(e)
+        return 0
 
-    if response.json()["data"]:
-        logger.info("New ingestion started.")
-        start_next_ingestion()
+    started = response.json().get("started", 0)
+    if started:
+        logger.info(f"{started} new ingestions started.")
     else:
         logger.info("No ingestion started.")
+    return started
+
+
+def wait_for_ingestions(sleep_seconds: float):
+    """
+    Blocks until the backend notifies that ingestions can be started, e.g. one finished or new ones were
+    queued. Falls back to sleeping when the long poll url is not configured or fails.
+    """
+    url = os.environ.get("WAIT_FOR_INGESTIONS_URL")
+    if not url:
+        logger.info(f"Sleeping for {sleep_seconds} seconds before next loop")
+        time.sleep(sleep_seconds)
         return
 
+    try:
+        response = session.get(url, params={"timeout": WAIT_TIMEOUT_SECONDS}, timeout=WAIT_TIMEOUT_SECONDS + 10)
+        response.raise_for_status()
+    except Exception as e:
+        logger.error(e)
+        time.sleep(sleep_seconds)
+
 
 if __name__ == "__main__":
+    sleep_seconds = MIN_SLEEP_SECONDS
     while True:
         try:
             logger.info("Cleaning up stale ingestion")
@@ -62,11 +92,12 @@ if __name__ == "__main__":
             register_new_ingestions()
 
             logger.info("Checking for new ingestions.")
-            start_next_ingestion()
+            started = start_next_ingestion()
 
-            logger.info("Sleeping for 10 seconds before next loop")
-            time.sleep(2)
+            # Backs off while the queue is idle and loops right away again once ingestions start
+            sleep_seconds = MIN_SLEEP_SECONDS if started else min(sleep_seconds * 2, MAX_SLEEP_SECONDS)
+            wait_for_ingestions(sleep_seconds)
 
         except Exception as e:
             logger.error(e)
-            time.sleep(2)
+            time.sleep(MIN_SLEEP_SECONDS)